@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Times the main configuration paths in dry-run mode against synthetic fake-root hosts.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from src.logger import logger, setup_logger
+from src.tracing import tracer
+from src.transport import LocalTransport
+from src.preconditions import SystemPreconditions
+from src.system_configurator import SystemConfigurator
+from benchmarks.synthetic_host import build_host, stub_bin_dir
+
+SCHEMA_VERSION = 1
+DEFAULT_SCENARIOS = [(1, 10), (1, 100), (2, 50), (4, 100), (4, 500), (8, 100), (8, 500)]
+SETTINGS_FILE = 'config/settings.json'
+
+
+def _time(function, setup=None, repeat=5):
+    """Returns per-run durations in seconds; setup() output is passed to function() and not timed."""
+    durations = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        tracer.reset()
+        start = time.perf_counter()
+        function(argument)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_scenario(root, repeat):
+    """Times each code path against one synthetic host and returns {path: durations}."""
+    transport = LocalTransport(root=root, bin_dirs=[stub_bin_dir(root)])
+
+    def preconditions(refresh=False):
+        return SystemPreconditions(SETTINGS_FILE, refresh_hardware=refresh, transport=transport)
+
+    def configurator():
+        return SystemConfigurator(dry_run=True, settings_file=SETTINGS_FILE, transport=transport)
+
+    def planned():
+        instance = configurator()
+        hardware_info, _ = instance.preconditions.check()
+        return instance, instance.preconditions.compare_states(), hardware_info
+
+    # The discovery dumps are stored once per boot; write them up front so no timed run pays for it
+    preconditions(refresh=True).check()
+    return {
+        'check_cold': _time(lambda p: p.check(), lambda: preconditions(refresh=True), repeat),
+        'check': _time(lambda p: p.check(), preconditions, repeat),
+        'compare_states': _time(lambda p: p.compare_states(), preconditions, repeat),
+        'prepare_commands': _time(lambda args: args[0].prepare_commands(args[1], args[2]), planned, repeat),
+        'configure_system': _time(lambda c: c.configure_system(), configurator, repeat),
+    }
+
+
+def summarize(gpus, pci_functions, path, durations):
+    return {
+        'gpus': gpus,
+        'pci_functions': pci_functions,
+        'path': path,
+        'runs': len(durations),
+        'min_s': min(durations),
+        'median_s': statistics.median(durations),
+        'mean_s': statistics.mean(durations),
+        'max_s': max(durations),
+    }
+
+
+def run(scenarios, repeat):
+    results = []
+    for gpus, pci_functions in scenarios:
+        with tempfile.TemporaryDirectory(prefix='gpu-passthrough-bench-') as root:
+            build_host(root, gpus=gpus, pci_functions=pci_functions)
+            # Keeps the log file and discovery dump artifacts out of the repository's logs/
+            setup_logger(os.path.join(root, 'logs', 'gpu_passthrough.log'), console=False)
+            for path, durations in bench_scenario(root, repeat).items():
+                result = summarize(gpus, pci_functions, path, durations)
+                results.append(result)
+                print(f"gpus={gpus:<2} functions={pci_functions:<4} {path:<17} "
+                      f"median {result['median_s'] * 1000:8.2f} ms  min {result['min_s'] * 1000:8.2f} ms",
+                      file=sys.stderr)
+    return {
+        'schema': SCHEMA_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Returns a list of regression descriptions where the median slowed down by more than threshold."""
+    key = lambda result: (result['gpus'], result['pci_functions'], result['path'])
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = previous.get(key(result))
+        if before and before['median_s'] > 0:
+            ratio = result['median_s'] / before['median_s']
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"gpus={result['gpus']} functions={result['pci_functions']} {result['path']}: "
+                    f"{before['median_s'] * 1000:.2f} ms -> {result['median_s'] * 1000:.2f} ms ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def parse_scenario(value):
+    gpus, pci_functions = value.split(':')
+    return int(gpus), int(pci_functions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark configuration paths on synthetic hosts.")
+    parser.add_argument('--scenario', action='append', type=parse_scenario, metavar='GPUS:FUNCTIONS',
+                        help="Host size to benchmark (repeatable). Defaults to a 1-8 GPU, 10-500 function matrix.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per path.")
+    parser.add_argument('--output', help="Write machine-readable results to this JSON file.")
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help="Fail if medians regress against a baseline.")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed median slowdown before a path counts as regressed (fraction).")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.CRITICAL)
+    report = run(args.scenario or DEFAULT_SCENARIOS, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+import os
+import stat
+import struct
+import uuid
+
+GPU_MODELS = {
+    '10de': ('NVIDIA Corporation', '2204', '1aef'),
+    '1002': ('Advanced Micro Devices, Inc. [AMD/ATI]', '73bf', 'ab28'),
+    '8086': ('Intel Corporation', '56a0', '4f90'),
+}
+CPU_MODELS = {
+    'amd': ('AuthenticAMD', 'AMD EPYC 7543 32-Core Processor'),
+    'intel': ('GenuineIntel', 'Intel(R) Xeon(R) Gold 6338 CPU @ 2.00GHz'),
+}
+CLASS_NAMES = {
+    '0300': 'VGA compatible controller',
+    '0403': 'Audio device',
+    '0600': 'Host bridge',
+    '0604': 'PCI bridge',
+    '0200': 'Ethernet controller',
+    '0108': 'Non-Volatile memory controller',
+}
+KERNELS = ['6.5.13-6-pve', '6.8.4-2-pve', '6.8.12-4-pve']
+FILLER_DEVICES = [('0604', '1022', '1483'), ('0200', '8086', '1521'), ('0108', '144d', 'a80a')]
+DEVICE_NAMES = {
+    ('10de', '2204'): 'GA102 [GeForce RTX 3090]',
+    ('10de', '1aef'): 'GA102 High Definition Audio Controller',
+    ('1002', '73bf'): 'Navi 21 [Radeon RX 6800/6800 XT / 6900 XT]',
+    ('1002', 'ab28'): 'Navi 21/23 HDMI/DP Audio Controller',
+    ('8086', '56a0'): 'DG2 [Arc A770]',
+    ('8086', '4f90'): 'DG2 Audio Controller',
+    ('1022', '1480'): 'Starship/Matisse Root Complex',
+    ('1022', '1483'): 'Starship/Matisse GPP Bridge',
+    ('8086', '1521'): 'I350 Gigabit Network Connection',
+    ('144d', 'a80a'): 'NVMe SSD Controller PM9A1/PM9A3/980PRO',
+}
+DRIVERS = {'0300': 'vfio-pci', '0403': 'vfio-pci', '0604': 'pcieport', '0200': 'igb', '0108': 'nvme'}
+VECTORS = {'0300': ('msix', 4), '0403': ('msi', 1)}
+VENDOR_NAMES = {
+    '10de': 'NVIDIA Corporation',
+    '1002': 'Advanced Micro Devices, Inc. [AMD/ATI]',
+    '1022': 'Advanced Micro Devices, Inc. [AMD]',
+    '8086': 'Intel Corporation',
+    '144d': 'Samsung Electronics Co Ltd',
+}
+
+
+def _write(root, path, content, mode=None):
+    full_path = os.path.join(root, path.lstrip('/'))
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+        f.write(content)
+    if mode is not None:
+        os.chmod(full_path, mode)
+
+
+def _stub(root, name, body):
+    _write(root, f'/stub-bin/{name}', f"#!/bin/sh\n{body}\n", stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP)
+
+
+def pci_ids(filler_vendors=1000, devices_per_vendor=12):
+    """Returns a pci.ids database with the synthetic devices plus filler vendors, about the real file's size."""
+    vendors = {vendor: [(device, DEVICE_NAMES[(v, device)]) for v, device in sorted(DEVICE_NAMES) if v == vendor]
+               for vendor in VENDOR_NAMES}
+    names = dict(VENDOR_NAMES)
+    for index in range(filler_vendors):
+        vendor = f'{0x2000 + index:04x}'
+        names[vendor] = f'Synthetic Vendor {index} Corporation'
+        vendors[vendor] = [(f'{device:04x}', f'Synthetic Controller {device} [Model {index}-{device}]')
+                           for device in range(devices_per_vendor)]
+    lines = ['# Synthetic PCI ID list', '']
+    for vendor in sorted(vendors):
+        lines.append(f'{vendor}  {names[vendor]}')
+        for device, name in vendors[vendor]:
+            lines.append(f'\t{device}  {name}')
+            lines.append(f'\t\t{vendor} 0001  {name} (reference board)')
+    lines += ['', 'C 03  Display controller', '\t00  VGA compatible controller']
+    return '\n'.join(lines) + '\n'
+
+
+def pci_layout(gpus, pci_functions, gpu_vendor='10de'):
+    """Returns (bdf, class, vendor, device, iommu_group) tuples for a synthetic host."""
+    devices = [('0000:00:00.0', '0600', '1022', '1480', 0)]
+    for index in range(gpus):
+        bus = index + 1
+        _, vga_device, audio_device = GPU_MODELS[gpu_vendor]
+        devices.append((f'0000:{bus:02x}:00.0', '0300', gpu_vendor, vga_device, bus))
+        devices.append((f'0000:{bus:02x}:00.1', '0403', gpu_vendor, audio_device, bus))
+
+    filler = 0
+    while len(devices) < pci_functions:
+        pci_class, vendor, device = FILLER_DEVICES[filler % len(FILLER_DEVICES)]
+        bus = 0x40 + filler // 8
+        function = filler % 8
+        devices.append((f'0000:{bus:02x}:00.{function}', pci_class, vendor, device, 1000 + filler // 8))
+        filler += 1
+    return devices
+
+
+def pci_config(vendor, device, pci_class):
+    """Returns a 256-byte configuration space with power management, MSI and MSI-X capabilities."""
+    config = bytearray(256)
+    config[0:4] = int(vendor, 16).to_bytes(2, 'little') + int(device, 16).to_bytes(2, 'little')
+    config[0x06] = 0x10
+    config[0x0a:0x0c] = int(pci_class, 16).to_bytes(2, 'little')
+    config[0x34] = 0x60
+    config[0x60:0x62] = bytes([0x01, 0x68])
+    config[0x68:0x6a] = bytes([0x05, 0x78])
+    config[0x78:0x7a] = bytes([0x10, 0xb0])
+    config[0xb0:0xb2] = bytes([0x11, 0x00])
+    return bytes(config)
+
+
+EFI_GLOBAL_GUID = '8be4df61-93ca-11d2-aa0d-00e098032b8c'
+# bootloader -> (Boot0001 description, loader path); grub-bios hosts have no /sys/firmware/efi
+EFI_LOADERS = {
+    'systemd-boot': ('Linux Boot Manager', r'\EFI\systemd\systemd-bootx64.efi'),
+    'grub-uefi': ('proxmox', r'\EFI\proxmox\grubx64.efi'),
+    'grub-uefi-secure': ('proxmox', r'\EFI\proxmox\shimx64.efi'),
+}
+
+
+def load_option(description, path):
+    """Returns an EFI_LOAD_OPTION with a hard drive node followed by a file path node."""
+    file_path = path.encode('utf-16-le') + b'\0\0'
+    device_path = (struct.pack('<BBH', 4, 1, 42) + b'\0' * 38
+                   + struct.pack('<BBH', 4, 4, 4 + len(file_path)) + file_path
+                   + struct.pack('<BBH', 0x7f, 0xff, 4))
+    return struct.pack('<IH', 1, len(device_path)) + description.encode('utf-16-le') + b'\0\0' + device_path
+
+
+def cpu_layout(numa_nodes, cores_per_node, threads_per_core):
+    """Returns {node: [(cpu, siblings), ...]}, numbering SMT siblings after all first threads like Linux does."""
+    total_cores = numa_nodes * cores_per_node
+    layout = {}
+    for core in range(total_cores):
+        siblings = [core + thread * total_cores for thread in range(threads_per_core)]
+        layout.setdefault(core // cores_per_node, []).extend((cpu, siblings) for cpu in siblings)
+    return layout
+
+
+def _cpulist(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{first}-{last}' if last != first else f'{first}' for first, last in ranges)
+
+
+def build_host(root, gpus=1, pci_functions=10, gpu_vendor='10de', cpu_vendor='amd', numa_nodes=2,
+               cores_per_node=8, threads_per_core=2, memory_mib_per_node=65536, bootloader='grub-bios'):
+    """Creates a fake host tree (sysfs, procfs, /etc) plus stub binaries under root.
+
+    GPU n sits on NUMA node n % numa_nodes; every other device is on node 0.
+    """
+    pci_functions = max(pci_functions, 2 * gpus + 1)
+    devices = pci_layout(gpus, pci_functions, gpu_vendor)
+
+    cpus = cpu_layout(numa_nodes, cores_per_node, threads_per_core)
+    node_cpus = {node: _cpulist(cpu for cpu, _ in entries) for node, entries in cpus.items()}
+    for node, entries in cpus.items():
+        _write(root, f'/sys/devices/system/node/node{node}/cpulist', f'{node_cpus[node]}\n')
+        _write(root, f'/sys/devices/system/node/node{node}/meminfo',
+               f'Node {node} MemTotal:       {memory_mib_per_node * 1024} kB\n')
+        for cpu, siblings in entries:
+            _write(root, f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list', f'{_cpulist(siblings)}\n')
+    all_cpus = sorted(cpu for entries in cpus.values() for cpu, _ in entries)
+    _write(root, '/sys/devices/system/cpu/online', f'{_cpulist(all_cpus)}\n')
+
+    gpu_nodes = {f'0000:{index + 1:02x}': index % numa_nodes for index in range(gpus)}
+    lspci_lines = []
+    next_irq = 100
+    for bdf, pci_class, vendor, device, group in devices:
+        device_dir = f'/sys/bus/pci/devices/{bdf}'
+        node = gpu_nodes.get(bdf.rsplit(':', 1)[0], 0)
+        _write(root, f'{device_dir}/numa_node', f'{node}\n')
+        _write(root, f'{device_dir}/local_cpulist', f'{node_cpus[node]}\n')
+        _write(root, f'{device_dir}/vendor', f'0x{vendor}\n')
+        _write(root, f'{device_dir}/device', f'0x{device}\n')
+        _write(root, f'{device_dir}/class', f'0x{pci_class}00\n')
+        _write(root, f'{device_dir}/config', pci_config(vendor, device, pci_class))
+        driver = f"DRIVER={DRIVERS[pci_class]}\n" if pci_class in DRIVERS else ''
+        _write(root, f'{device_dir}/uevent', f"{driver}PCI_SLOT_NAME={bdf}\n")
+        _write(root, f'{device_dir}/current_link_speed', '16.0 GT/s PCIe\n')
+        _write(root, f'{device_dir}/max_link_speed', '16.0 GT/s PCIe\n')
+        _write(root, f'{device_dir}/current_link_width', '16\n')
+        _write(root, f'{device_dir}/max_link_width', '16\n')
+        if pci_class in VECTORS:
+            # Vectors as vfio-pci allocates them while the VM runs, with the default all-CPU affinity
+            kind, count = VECTORS[pci_class]
+            for irq in range(next_irq, next_irq + count):
+                _write(root, f'{device_dir}/msi_irqs/{irq}', f'{kind}\n')
+                _write(root, f'/proc/irq/{irq}/smp_affinity_list', f'{_cpulist(all_cpus)}\n')
+                _write(root, f'/proc/irq/{irq}/smp_affinity', f'{sum(1 << cpu for cpu in all_cpus):x}\n')
+            next_irq += count
+        os.makedirs(os.path.join(root, f'sys/kernel/iommu_groups/{group}/devices/{bdf}'), exist_ok=True)
+        lspci_lines.append(
+            f"{bdf[5:]} {CLASS_NAMES.get(pci_class, 'Device')} [{pci_class}]: "
+            f"{VENDOR_NAMES.get(vendor, 'Vendor')} {DEVICE_NAMES.get((vendor, device), f'Device {device}')} "
+            f"[{vendor}:{device}]"
+        )
+
+    vendor_id, model_name = CPU_MODELS[cpu_vendor]
+    cpuinfo = ''.join(
+        f"processor\t: {cpu}\nvendor_id\t: {vendor_id}\nmodel name\t: {model_name}\n"
+        f"flags\t\t: fpu vme de pse tsc msr pae mce cx8 apic sep pdpe1gb rdtscp lm\n\n" for cpu in all_cpus
+    )
+    _write(root, '/proc/cpuinfo', cpuinfo)
+    _write(root, '/proc/modules', 'kvm_amd 155648 0 - Live 0x0\nkvm 1105920 1 kvm_amd, Live 0x0\n')
+    _write(root, '/proc/sys/kernel/random/boot_id', f'{uuid.uuid4()}\n')
+    _write(root, '/sys/class/dmi/id/board_vendor', 'Supermicro\n')
+    _write(root, '/sys/class/dmi/id/board_name', 'H12SSL-i\n')
+    _write(root, '/sys/class/dmi/id/board_version', '1.02\n')
+
+    for version in KERNELS:
+        os.makedirs(os.path.join(root, f'lib/modules/{version}/kernel'), exist_ok=True)
+        _write(root, f'/boot/vmlinuz-{version}', 'synthetic kernel image\n')
+        _write(root, f'/boot/initrd.img-{version}', 'synthetic initramfs\n')
+    if bootloader in EFI_LOADERS:
+        efivars = '/sys/firmware/efi/efivars'
+        _write(root, f'{efivars}/BootCurrent-{EFI_GLOBAL_GUID}', b'\x06\0\0\0' + struct.pack('<H', 1))
+        _write(root, f'{efivars}/Boot0001-{EFI_GLOBAL_GUID}', b'\x07\0\0\0' + load_option(*EFI_LOADERS[bootloader]))
+    if bootloader == 'systemd-boot':
+        _write(root, '/etc/kernel/cmdline', 'root=ZFS=rpool/ROOT/pve-1 boot=zfs\n')
+    _write(root, '/usr/share/misc/pci.ids', pci_ids())
+    _write(root, '/etc/default/grub', 'GRUB_DEFAULT=0\nGRUB_TIMEOUT=5\nGRUB_CMDLINE_LINUX_DEFAULT="quiet"\n')
+    _write(root, '/etc/modules', '# /etc/modules: kernel modules to load at boot time.\n')
+    _write(root, '/etc/modprobe.d/pve-blacklist.conf', 'blacklist nvidiafb\n')
+    os.makedirs(os.path.join(root, 'etc/pve'), exist_ok=True)
+    os.makedirs(os.path.join(root, 'var/cache'), exist_ok=True)
+
+    _write(root, '/stub-data/lspci', '\n'.join(lspci_lines) + '\n')
+    _write(root, '/stub-data/lscpu', f"Architecture: x86_64\nVendor ID: {vendor_id}\nModel name: {model_name}\n")
+    _write(root, '/stub-data/dmesg', '[    0.512345] AMD-Vi: IOMMU performance counters supported\n')
+    data = os.path.join(root, 'stub-data')
+    _stub(root, 'lspci', f'cat "{data}/lspci"')
+    _stub(root, 'lscpu', f'cat "{data}/lscpu"')
+    _stub(root, 'dmesg', f'cat "{data}/dmesg"')
+    _stub(root, 'id', 'echo 0')
+    return root
+
+
+def stub_bin_dir(root):
+    return os.path.join(root, 'stub-bin')
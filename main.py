@@ -3,20 +3,179 @@
 # Date: 2024-01-01
 # Description: A script to setup Proxmox host to execute GPU passthrough
 
+import argparse
+import json
+import signal
+import sys
 from src.system_configurator import SystemConfigurator
+from src.fleet import FleetRunner, DEFAULT_CONCURRENCY
+from src.command_executor import DEFAULT_COMMAND_TIMEOUT
+from src.numa_layout import DEFAULT_RESERVED_CORES
 from src.preconditions import ConfigurationError
-from src.logger import logger
+from src.logger import logger, setup_logger, DEFAULT_LOG_FILE
+from src.tracing import tracer
+from src.check_plan import CheckPlan
+from src.drift_watcher import DriftWatcher, DEFAULT_DEBOUNCE
+from src.plan_artifact import PlanArtifact
+
+def parse_args():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(description="Setup a Proxmox host for GPU passthrough.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Log the commands that would be executed without applying them.")
+    parser.add_argument('--refresh-hardware', action='store_true',
+                        help="Ignore the cached hardware snapshot and rediscover hardware.")
+    parser.add_argument('--hosts', default='',
+                        help="Comma-separated list of hosts to configure over SSH instead of the local host.")
+    parser.add_argument('--hosts-file',
+                        help="File with one host per line to configure over SSH.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of hosts configured at the same time.")
+    parser.add_argument('--trace', metavar='OUT_JSON',
+                        help="Write a Chrome/Perfetto trace of every probe, check and command to this file.")
+    parser.add_argument('--command-timeout', type=float, default=DEFAULT_COMMAND_TIMEOUT,
+                        help="Seconds before a single remediation command is killed.")
+    parser.add_argument('--total-timeout', type=float,
+                        help="Seconds budget for all remediation commands of a run (per host).")
+    parser.add_argument('--save-plan', metavar='OUT_JSON',
+                        help="Save the planned discrepancies, edits and steps as a plan file for this hardware class.")
+    parser.add_argument('--plan', metavar='PLAN_JSON',
+                        help="Apply a saved plan after verifying the hardware class, skipping discovery and planning.")
+    parser.add_argument('--vm-memory', type=int, metavar='MIB',
+                        help="Plan one NUMA-local, hugepage-backed VM of this size per passthrough GPU and add "
+                             "the hugepage kernel parameters.")
+    parser.add_argument('--vm-cores', type=int, metavar='N',
+                        help="With --vm-memory, pin at most N physical cores (all their SMT threads) per VM.")
+    parser.add_argument('--vm-reserved-cores', type=int, default=DEFAULT_RESERVED_CORES, metavar='N',
+                        help="With --vm-memory, physical cores per NUMA node left to the host.")
+    parser.add_argument('--hugepage-size', choices=['auto', '2M', '1G'], default='auto',
+                        help="With --vm-memory, the hugepage size (auto uses 1G pages when the CPU supports them).")
+    parser.add_argument('--vm-config', metavar='OUT',
+                        help="With --vm-memory, write the Proxmox VM settings here instead of logging them.")
+    parser.add_argument('--audit', nargs='?', const='-', metavar='OUT_JSON',
+                        help="After the reboot, audit the passthrough GPUs (driver, PCIe link, MSI/MSI-X, IRQ "
+                             "affinity) and write a JSON report here (stdout by default); exits 2 on problems.")
+    parser.add_argument('--fix-irq-affinity', action='store_true',
+                        help="With --audit, restrict the GPUs' IRQs to the CPUs of their NUMA node.")
+    parser.add_argument('--rollback-last', action='store_true',
+                        help="Restore every file changed by the most recent run and exit.")
+    parser.add_argument('--watch', action='store_true',
+                        help="Watch /etc/default/grub, /etc/modules and /etc/modprobe.d/ and report drift from "
+                             "the desired state as JSON lines on stdout.")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help="Seconds of quiet after a change before affected checks are re-evaluated.")
+    parser.add_argument('--exit-on-drift', action='store_true',
+                        help="With --watch, exit with status 2 at the first drift.")
+    parser.add_argument('--log-file', default=DEFAULT_LOG_FILE,
+                        help="Log file; it is rotated by size and hardware dumps are stored next to it.")
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text',
+                        help="Format of the log file (the console always gets text).")
+    return parser.parse_args()
+
+def vm_options(args):
+    """Returns the NUMA/hugepage VM options, or None unless --vm-memory is given."""
+    if not args.vm_memory:
+        return None
+    return {
+        'memory_mib': args.vm_memory,
+        'cores': args.vm_cores,
+        'reserved_cores': args.vm_reserved_cores,
+        'hugepage_size': args.hugepage_size,
+        'output': args.vm_config,
+    }
+
+def load_hosts(args):
+    """Collects fleet hosts from --hosts and --hosts-file."""
+    hosts = [host.strip() for host in args.hosts.split(',') if host.strip()]
+    if args.hosts_file:
+        with open(args.hosts_file, 'r') as f:
+            hosts += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return hosts
+
+def finish_trace(args):
+    """Logs the per-phase latency summary and writes the trace file if requested."""
+    tracer.log_summary()
+    if args.trace:
+        tracer.export_chrome(args.trace)
+
+def watch(args, settings_file='config/settings.json'):
+    """Runs the drift watcher until interrupted; exits 2 if drift was seen, 0 otherwise."""
+    with open(settings_file, 'r') as f:
+        plan = CheckPlan.compile(json.load(f)['desired_state']['commands'])
+    # Every re-evaluation would add check spans for as long as the daemon runs
+    tracer.disable()
+
+    def report(event):
+        DriftWatcher.log_event(event)
+        print(json.dumps(event.to_dict()), flush=True)
+
+    watcher = DriftWatcher(plan, debounce=args.debounce, on_event=report)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: watcher.stop())
+    try:
+        drifted = watcher.watch(exit_on_drift=args.exit_on_drift)
+    finally:
+        watcher.close()
+    sys.exit(2 if drifted else 0)
 
 def main():
     """Main function to run the GPU passthrough setup."""
-    configurator = SystemConfigurator(dry_run=False)
+    args = parse_args()
+    setup_logger(args.log_file, json_lines=args.log_format == 'json')
+    if args.watch:
+        watch(args)
+
+    if args.rollback_last:
+        configurator = SystemConfigurator(command_timeout=args.command_timeout)
+        try:
+            configurator.rollback_last()
+        except ConfigurationError as e:
+            logger.error(f"Rollback failed: {e}")
+            sys.exit(1)
+        finally:
+            finish_trace(args)
+        return
+
+    if args.audit:
+        configurator = SystemConfigurator(refresh_hardware=args.refresh_hardware)
+        try:
+            report = configurator.audit(args.audit, fix_irq_affinity=args.fix_irq_affinity)
+        except ConfigurationError as e:
+            logger.error(f"Audit failed: {e}")
+            sys.exit(1)
+        finally:
+            finish_trace(args)
+        sys.exit(0 if report.ok else 2)
+
+    try:
+        plan = PlanArtifact.load(args.plan) if args.plan else None
+    except ConfigurationError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+
+    hosts = load_hosts(args)
+    if hosts:
+        results = FleetRunner(hosts, concurrency=args.concurrency, dry_run=args.dry_run,
+                              command_timeout=args.command_timeout, total_timeout=args.total_timeout,
+                              plan=plan, vm=vm_options(args)).run()
+        finish_trace(args)
+        sys.exit(0 if all(result.ok for result in results) else 1)
+
+    configurator = SystemConfigurator(dry_run=args.dry_run, refresh_hardware=args.refresh_hardware,
+                                      command_timeout=args.command_timeout, total_timeout=args.total_timeout,
+                                      vm=vm_options(args))
     try:
-        configurator.configure_system()
+        if plan:
+            configurator.apply_plan(plan)
+        else:
+            configurator.configure_system(plan_output=args.save_plan)
         logger.info("GPU passthrough setup completed successfully.")
     except ConfigurationError as e:
         logger.error(f"Configuration error: {e}")
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
+    finally:
+        finish_trace(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+import json
+import posixpath
+from src.logger import logger
+
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+
+
+def read_boot_id(transport):
+    """Returns the kernel's random boot ID, or None if it cannot be read."""
+    try:
+        return transport.read_file(BOOT_ID_PATH).strip() or None
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+class BootStatusCache:
+    """A probe result cached as JSON through the transport, valid until the host reboots.
+
+    Entries are {'version', 'boot_id', 'status'}; a different version or boot ID is a miss.
+    """
+
+    def __init__(self, transport, path, label, version=1):
+        self.transport = transport
+        self.path = path
+        self.label = label
+        self.version = version
+
+    def load(self, boot_id):
+        try:
+            entry = json.loads(self.transport.read_file(self.path))
+            if entry.get('version') != self.version or entry.get('boot_id') != boot_id:
+                return None
+            return entry['status']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable {self.label} status {self.path}: {e}")
+            return None
+
+    def store(self, boot_id, status):
+        entry = {'version': self.version, 'boot_id': boot_id, 'status': status}
+        try:
+            self.transport.makedirs(posixpath.dirname(self.path))
+            self.transport.replace_file(self.path, json.dumps(entry, indent=2, sort_keys=True) + '\n')
+        except OSError as e:
+            logger.warning(f"Failed to cache {self.label} status in {self.path}: {e}")
+
+    def get(self, probe, refresh=False, decode=None, encode=None):
+        """Returns this boot's cached result, or runs probe() and caches it unless refresh is set.
+
+        encode/decode convert between the probe result and its JSON form.
+        """
+        boot_id = read_boot_id(self.transport)
+        if boot_id and not refresh:
+            cached = self.load(boot_id)
+            if cached is not None:
+                try:
+                    return decode(cached) if decode else cached
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"Ignoring unreadable {self.label} status {self.path}: {e}")
+
+        result = probe()
+        if boot_id:
+            self.store(boot_id, encode(result) if encode else result)
+        return result
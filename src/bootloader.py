@@ -1,36 +1,131 @@
-import subprocess
+import posixpath
+import struct
 from src.logger import logger
-from src.preconditions import ConfigurationError
+from src.boot_cache import BootStatusCache
+from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+STATUS_VERSION = 2
+DEFAULT_STATUS_PATH = '/var/cache/gpu-passthrough/bootloader.json'
+EFI_DIR = '/sys/firmware/efi'
+EFIVARS_DIR = '/sys/firmware/efi/efivars'
+EFI_GLOBAL_GUID = '8be4df61-93ca-11d2-aa0d-00e098032b8c'
+KERNEL_CMDLINE_PATH = '/etc/kernel/cmdline'
+
+# Device path node types (UEFI spec, section 10.3)
+MEDIA_DEVICE_PATH = 0x04
+MEDIA_FILEPATH = 0x04
+END_DEVICE_PATH = 0x7f
+
+# (substring of the loader file name, bootloader), checked in order
+LOADERS = [
+    ('systemd-boot', 'systemd-boot'),
+    ('shim', 'grub-uefi-secure'),
+    ('grub', 'grub-uefi'),
+]
+# Boot entry descriptions used when the loader is the removable-media fallback (\EFI\BOOT\BOOTX64.EFI)
+DESCRIPTIONS = [
+    ('linux boot manager', 'systemd-boot'),
+    ('proxmox', 'grub-uefi'),
+]
+
+
+def parse_load_option(data):
+    """Parses an EFI_LOAD_OPTION; returns (description, [file paths of its device path])."""
+    if len(data) < 6:
+        raise ValueError("load option is truncated")
+    _, file_path_length = struct.unpack_from('<IH', data)
+    end = 6
+    while end + 1 < len(data) and data[end:end + 2] != b'\0\0':
+        end += 2
+    description = data[6:end].decode('utf-16-le', errors='replace')
+    offset = end + 2
+    device_path = data[offset:offset + file_path_length]
+
+    paths = []
+    position = 0
+    while position + 4 <= len(device_path):
+        node_type, subtype, length = struct.unpack_from('<BBH', device_path, position)
+        if length < 4 or node_type == END_DEVICE_PATH:
+            break
+        if node_type == MEDIA_DEVICE_PATH and subtype == MEDIA_FILEPATH:
+            path = device_path[position + 4:position + length].decode('utf-16-le', errors='replace')
+            paths.append(path.rstrip('\0'))
+        position += length
+    return description, paths
 
-class Bootloader:
-    @staticmethod
-    def determine_bootloader():
-        """Determines the bootloader type."""
-        logger.info("Determining bootloader...")
-        try:
-            efibootmgr_output = subprocess.check_output("efibootmgr -v", shell=True).decode()
 
-            if "EFI variables are not supported" in efibootmgr_output:
-                logger.info("GRUB is used in BIOS/Legacy mode.")
-                return "grub-bios"
+def classify_boot_entry(description, paths):
+    """Maps a boot entry to a bootloader name, or returns None if it cannot be told."""
+    for path in paths:
+        name = path.replace('\\', '/').rsplit('/', 1)[-1].lower()
+        for marker, bootloader in LOADERS:
+            if marker in name:
+                return bootloader
+    for marker, bootloader in DESCRIPTIONS:
+        if marker in description.lower():
+            return bootloader
+    return None
 
-            if "proxmox" in efibootmgr_output.lower():
-                if "grubx64.efi" in efibootmgr_output.lower():
-                    logger.info("GRUB is used in UEFI mode.")
-                    return "grub-uefi"
-                elif "shimx64.efi" in efibootmgr_output.lower():
-                    logger.info("GRUB with Secure Boot is used in UEFI mode.")
-                    return "grub-uefi-secure"
 
-            if "systemd-bootx64.efi" in efibootmgr_output.lower():
-                logger.info("systemd-boot is used.")
-                return "systemd-boot"
+class BootloaderDetector:
+    """Determines the booted bootloader from the EFI variables, once per boot."""
 
-            raise ConfigurationError("Unable to determine bootloader type from efibootmgr output.")
+    def __init__(self, transport=None, status_path=DEFAULT_STATUS_PATH):
+        self.transport = transport or LocalTransport()
+        self.cache = BootStatusCache(self.transport, status_path, 'bootloader', STATUS_VERSION)
 
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to determine bootloader: {e.stderr.decode()}")
-            raise ConfigurationError("Bootloader determination failed.")
+    def read_variable(self, name):
+        """Returns the data of a global EFI variable, without its 4-byte attribute header."""
+        data = self.transport.read_bytes(posixpath.join(EFIVARS_DIR, f'{name}-{EFI_GLOBAL_GUID}'))
+        if len(data) < 4:
+            raise ValueError(f"EFI variable {name} is truncated")
+        return data[4:]
+
+    def probe(self):
+        """Reads BootCurrent and its Boot#### load option without using the per-boot cache."""
+        with tracer.span('bootloader', 'probe') as span:
+            if not self.transport.exists(EFI_DIR):
+                span.set(firmware='bios')
+                return 'grub-bios', None
+            try:
+                current = self.read_variable('BootCurrent')
+                entry = f"Boot{struct.unpack_from('<H', current)[0]:04X}"
+                description, paths = parse_load_option(self.read_variable(entry))
+            except (OSError, ValueError, struct.error) as e:
+                raise ConfigurationError(f"Cannot read the current EFI boot entry: {e}")
+            span.set(firmware='uefi', entry=entry)
+
+        bootloader = classify_boot_entry(description, paths)
+        if bootloader is None:
+            raise ConfigurationError(
+                f"Unable to determine bootloader type from {entry} ('{description}', {', '.join(paths) or 'no path'})."
+            )
+        return bootloader, entry
+
+    def detect(self, refresh=False):
+        """Returns this boot's bootloader, reusing the cached result unless refresh is set."""
+        return self.cache.get(self.probe, refresh, decode=lambda status: (status['bootloader'], status['entry']),
+                              encode=lambda result: {'bootloader': result[0], 'entry': result[1]})[0]
+
+
+class Bootloader:
+    MESSAGES = {
+        'grub-bios': "GRUB is used in BIOS/Legacy mode.",
+        'grub-uefi': "GRUB is used in UEFI mode.",
+        'grub-uefi-secure': "GRUB with Secure Boot is used in UEFI mode.",
+        'systemd-boot': "systemd-boot is used.",
+    }
+
+    @staticmethod
+    def determine_bootloader(transport=None, refresh=False):
+        """Determines the bootloader type from the current EFI boot entry (cached per boot)."""
+        logger.info("Determining bootloader...")
+        try:
+            bootloader = BootloaderDetector(transport).detect(refresh)
         except ConfigurationError as e:
             logger.error(e)
             raise
+        logger.info(Bootloader.MESSAGES[bootloader])
+        return bootloader
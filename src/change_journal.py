@@ -0,0 +1,161 @@
+import datetime
+import hashlib
+import json
+import posixpath
+import threading
+import uuid
+from src.logger import logger
+from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+JOURNAL_VERSION = 1
+DEFAULT_JOURNAL_DIR = '/var/lib/gpu-passthrough/journal'
+DEFAULT_KEEP_RUNS = 20
+
+
+class ChangeJournal:
+    """Write-ahead journal of the files a run modifies.
+
+    Before a file is first modified in a run, its content is stored under objects/ by SHA-256
+    (so identical snapshots are shared across runs) and the run record under runs/ is rewritten
+    atomically. A record that is still 'open' at the next start belongs to a run that crashed
+    and is rolled back by recover().
+    """
+
+    def __init__(self, transport=None, directory=DEFAULT_JOURNAL_DIR, keep_runs=DEFAULT_KEEP_RUNS):
+        self.transport = transport or LocalTransport()
+        self.directory = directory
+        self.keep_runs = keep_runs
+        self.record = None
+        self._lock = threading.Lock()
+
+    def _run_path(self, run_id):
+        return posixpath.join(self.directory, 'runs', f'{run_id}.json')
+
+    def _object_path(self, digest):
+        return posixpath.join(self.directory, 'objects', digest[:2], digest)
+
+    def _save(self, record):
+        self.transport.makedirs(posixpath.join(self.directory, 'runs'))
+        self.transport.replace_file(self._run_path(record['run_id']),
+                                    json.dumps(record, indent=2, sort_keys=True) + '\n')
+
+    def begin(self):
+        """Starts a run; nothing is written until the first snapshot."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.record = {
+            'version': JOURNAL_VERSION,
+            'run_id': f"{now.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex[:8]}",
+            'host': self.transport.host,
+            'started': now.isoformat(),
+            'state': 'open',
+            'entries': [],
+        }
+        return self.record['run_id']
+
+    def snapshot(self, path):
+        """Records a file's current content before its first modification in this run."""
+        with self._lock:
+            if self.record is None:
+                raise ConfigurationError(f"Cannot modify {path}: no journal run was started.")
+            if any(entry['path'] == path for entry in self.record['entries']):
+                return
+            try:
+                content = self.transport.read_file(path)
+            except FileNotFoundError:
+                entry = {'path': path, 'existed': False, 'object': None}
+            else:
+                digest = hashlib.sha256(content.encode()).hexdigest()
+                object_path = self._object_path(digest)
+                if not self.transport.exists(object_path):
+                    self.transport.makedirs(posixpath.dirname(object_path))
+                    self.transport.replace_file(object_path, content)
+                entry = {'path': path, 'existed': True, 'object': digest}
+            self.record['entries'].append(entry)
+            self._save(self.record)
+
+    def commit(self):
+        """Marks the run as complete and prunes old runs."""
+        with self._lock:
+            record, self.record = self.record, None
+        if record is None or not record['entries']:
+            return
+        record['state'] = 'committed'
+        self._save(record)
+        logger.info(f"Journaled {len(record['entries'])} changed files as run {record['run_id']}.")
+        self.prune()
+
+    def runs(self):
+        """Returns all run records, oldest first."""
+        try:
+            names = sorted(name for name in self.transport.listdir(posixpath.join(self.directory, 'runs'))
+                           if name.endswith('.json'))
+        except OSError:
+            return []
+        records = []
+        for name in names:
+            try:
+                records.append(json.loads(self.transport.read_file(posixpath.join(self.directory, 'runs', name))))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable journal record {name}: {e}")
+        return records
+
+    def open_runs(self):
+        """Returns runs left open by a crashed or interrupted process."""
+        return [record for record in self.runs() if record.get('state') == 'open']
+
+    def last_run(self):
+        """Returns the most recent run that can still be undone."""
+        candidates = [record for record in self.runs() if record.get('state') in ('open', 'committed')]
+        return candidates[-1] if candidates else None
+
+    def rollback(self, record=None):
+        """Restores every file of a run (the current one by default) in one pass; returns the paths."""
+        with self._lock:
+            if record is None:
+                record, self.record = self.record, None
+        if record is None or not record['entries']:
+            return []
+
+        restored = []
+        with tracer.span(record['run_id'], 'rollback', files=len(record['entries'])):
+            for entry in reversed(record['entries']):
+                path = entry['path']
+                try:
+                    if entry['existed']:
+                        self.transport.replace_file(path, self.transport.read_file(self._object_path(entry['object'])))
+                    else:
+                        try:
+                            self.transport.remove_file(path)
+                        except FileNotFoundError:
+                            pass
+                except OSError as e:
+                    logger.error(f"Failed to restore {path}: {e}")
+                    raise ConfigurationError(f"Rollback of run {record['run_id']} failed at {path}")
+                logger.info(f"Restored {path}" if entry['existed'] else f"Removed {path}")
+                restored.append(path)
+        record['state'] = 'rolled_back'
+        self._save(record)
+        return restored
+
+    def prune(self):
+        """Drops the oldest finished runs beyond keep_runs and the snapshots no run references."""
+        records = self.runs()
+        finished = [record for record in records if record.get('state') != 'open']
+        expired = finished[:max(0, len(finished) - self.keep_runs)]
+        if not expired:
+            return
+        for record in expired:
+            try:
+                self.transport.remove_file(self._run_path(record['run_id']))
+            except OSError:
+                pass
+        referenced = {entry['object'] for record in records if record not in expired
+                      for entry in record['entries'] if entry['object']}
+        for entry in (entry for record in expired for entry in record['entries']):
+            if entry['object'] and entry['object'] not in referenced:
+                try:
+                    self.transport.remove_file(self._object_path(entry['object']))
+                except OSError:
+                    pass
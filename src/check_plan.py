@@ -0,0 +1,334 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import Future
+from src.logger import logger
+from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+from src.iommu_status import IommuDetector
+from src.bootloader import BootloaderDetector, KERNEL_CMDLINE_PATH
+
+DEFAULT_CHECK_TIMEOUT = 30
+GRUB_DEFAULT_PATH = '/etc/default/grub'
+GRUB_CMDLINE_KEYS = ('GRUB_CMDLINE_LINUX_DEFAULT=', 'GRUB_CMDLINE_LINUX=')
+
+
+class CheckContext:
+    """Shares file reads and command output across all checks of one plan evaluation."""
+
+    def __init__(self, root='/', transport=None):
+        self.root = root
+        self.transport = transport or LocalTransport()
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def path(self, path):
+        """Resolves an absolute host path under the context root."""
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def _once(self, key, loader):
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+        if owner:
+            try:
+                future.set_result(loader())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def read_lines(self, path):
+        """Returns the stripped lines of a file, or None if it does not exist or cannot be read."""
+        def load():
+            try:
+                return [line.strip() for line in self.transport.read_file(self.path(path)).split('\n')]
+            except FileNotFoundError:
+                return None
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Cannot read {path}: {e}")
+                return None
+        return self._once(('file', path), load)
+
+    def loaded_modules(self):
+        """Returns the set of loaded kernel module names."""
+        def load():
+            lines = self.read_lines('/proc/modules') or []
+            return {line.split()[0] for line in lines if line}
+        return self._once(('modules',), load)
+
+    def command_output(self, command, timeout):
+        """Runs a command once without a shell and returns its stripped stdout."""
+        return self._once(('command', command), lambda: self.transport.run(
+            command, timeout=timeout, shell=False
+        ).stdout.decode().strip())
+
+    def run(self, command, timeout):
+        """Runs a shell command and returns its stripped stdout."""
+        return self.transport.run(command, timeout=timeout).stdout.decode().strip()
+
+    def exists(self, path):
+        return self.transport.exists(self.path(path))
+
+    def iommu_status(self):
+        """Returns this boot's IommuStatus (cached per boot_id)."""
+        return self._once(('iommu',), lambda: IommuDetector(self.transport).detect())
+
+    def bootloader(self):
+        """Returns this boot's bootloader (cached per boot_id), or None if it cannot be determined."""
+        def load():
+            try:
+                return BootloaderDetector(self.transport).detect()
+            except ConfigurationError:
+                return None
+        return self._once(('bootloader',), load)
+
+
+class Check:
+    kind = None
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        self.description = condition['description']
+        self.failure_message = condition['failure_message']
+        self.timeout = condition.get('timeout', default_timeout)
+
+    def evaluate(self, context):
+        """Returns (met, message) for this check."""
+        raise NotImplementedError
+
+    def paths(self):
+        """Returns the host files this check depends on."""
+        return []
+
+    @staticmethod
+    def _matches(output, contains, optional_contains):
+        return contains in output or any(opt in output for opt in optional_contains)
+
+
+class FileContainsLineCheck(Check):
+    """Every listed line is present in the file (ignoring surrounding whitespace)."""
+    kind = 'file_contains_line'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        spec = condition['check']
+        self.path = spec['path']
+        self.lines = spec['lines']
+
+    def paths(self):
+        return [self.path]
+
+    def evaluate(self, context):
+        file_lines = context.read_lines(self.path)
+        if file_lines is None:
+            return False, self.failure_message
+        present = set(file_lines)
+        if all(line in present for line in self.lines):
+            return True, None
+        return False, self.failure_message
+
+
+class FileContainsCheck(Check):
+    """Every listed substring appears somewhere in the file."""
+    kind = 'file_contains'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        spec = condition['check']
+        self.path = spec['path']
+        self.patterns = spec['patterns']
+
+    def paths(self):
+        return [self.path]
+
+    def evaluate(self, context):
+        file_lines = context.read_lines(self.path)
+        if file_lines is None:
+            return False, self.failure_message
+        if all(any(pattern in line for line in file_lines) for pattern in self.patterns):
+            return True, None
+        return False, self.failure_message
+
+
+class PathExistsCheck(Check):
+    kind = 'path_exists'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        self.path = condition['check']['path']
+
+    def paths(self):
+        return [self.path]
+
+    def evaluate(self, context):
+        if context.exists(self.path):
+            return True, None
+        return False, self.failure_message
+
+
+class ModuleLoadedCheck(Check):
+    """Every listed kernel module is loaded or built in."""
+    kind = 'module_loaded'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        self.modules = condition['check']['modules']
+
+    def paths(self):
+        return ['/proc/modules']
+
+    def evaluate(self, context):
+        loaded = context.loaded_modules()
+        for module in self.modules:
+            if module not in loaded and not context.exists(f'/sys/module/{module}'):
+                return False, self.failure_message
+        return True, None
+
+
+class CommandOutputContainsCheck(Check):
+    """A command's output, optionally narrowed to matching lines, contains a substring."""
+    kind = 'command_output_contains'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        spec = condition['check']
+        self.command = spec['command']
+        self.contains = spec['contains']
+        self.optional_contains = spec.get('optional_contains', [])
+        line_filter = spec.get('filter', [])
+        self.filters = [line_filter] if isinstance(line_filter, str) else line_filter
+
+    def evaluate(self, context):
+        try:
+            output = context.command_output(self.command, self.timeout)
+        except subprocess.CalledProcessError as e:
+            stderr_output = e.stderr.decode().strip() if e.stderr else "No stderr output"
+            return False, stderr_output
+        except subprocess.TimeoutExpired:
+            return False, f"Check timed out after {self.timeout}s: {self.command}"
+        except OSError as e:
+            return False, f"Failed to run {self.command}: {e}"
+
+        if self.filters:
+            filters = [f.lower() for f in self.filters]
+            output = '\n'.join(
+                line for line in output.split('\n') if any(f in line.lower() for f in filters)
+            )
+        if output and self._matches(output, self.contains, self.optional_contains):
+            return True, None
+        return False, self.failure_message
+
+
+class IommuEnabledCheck(Check):
+    """The IOMMU is active (IOMMU groups exist), optionally with interrupt remapping."""
+    kind = 'iommu_enabled'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        self.interrupt_remapping = condition['check'].get('interrupt_remapping', False)
+
+    def evaluate(self, context):
+        status = context.iommu_status()
+        if status.enabled and (status.interrupt_remapping or not self.interrupt_remapping):
+            return True, None
+        return False, f"{self.failure_message} ({status.summary()})"
+
+
+class KernelCmdlineCheck(Check):
+    """The bootloader's configured kernel command line has every listed parameter.
+
+    systemd-boot hosts are checked against /etc/kernel/cmdline, all others against the
+    GRUB_CMDLINE_LINUX(_DEFAULT) settings in /etc/default/grub.
+    """
+    kind = 'kernel_cmdline'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        self.parameters = condition['check']['parameters']
+
+    def paths(self):
+        return [GRUB_DEFAULT_PATH, KERNEL_CMDLINE_PATH]
+
+    def evaluate(self, context):
+        if context.bootloader() == 'systemd-boot':
+            path = KERNEL_CMDLINE_PATH
+            lines = context.read_lines(path)
+            words = next((line.split() for line in lines or [] if line and not line.startswith('#')), [])
+        else:
+            path = GRUB_DEFAULT_PATH
+            lines = context.read_lines(path)
+            words = [word for line in lines or [] for key in GRUB_CMDLINE_KEYS if line.startswith(key)
+                     for word in line[len(key):].strip('"\'').split()]
+        if lines is None:
+            return False, f"{self.failure_message} ({path} not found)"
+        if all(parameter in words for parameter in self.parameters):
+            return True, None
+        return False, f"{self.failure_message} ({path})"
+
+
+class ShellCheck(Check):
+    """Escape hatch: runs a raw shell command and compares its output."""
+    kind = 'shell'
+
+    def __init__(self, condition, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        super().__init__(condition, default_timeout)
+        self.command = condition['command']
+        self.expected_output = condition.get('expected_output')
+        self.expected_output_contains = condition.get('expected_output_contains')
+        self.optional_expected_output_contains = condition.get('optional_expected_output_contains', [])
+
+    def evaluate(self, context):
+        try:
+            result = context.run(self.command, self.timeout)
+        except subprocess.CalledProcessError as e:
+            stderr_output = e.stderr.decode().strip() if e.stderr else "No stderr output"
+            return False, stderr_output
+        except subprocess.TimeoutExpired:
+            return False, f"Check timed out after {self.timeout}s: {self.command}"
+
+        if self.expected_output and result != self.expected_output:
+            return False, self.failure_message
+        if self.expected_output_contains and not self._matches(
+                result, self.expected_output_contains, self.optional_expected_output_contains):
+            return False, self.failure_message
+        return True, None
+
+
+CHECK_KINDS = {
+    cls.kind: cls for cls in (
+        FileContainsLineCheck, FileContainsCheck, PathExistsCheck,
+        ModuleLoadedCheck, CommandOutputContainsCheck, IommuEnabledCheck, KernelCmdlineCheck, ShellCheck,
+    )
+}
+
+
+class CheckPlan:
+    """A list of settings.json conditions compiled into typed checks."""
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    @classmethod
+    def compile(cls, conditions, default_timeout=DEFAULT_CHECK_TIMEOUT):
+        """Compiles settings.json condition entries into a check plan."""
+        checks = []
+        for condition in conditions:
+            kind = condition['check'].get('kind') if 'check' in condition else 'shell'
+            if kind not in CHECK_KINDS:
+                raise ConfigurationError(f"Unknown check kind '{kind}' in '{condition.get('description')}'.")
+            try:
+                checks.append(CHECK_KINDS[kind](condition, default_timeout))
+            except KeyError as e:
+                raise ConfigurationError(f"Check '{condition.get('description')}' is missing field {e}.")
+        return cls(checks)
+
+    def paths(self):
+        """Returns the distinct host files the plan depends on."""
+        return sorted({path for check in self.checks for path in check.paths()})
+
+    def __iter__(self):
+        return iter(self.checks)
+
+    def __len__(self):
+        return len(self.checks)
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import logger
+from src.check_plan import CheckContext
+from src.tracing import tracer
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class CheckResult:
+    def __init__(self, description, met, message=None, duration=0.0):
+        self.description = description
+        self.met = met
+        self.message = message
+        self.duration = duration
+
+
+class CheckRunner:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, root='/', transport=None):
+        self.max_workers = max_workers
+        self.root = root
+        self.transport = transport
+
+    def run(self, plan, context=None):
+        """Evaluates a check plan on a bounded worker pool and returns results in config order."""
+        if not len(plan):
+            return []
+
+        context = context or CheckContext(self.root, self.transport)
+        workers = max(1, min(self.max_workers, len(plan)))
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda check: self._evaluate(check, context), plan))
+        wall_clock = time.monotonic() - start
+        summed = sum(result.duration for result in results)
+
+        logger.info(
+            f"Ran {len(results)} checks on {workers} workers in {wall_clock:.3f}s wall-clock "
+            f"({summed:.3f}s summed latency)"
+        )
+        return results
+
+    @staticmethod
+    def _evaluate(check, context):
+        """Evaluates a single check and times it."""
+        start = time.monotonic()
+        with tracer.span(check.description, 'check', kind=check.kind) as span:
+            met, message = check.evaluate(context)
+            span.set(met=met)
+        return CheckResult(check.description, met, message, time.monotonic() - start)
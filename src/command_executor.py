@@ -1,24 +1,67 @@
 import subprocess
+import time
 from src.logger import logger
+from src.process_stream import DEFAULT_TAIL_LINES
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+DEFAULT_COMMAND_TIMEOUT = 1800
+
 
 class CommandExecutor:
-    @staticmethod
-    def execute(command):
-        """Executes a shell command."""
+    """Runs remediation commands with streamed output, per-command timeouts and an optional run deadline."""
+
+    def __init__(self, transport=None, command_timeout=DEFAULT_COMMAND_TIMEOUT, total_timeout=None,
+                 tail_lines=DEFAULT_TAIL_LINES):
+        self.transport = transport or LocalTransport()
+        self.command_timeout = command_timeout
+        self.total_timeout = total_timeout
+        # Starts with the first command, so discovery and checks do not use up the budget
+        self.deadline = None
+        self.tail_lines = tail_lines
+
+    def _timeout(self, timeout):
+        """Returns the effective timeout for the next command, bounded by the run deadline."""
+        timeout = self.command_timeout if timeout is None else timeout
+        if self.total_timeout is None:
+            return timeout
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.total_timeout
+        remaining = self.deadline - time.monotonic()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _log_line(self, stream, line):
+        if stream == 'stderr':
+            logger.info(f"  stderr: {line}")
+        else:
+            logger.info(f"  {line}")
+
+    def _run(self, command, timeout):
+        with tracer.span(command, 'command', host=self.transport.host) as span:
+            if timeout is not None and timeout <= 0:
+                span.set(timed_out=True)
+                raise subprocess.TimeoutExpired(command, 0)
+            result = self.transport.stream(command, timeout=timeout, on_line=self._log_line,
+                                           tail_lines=self.tail_lines)
+            span.set(exit_code=result.returncode, output_bytes=result.output_bytes, timed_out=result.timed_out)
+        if result.timed_out:
+            raise subprocess.TimeoutExpired(command, timeout, output=result.stdout, stderr=result.stderr)
+        if result.returncode:
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        return result
+
+    def execute(self, command, timeout=None):
+        """Executes a shell command and returns its CommandResult.
+
+        Raises CalledProcessError on a non-zero exit and TimeoutExpired when the command or the run
+        deadline times out; the command's whole process group is killed in that case.
+        """
         logger.info(f"Executing: {command}")
         try:
-            result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            logger.info(result.stdout.decode())
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Command failed: {e.stderr.decode()}")
+            return self._run(command, self._timeout(timeout))
+        except subprocess.TimeoutExpired as e:
+            logger.error(f"Command timed out after {e.timeout:.0f}s: {command}")
             raise
-
-    @staticmethod
-    def rollback(command):
-        """Rolls back a shell command."""
-        logger.info(f"Rolling back: {command}")
-        try:
-            result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            logger.info(result.stdout.decode())
         except subprocess.CalledProcessError as e:
-            logger.error(f"Rollback failed: {e.stderr.decode()}")
+            logger.error(f"Command failed with exit code {e.returncode}: {e.stderr}")
+            raise
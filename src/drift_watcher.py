@@ -0,0 +1,239 @@
+import ctypes
+import ctypes.util
+import os
+import posixpath
+import select
+import struct
+import time
+from src.logger import logger
+from src.check_plan import CheckPlan
+from src.check_runner import CheckRunner, DEFAULT_MAX_WORKERS
+from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+
+DEFAULT_WATCH_PATHS = ['/etc/default/grub', '/etc/kernel/cmdline', '/etc/modules', '/etc/modprobe.d/']
+DEFAULT_DEBOUNCE = 0.5
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+# Files are watched through their directory so atomic rename-over edits are seen too.
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """Minimal ctypes binding for the Linux inotify API."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1 failed: {os.strerror(error)}")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Cannot watch {path}: {os.strerror(error)}")
+        return wd
+
+    def read_events(self):
+        """Returns the queued (wd, mask, name) events without blocking."""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+                offset += length
+                events.append((wd, mask, name))
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DriftEvent:
+    def __init__(self, description, status, message, paths):
+        self.description = description
+        self.status = status
+        self.message = message
+        self.paths = paths
+        self.timestamp = time.time()
+
+    def to_dict(self):
+        return {
+            'time': self.timestamp,
+            'status': self.status,
+            'description': self.description,
+            'message': self.message,
+            'paths': self.paths,
+        }
+
+
+class DriftWatcher:
+    """Re-evaluates only the desired-state checks whose files changed, as reported by inotify.
+
+    The watcher blocks in poll() while nothing changes. A burst of events is collected until the
+    watched files have been quiet for `debounce` seconds, then the affected checks run once.
+    """
+
+    def __init__(self, plan, transport=None, watch_paths=None, debounce=DEFAULT_DEBOUNCE,
+                 max_workers=DEFAULT_MAX_WORKERS, on_event=None):
+        self.transport = transport or LocalTransport()
+        if not self.transport.is_local:
+            raise ConfigurationError("Drift watching requires a local transport.")
+        self.watch_paths = list(watch_paths or DEFAULT_WATCH_PATHS)
+        self.debounce = debounce
+        self.on_event = on_event or self.log_event
+        self.runner = CheckRunner(max_workers=max_workers, transport=self.transport)
+        self.state = {}
+
+        self.checks_by_path = {}
+        checks = []
+        for check in plan:
+            for path in check.paths():
+                if self._watched(path):
+                    self.checks_by_path.setdefault(path, []).append(check)
+                    if check not in checks:
+                        checks.append(check)
+        self.plan = CheckPlan(checks)
+        self._stop_read, self._stop_write = os.pipe()
+
+    def _watched(self, path):
+        return any(path == watched or (watched.endswith('/') and path.startswith(watched))
+                   for watched in self.watch_paths)
+
+    def directories(self):
+        """Returns the host directories that need an inotify watch."""
+        return sorted({posixpath.dirname(path) for path in self.checks_by_path})
+
+    def affected(self, paths):
+        """Returns the plan of checks that depend on any of the changed paths, in plan order."""
+        affected = {id(check) for path in paths for check in self.checks_by_path.get(path, [])}
+        return CheckPlan([check for check in self.plan if id(check) in affected])
+
+    def evaluate(self, plan):
+        """Runs a plan and returns the drift events for checks whose outcome changed."""
+        events = []
+        for check, result in zip(plan, self.runner.run(plan)):
+            previous = self.state.get(check.description)
+            self.state[check.description] = result.met
+            if previous == result.met or (previous is None and result.met):
+                continue
+            status = 'resolved' if result.met else 'drift'
+            events.append(DriftEvent(check.description, status, result.message, check.paths()))
+        for event in events:
+            self.on_event(event)
+        return events
+
+    @staticmethod
+    def log_event(event):
+        if event.status == 'drift':
+            logger.warning(f"Drift detected: {event.description} ({', '.join(event.paths)})")
+        else:
+            logger.info(f"Drift resolved: {event.description}")
+
+    def stop(self):
+        """Wakes up and ends a running watch(); safe to call from another thread or a signal handler."""
+        os.write(self._stop_write, b'x')
+
+    def watch(self, exit_on_drift=False, duration=None):
+        """Watches until stopped (or for `duration` seconds) and returns True if any drift was seen.
+
+        With exit_on_drift the watch ends at the first drift, including drift present at start.
+        """
+        if not len(self.plan):
+            raise ConfigurationError("No desired-state checks depend on the watched paths.")
+        deadline = None if duration is None else time.monotonic() + duration
+
+        with Inotify() as inotify:
+            watches = {}
+            for directory in self.directories():
+                try:
+                    watches[inotify.add_watch(self.transport.path(directory))] = directory
+                except OSError as e:
+                    logger.warning(f"Not watching {directory}: {e.strerror}")
+            logger.info(f"Watching {len(watches)} directories for drift in {len(self.plan)} checks...")
+
+            drifted = any(event.status == 'drift' for event in self.evaluate(self.plan))
+            poller = select.poll()
+            poller.register(inotify.fileno(), select.POLLIN)
+            poller.register(self._stop_read, select.POLLIN)
+            while not (drifted and exit_on_drift):
+                changed = self._wait(inotify, poller, watches, deadline)
+                if changed is None:
+                    break
+                logger.info(f"Changed: {', '.join(sorted(changed))}")
+                events = self.evaluate(self.affected(changed))
+                drifted = drifted or any(event.status == 'drift' for event in events)
+        return drifted
+
+    def _wait(self, inotify, poller, watches, deadline):
+        """Blocks until relevant files changed and settled; returns their paths, or None to stop."""
+        changed = set()
+        while True:
+            if changed:
+                timeout = self.debounce
+            elif deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return None
+            else:
+                timeout = None
+            try:
+                ready = poller.poll(None if timeout is None else max(0, int(timeout * 1000)))
+            except InterruptedError:
+                continue
+            if not ready:
+                if changed:
+                    return changed
+                continue
+            if any(fd == self._stop_read for fd, _ in ready):
+                os.read(self._stop_read, 4096)
+                return None
+
+            for wd, mask, name in inotify.read_events():
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.checks_by_path)
+                    continue
+                directory = watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:
+                    logger.warning(f"Watch on {directory} was removed; its files are no longer monitored.")
+                    del watches[wd]
+                    continue
+                path = posixpath.join(directory, name)
+                if path in self.checks_by_path:
+                    changed.add(path)
+
+    def close(self):
+        for fd in (self._stop_read, self._stop_write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
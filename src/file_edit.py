@@ -0,0 +1,230 @@
+import difflib
+from src.logger import logger
+from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+
+class EnsureLine:
+    """Appends the line unless it is already present."""
+    kind = 'ensure_line'
+
+    def __init__(self, line):
+        self.line = line
+
+    def apply(self, lines):
+        if self.line not in (existing.strip() for existing in lines):
+            lines.append(self.line)
+        return lines
+
+    def describe(self):
+        return f"ensure line '{self.line}'"
+
+    def to_dict(self):
+        return {'kind': self.kind, 'line': self.line}
+
+
+class SetLine:
+    """Replaces the first line starting with a prefix (dropping any others), or appends it."""
+    kind = 'set_line'
+
+    def __init__(self, prefix, line):
+        self.prefix = prefix
+        self.line = line
+
+    def apply(self, lines):
+        result = []
+        replaced = False
+        for existing in lines:
+            if existing.strip().startswith(self.prefix):
+                if not replaced:
+                    result.append(self.line)
+                    replaced = True
+            else:
+                result.append(existing)
+        if not replaced:
+            result.append(self.line)
+        return result
+
+    def describe(self):
+        return f"set '{self.line}'"
+
+    def to_dict(self):
+        return {'kind': self.kind, 'prefix': self.prefix, 'line': self.line}
+
+
+def merge_words(current, words, replace_keys=False):
+    """Returns current plus the missing words, or None if nothing changes.
+
+    With replace_keys, a 'key=value' word replaces existing words with the same key.
+    """
+    merged = list(current)
+    if replace_keys:
+        keys = {word.split('=', 1)[0] for word in words if '=' in word}
+        merged = [word for word in merged if word in words or word.split('=', 1)[0] not in keys]
+    merged += [word for word in words if word not in merged]
+    return None if merged == current else merged
+
+
+class AddKeyWords:
+    """Adds words to a shell-style KEY="value" assignment, keeping the existing ones."""
+    kind = 'add_key_words'
+
+    def __init__(self, key, words, replace_keys=False):
+        self.key = key
+        self.words = words
+        self.replace_keys = replace_keys
+
+    def apply(self, lines):
+        prefix = f"{self.key}="
+        for i, existing in enumerate(lines):
+            if existing.startswith(prefix):
+                merged = merge_words(existing[len(prefix):].strip().strip('"').split(), self.words,
+                                     self.replace_keys)
+                if merged is not None:
+                    lines[i] = f'{self.key}="{" ".join(merged)}"'
+                return lines
+        lines.append(f'{self.key}="{" ".join(self.words)}"')
+        return lines
+
+    def describe(self):
+        if self.replace_keys:
+            return f"set {' '.join(self.words)} in {self.key}"
+        return f"add {' '.join(self.words)} to {self.key}"
+
+    def to_dict(self):
+        return {'kind': self.kind, 'key': self.key, 'words': list(self.words), 'replace_keys': self.replace_keys}
+
+
+class AddWords:
+    """Adds words to a one-line file such as /etc/kernel/cmdline, keeping the existing ones."""
+    kind = 'add_words'
+
+    def __init__(self, words, replace_keys=False):
+        self.words = words
+        self.replace_keys = replace_keys
+
+    def apply(self, lines):
+        index = next((i for i, line in enumerate(lines) if line.strip() and not line.startswith('#')), None)
+        merged = merge_words(lines[index].split() if index is not None else [], self.words, self.replace_keys)
+        if merged is None:
+            return lines
+        if index is None:
+            lines.append(' '.join(merged))
+        else:
+            lines[index] = ' '.join(merged)
+        return lines
+
+    def describe(self):
+        return f"{'set' if self.replace_keys else 'add'} {' '.join(self.words)}"
+
+    def to_dict(self):
+        return {'kind': self.kind, 'words': list(self.words), 'replace_keys': self.replace_keys}
+
+
+EDIT_KINDS = {cls.kind: cls for cls in (EnsureLine, SetLine, AddKeyWords, AddWords)}
+
+
+def edit_from_dict(data):
+    """Rebuilds an edit operation from its to_dict() form."""
+    data = dict(data)
+    kind = data.pop('kind', None)
+    if kind not in EDIT_KINDS:
+        raise ConfigurationError(f"Unknown file edit kind '{kind}'.")
+    try:
+        return EDIT_KINDS[kind](**data)
+    except TypeError as e:
+        raise ConfigurationError(f"Invalid '{kind}' file edit: {e}")
+
+
+class FileEditor:
+    """Collects line-level edits per file and applies them with one read and one atomic write per file."""
+
+    def __init__(self, transport=None, journal=None):
+        self.transport = transport or LocalTransport()
+        self.journal = journal
+        self.edits = {}
+
+    def add(self, path, edit):
+        self.edits.setdefault(path, []).append(edit)
+
+    def ensure_line(self, path, line):
+        self.add(path, EnsureLine(line))
+
+    def set_line(self, path, prefix, line):
+        self.add(path, SetLine(prefix, line))
+
+    def add_key_words(self, path, key, words, replace_keys=False):
+        self.add(path, AddKeyWords(key, words, replace_keys))
+
+    def add_words(self, path, words, replace_keys=False):
+        self.add(path, AddWords(words, replace_keys))
+
+    def paths(self):
+        return list(self.edits)
+
+    def _read_lines(self, path):
+        try:
+            return self.transport.read_file(path).splitlines()
+        except FileNotFoundError:
+            return []
+
+    def render(self, path):
+        """Returns (old_lines, new_lines) for a file without writing it."""
+        old_lines = self._read_lines(path)
+        new_lines = list(old_lines)
+        for edit in self.edits.get(path, []):
+            new_lines = edit.apply(new_lines)
+        return old_lines, new_lines
+
+    def apply(self, paths=None):
+        """Applies the queued edits (all, or only those for the given paths) and returns the paths that changed."""
+        changed = []
+        for path in list(self.edits) if paths is None else [path for path in paths if path in self.edits]:
+            edits = self.edits[path]
+            try:
+                with tracer.span(path, 'file-edit', edits=len(edits)) as span:
+                    old_lines, new_lines = self.render(path)
+                    span.set(changed=new_lines != old_lines)
+                    if new_lines == old_lines:
+                        logger.info(f"{path} already up to date.")
+                        continue
+                    content = '\n'.join(new_lines) + '\n'
+                    span.set(output_bytes=len(content))
+                    try:
+                        if self.journal is not None:
+                            self.journal.snapshot(path)
+                        self.transport.replace_file(path, content)
+                    except OSError as e:
+                        logger.error(f"Failed to write {path}: {e}")
+                        raise ConfigurationError(f"Failed to write {path}")
+            finally:
+                self.edits.pop(path, None)
+            logger.info(f"Updated {path}: {'; '.join(edit.describe() for edit in edits)}")
+            changed.append(path)
+        return changed
+
+    def to_dict(self):
+        """Returns the queued edits as {path: [edit dicts]}."""
+        return {path: [edit.to_dict() for edit in edits] for path, edits in self.edits.items()}
+
+    def load(self, data):
+        """Queues edits from a to_dict() mapping."""
+        for path, edits in data.items():
+            for edit in edits:
+                self.add(path, edit_from_dict(edit))
+
+    def diff(self):
+        """Returns a unified diff of every queued edit against the current file contents."""
+        lines = []
+        for path in self.edits:
+            old_lines, new_lines = self.render(path)
+            lines.extend(difflib.unified_diff(old_lines, new_lines, f"a{path}", f"b{path}", lineterm=''))
+        return lines
+
+    def describe(self):
+        """Returns one human-readable line per queued file edit."""
+        return [
+            f"Edit {path}: {'; '.join(edit.describe() for edit in edits)}"
+            for path, edits in self.edits.items()
+        ]
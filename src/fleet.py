@@ -0,0 +1,88 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import logger
+from src.command_executor import DEFAULT_COMMAND_TIMEOUT
+from src.system_configurator import SystemConfigurator
+from src.transport import SSHTransport
+
+DEFAULT_CONCURRENCY = 8
+
+
+class HostResult:
+    def __init__(self, host, status, error=None, duration=0.0):
+        self.host = host
+        self.status = status
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.status == 'configured'
+
+
+class FleetRunner:
+    """Runs SystemConfigurator.configure_system (or applies one saved plan) on many hosts concurrently."""
+
+    def __init__(self, hosts, concurrency=DEFAULT_CONCURRENCY, dry_run=False,
+                 settings_file='config/settings.json', transport_factory=SSHTransport,
+                 command_timeout=DEFAULT_COMMAND_TIMEOUT, total_timeout=None, plan=None, vm=None):
+        self.hosts = hosts
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.settings_file = settings_file
+        self.transport_factory = transport_factory
+        self.command_timeout = command_timeout
+        self.total_timeout = total_timeout
+        self.plan = plan
+        self.vm = vm
+
+    def run(self):
+        """Configures every host and returns per-host results in input order."""
+        if not self.hosts:
+            return []
+
+        workers = max(1, min(self.concurrency, len(self.hosts)))
+        logger.info(f"Configuring {len(self.hosts)} hosts with concurrency {workers}...")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fleet') as pool:
+            results = list(pool.map(self._configure_host, self.hosts))
+
+        self.log_summary(results)
+        return results
+
+    def _configure_host(self, host):
+        """Configures a single host over its own pooled connection."""
+        start = time.monotonic()
+        transport = self.transport_factory(host)
+        try:
+            transport.open()
+            configurator = SystemConfigurator(dry_run=self.dry_run, settings_file=self.settings_file,
+                                              transport=transport, command_timeout=self.command_timeout,
+                                              total_timeout=self.total_timeout, vm=self._vm_options(host))
+            if self.plan is not None:
+                status = 'configured' if configurator.apply_plan(self.plan) else 'failed'
+            else:
+                status = 'configured' if configurator.configure_system() else 'preconditions-unmet'
+            return HostResult(host, status, duration=time.monotonic() - start)
+        except Exception as e:
+            logger.error(f"[{host}] Configuration failed: {e}")
+            return HostResult(host, 'failed', str(e), time.monotonic() - start)
+        finally:
+            transport.close()
+
+    def _vm_options(self, host):
+        """Returns the VM options for a host; each host writes its VM settings to its own file."""
+        if not self.vm or not self.vm.get('output'):
+            return self.vm
+        base, extension = os.path.splitext(self.vm['output'])
+        return dict(self.vm, output=f"{base}.{host}{extension}")
+
+    @staticmethod
+    def log_summary(results):
+        """Logs one line per host plus totals."""
+        logger.info("Fleet summary:")
+        for result in results:
+            detail = f" ({result.error})" if result.error else ""
+            logger.info(f"  {result.host}: {result.status} in {result.duration:.1f}s{detail}")
+        configured = sum(1 for result in results if result.ok)
+        logger.info(f"{configured}/{len(results)} hosts configured.")
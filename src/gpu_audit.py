@@ -0,0 +1,307 @@
+import json
+import posixpath
+import re
+from src.logger import logger
+from src.numa_layout import NumaTopology, PCI_DEVICES_DIR, device_locality, format_cpulist, parse_cpulist
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+IRQ_DIR = '/proc/irq'
+EXPECTED_DRIVER = 'vfio-pci'
+
+# PCI configuration space (PCI Local Bus spec, section 6.7)
+HEADER_SIZE = 0x40
+STATUS_REGISTER = 0x06
+STATUS_CAPABILITY_LIST = 0x10
+CAPABILITY_POINTER = 0x34
+CAPABILITY_IDS = {0x05: 'msi', 0x11: 'msix'}
+MAX_CAPABILITIES = 48
+LINK_SPEED = re.compile(r'([\d.]+)\s*GT/s')
+
+
+def parse_link_speed(text):
+    """Returns the transfer rate in GT/s of a sysfs link speed such as '16.0 GT/s PCIe', or None."""
+    match = LINK_SPEED.search(text or '')
+    return float(match.group(1)) if match else None
+
+
+def parse_link_width(text):
+    """Returns the lane count of a sysfs link width, or None when the link is down or unknown."""
+    return int(text) if text and text.isdigit() and int(text) > 0 else None
+
+
+def interrupt_capabilities(config):
+    """Returns the MSI/MSI-X capabilities ('msi', 'msix') found in a device's PCI configuration space.
+
+    Returns None when only the header is readable (unprivileged reads stop at 64 bytes).
+    """
+    if len(config) <= HEADER_SIZE:
+        return None
+    found = []
+    if not config[STATUS_REGISTER] & STATUS_CAPABILITY_LIST:
+        return found
+    offset = config[CAPABILITY_POINTER] & 0xfc
+    for _ in range(MAX_CAPABILITIES):
+        if offset < HEADER_SIZE or offset + 1 >= len(config):
+            break
+        name = CAPABILITY_IDS.get(config[offset])
+        if name and name not in found:
+            found.append(name)
+        offset = config[offset + 1] & 0xfc
+    return found
+
+
+def format_affinity_mask(cpus):
+    """Formats CPU numbers as a /proc/irq/*/smp_affinity mask: comma-separated 32-bit hex words."""
+    mask = 0
+    for cpu in cpus:
+        mask |= 1 << cpu
+    words = []
+    while True:
+        words.append(f"{mask & 0xffffffff:08x}")
+        mask >>= 32
+        if not mask:
+            break
+    return ','.join(reversed(words))
+
+
+def slot_functions(transport, bdf):
+    """Returns the functions of the device's slot (e.g. a GPU and its HDMI audio), in BDF order."""
+    slot = bdf.rsplit('.', 1)[0] + '.'
+    try:
+        functions = sorted(name for name in transport.listdir(PCI_DEVICES_DIR) if name.startswith(slot))
+    except OSError:
+        functions = []
+    return functions or [bdf]
+
+
+class IrqAffinity:
+    """One interrupt of a device and the CPUs it may be delivered to."""
+
+    def __init__(self, irq, kind, cpus, cross_node=False, fixed=None, error=None):
+        self.irq = irq
+        self.kind = kind
+        self.cpus = cpus
+        self.cross_node = cross_node
+        self.fixed = fixed
+        self.error = error
+
+    def to_dict(self):
+        return {
+            'irq': self.irq,
+            'kind': self.kind,
+            'affinity': format_cpulist(self.cpus) if self.cpus is not None else None,
+            'cross_node': self.cross_node,
+            'fixed': self.fixed,
+            'error': self.error,
+        }
+
+
+class FunctionAudit:
+    """Driver, PCIe link, interrupt and IRQ affinity state of one passed-through PCI function."""
+
+    def __init__(self, bdf, gpu, driver, node, link, capabilities, irqs):
+        self.bdf = bdf
+        self.gpu = gpu
+        self.driver = driver
+        self.node = node
+        self.link = link
+        self.capabilities = capabilities
+        self.irqs = irqs
+
+    @property
+    def idle(self):
+        """True while no interrupts are allocated, i.e. no VM is using the function."""
+        return not self.irqs
+
+    def _degraded(self, name):
+        current, maximum = self.link[f'current_{name}'], self.link[f'max_{name}']
+        return current is not None and maximum is not None and current < maximum
+
+    @property
+    def issues(self):
+        """Returns the problem codes: driver, link-speed, link-width, no-msi and cross-node-irq."""
+        issues = []
+        if self.driver != EXPECTED_DRIVER:
+            issues.append('driver')
+        if self._degraded('speed') and not self.idle:
+            issues.append('link-speed')
+        if self._degraded('width'):
+            issues.append('link-width')
+        if self.capabilities == []:
+            issues.append('no-msi')
+        if any(irq.cross_node and not irq.fixed for irq in self.irqs):
+            issues.append('cross-node-irq')
+        return issues
+
+    @property
+    def warnings(self):
+        """Returns the codes that do not fail the audit: link-speed while idle (GPUs lower it to save power)."""
+        return ['link-speed'] if self._degraded('speed') and self.idle else []
+
+    @property
+    def interrupt_mode(self):
+        """The interrupt type in use: 'msix', 'msi', or None while no interrupts are allocated."""
+        kinds = {irq.kind for irq in self.irqs}
+        return next((kind for kind in ('msix', 'msi') if kind in kinds), None)
+
+    def to_dict(self):
+        return {
+            'bdf': self.bdf,
+            'gpu': self.gpu,
+            'driver': self.driver,
+            'numa_node': self.node,
+            'link': dict(self.link),
+            'capabilities': self.capabilities,
+            'interrupt_mode': self.interrupt_mode,
+            'irqs': [irq.to_dict() for irq in self.irqs],
+            'issues': self.issues,
+            'warnings': self.warnings,
+        }
+
+
+class AuditReport:
+    """Audit results of every function of the passthrough GPUs on one host."""
+
+    def __init__(self, host, functions):
+        self.host = host
+        self.functions = functions
+
+    @property
+    def ok(self):
+        return not any(function.issues for function in self.functions)
+
+    def to_dict(self):
+        return {
+            'host': self.host,
+            'ok': self.ok,
+            'functions': [function.to_dict() for function in self.functions],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True) + '\n'
+
+    def log(self):
+        """Logs one line per function and a warning per problem."""
+        for function in self.functions:
+            link = function.link
+            logger.info(
+                f"{function.bdf}: driver {function.driver or 'none'}, NUMA node {function.node}, link "
+                f"{_value(link['current_speed'])}/{_value(link['max_speed'])} GT/s "
+                f"x{_value(link['current_width'])}/x{_value(link['max_width'])}, "
+                f"interrupts {', '.join(function.capabilities or []) or 'unknown'} "
+                + (f"(using {function.interrupt_mode}, {len(function.irqs)} IRQs)" if function.irqs
+                   else "(no interrupts allocated)")
+            )
+            for issue in function.issues + function.warnings:
+                logger.warning(f"{function.bdf}: {_describe(function, issue)}")
+        if self.ok:
+            logger.info(f"GPU audit passed for {len(self.functions)} functions.")
+
+
+class GpuAudit:
+    """Audits the passthrough GPUs after reboot: driver binding, PCIe link, MSI/MSI-X and IRQ locality.
+
+    With fix_irq_affinity, IRQs that may fire on CPUs outside the device's NUMA node get their
+    smp_affinity set to the node's CPUs (not persistent across reboots).
+    """
+
+    def __init__(self, transport=None, fix_irq_affinity=False):
+        self.transport = transport or LocalTransport()
+        self.fix_irq_affinity = fix_irq_affinity
+
+    def audit(self, gpus):
+        """Audits every function of the given GPU BDFs; returns an AuditReport."""
+        topology = NumaTopology.read(self.transport)
+        functions = []
+        for gpu in sorted(gpus):
+            for bdf in slot_functions(self.transport, gpu):
+                with tracer.span(bdf, 'check', kind='gpu_audit') as span:
+                    function = self.audit_function(bdf, gpu, topology)
+                    span.set(issues=len(function.issues))
+                functions.append(function)
+        return AuditReport(self.transport.host, functions)
+
+    def audit_function(self, bdf, gpu, topology):
+        device_dir = posixpath.join(PCI_DEVICES_DIR, bdf)
+        node = device_locality(self.transport, bdf, topology)
+        link = {
+            'current_speed': parse_link_speed(self._read(device_dir, 'current_link_speed')),
+            'max_speed': parse_link_speed(self._read(device_dir, 'max_link_speed')),
+            'current_width': parse_link_width(self._read(device_dir, 'current_link_width')),
+            'max_width': parse_link_width(self._read(device_dir, 'max_link_width')),
+        }
+        try:
+            capabilities = interrupt_capabilities(self.transport.read_bytes(posixpath.join(device_dir, 'config')))
+        except OSError:
+            capabilities = None
+        node_cpus = topology.nodes[node]['cpus']
+        irqs = [self.irq_affinity(irq, kind, node_cpus) for irq, kind in self.interrupts(device_dir)]
+        return FunctionAudit(bdf, gpu, self.driver(device_dir), node, link, capabilities, irqs)
+
+    def driver(self, device_dir):
+        """Returns the name of the bound driver from the device's uevent, or None if it is unbound."""
+        for line in (self._read(device_dir, 'uevent') or '').splitlines():
+            if line.startswith('DRIVER='):
+                return line[len('DRIVER='):].strip() or None
+        return None
+
+    def interrupts(self, device_dir):
+        """Returns (irq, kind) for the device's allocated MSI/MSI-X vectors.
+
+        vfio-pci only allocates them while a VM uses the device. The legacy `irq` file is ignored: an
+        unrequested INTx pin says nothing about the device and may be shared with other devices.
+        """
+        try:
+            names = self.transport.listdir(posixpath.join(device_dir, 'msi_irqs'))
+        except OSError:
+            names = []
+        irqs = []
+        for name in sorted((name for name in names if name.isdigit()), key=int):
+            kind = (self._read(device_dir, 'msi_irqs', name) or 'msi').replace('-', '')
+            irqs.append((int(name), kind))
+        return irqs
+
+    def irq_affinity(self, irq, kind, node_cpus):
+        """Reads an IRQ's affinity and, if it reaches past the node and fixing is enabled, narrows it to the node."""
+        irq_dir = posixpath.join(IRQ_DIR, str(irq))
+        text = self._read(irq_dir, 'smp_affinity_list')
+        if text is None:
+            return IrqAffinity(irq, kind, None)
+        cpus = parse_cpulist(text)
+        cross_node = bool(set(cpus) - set(node_cpus))
+        if not cross_node or not self.fix_irq_affinity:
+            return IrqAffinity(irq, kind, cpus, cross_node)
+        try:
+            self.transport.write_file(posixpath.join(irq_dir, 'smp_affinity'), format_affinity_mask(node_cpus) + '\n')
+        except OSError as e:
+            # Kernel-managed vectors reject affinity changes (EIO)
+            logger.warning(f"Cannot set the affinity of IRQ {irq}: {e}")
+            return IrqAffinity(irq, kind, cpus, cross_node, fixed=False, error=str(e))
+        logger.info(f"IRQ {irq}: affinity {format_cpulist(cpus)} -> {format_cpulist(node_cpus)}")
+        return IrqAffinity(irq, kind, list(node_cpus), cross_node, fixed=True)
+
+    def _read(self, *parts):
+        try:
+            return self.transport.read_file(posixpath.join(*parts)).strip()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+
+def _value(value):
+    return '?' if value is None else f"{value:g}"
+
+
+def _describe(function, issue):
+    link = function.link
+    if issue == 'driver':
+        return f"bound to {function.driver or 'no driver'} instead of {EXPECTED_DRIVER}."
+    if issue == 'link-speed':
+        note = " while idle; GPUs lower it to save power, so re-check under load" if function.idle else ""
+        return f"PCIe link runs at {_value(link['current_speed'])} of {_value(link['max_speed'])} GT/s{note}."
+    if issue == 'link-width':
+        return f"PCIe link is x{link['current_width']} of x{link['max_width']} lanes."
+    if issue == 'no-msi':
+        return "the device supports neither MSI nor MSI-X."
+    irqs = [str(irq.irq) for irq in function.irqs if irq.cross_node and not irq.fixed]
+    return f"IRQs {', '.join(irqs)} may run on CPUs outside NUMA node {function.node}."
@@ -1,10 +1,12 @@
-import shutil
-import subprocess
 from src.logger import logger
 from src.preconditions import ConfigurationError
+from src.hardware_probe import create_probe
+from src.transport import LocalTransport
 
 class GrubConfig:
-    def __init__(self):
+    def __init__(self, probe=None, transport=None):
+        self.transport = transport or LocalTransport()
+        self.probe = probe or create_probe(transport=self.transport)
         self.backup_path = '/etc/default/grub.bak'
         self.grub_path = '/etc/default/grub'
 
@@ -12,56 +14,28 @@ class GrubConfig:
         """Backs up the GRUB configuration."""
         logger.info("Backing up /etc/default/grub")
         try:
-            shutil.copy(self.grub_path, self.backup_path)
+            self.transport.copy_file(self.grub_path, self.backup_path)
             logger.info("Backup created at /etc/default/grub.bak")
         except Exception as e:
             logger.error(f"Failed to backup /etc/default/grub: {str(e)}")
             raise ConfigurationError("Failed to backup /etc/default/grub")
 
-    def modify_grub_config(self):
-        """Modifies the GRUB configuration."""
-        logger.info("Modifying /etc/default/grub")
+    def iommu_parameters(self):
+        """Returns the kernel parameters that enable the IOMMU for this host's CPU vendor."""
         try:
-            cpu_info = subprocess.check_output("lscpu", shell=True).decode().lower()
-            if "amd" in cpu_info:
-                required_settings = "quiet iommu=pt"
-            elif "intel" in cpu_info:
-                required_settings = "quiet intel_iommu=on iommu=pt"
-            else:
-                raise ConfigurationError("Unsupported CPU type. Only AMD and Intel CPUs are supported.")
-
-            with open(self.grub_path, 'r') as f:
-                grub_config = f.readlines()
-
-            modified = False
-            for i, line in enumerate(grub_config):
-                if line.startswith('GRUB_CMDLINE_LINUX_DEFAULT'):
-                    if required_settings not in line:
-                        current_settings = line.split('=', 1)[1].strip().strip('"')
-                        new_settings = f'GRUB_CMDLINE_LINUX_DEFAULT="{current_settings} {required_settings}"'
-                        grub_config[i] = new_settings + '\n'
-                        modified = True
-                    break
-
-            if not modified:
-                logger.info("No modification needed for GRUB_CMDLINE_LINUX_DEFAULT.")
-                return
-
-            with open(self.grub_path, 'w') as f:
-                f.writelines(grub_config)
-
-            logger.info("Modified /etc/default/grub. Running update-grub.")
-            self._execute_command("update-grub")
+            cpu_vendor = self.probe.cpu_vendor()
         except Exception as e:
-            logger.error(f"Failed to modify /etc/default/grub: {str(e)}")
-            raise ConfigurationError("Failed to modify /etc/default/grub")
+            logger.error(f"Failed to determine the CPU vendor: {str(e)}")
+            raise ConfigurationError("Failed to determine the IOMMU kernel parameters")
 
-    def _execute_command(self, command):
-        """Executes a shell command."""
-        logger.info(f"Executing: {command}")
-        try:
-            result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            logger.info(result.stdout.decode())
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Command failed: {e.stderr.decode()}")
-            raise ConfigurationError(f"Command execution failed: {command}")
+        if cpu_vendor == 'amd':
+            return ["iommu=pt"]
+        elif cpu_vendor == 'intel':
+            return ["intel_iommu=on", "iommu=pt"]
+        raise ConfigurationError("Unsupported CPU type. Only AMD and Intel CPUs are supported.")
+
+    def modify_grub_config(self, editor, parameters=None):
+        """Queues kernel parameters (the IOMMU settings by default) for GRUB_CMDLINE_LINUX_DEFAULT."""
+        logger.info("Modifying /etc/default/grub")
+        parameters = self.iommu_parameters() if parameters is None else parameters
+        editor.add_key_words(self.grub_path, 'GRUB_CMDLINE_LINUX_DEFAULT', ["quiet"] + parameters, replace_keys=True)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import posixpath
+from src.logger import logger
+from src.boot_cache import read_boot_id
+from src.transport import LocalTransport
+
+CACHE_VERSION = 3
+DEFAULT_CACHE_PATH = '/var/cache/gpu-passthrough/hardware.json'
+PCI_DEVICES_DIR = '/sys/bus/pci/devices'
+
+
+class HardwareCache:
+    """Persists the hardware_info snapshot for the lifetime of a boot.
+
+    The PCI fingerprint uses entry mtimes, so the transport must be local.
+    """
+
+    def __init__(self, transport=None, path=DEFAULT_CACHE_PATH):
+        self.transport = transport or LocalTransport()
+        self.path = path
+
+    def boot_id(self):
+        """Returns the kernel boot ID, or None if it cannot be read."""
+        return read_boot_id(self.transport)
+
+    def fingerprint(self):
+        """Hashes the PCI device list and entry mtimes, or returns None if unavailable."""
+        base = self.transport.path(PCI_DEVICES_DIR)
+        try:
+            entries = sorted(os.listdir(base))
+            digest = hashlib.sha256()
+            for entry in entries:
+                digest.update(f"{entry}:{os.lstat(os.path.join(base, entry)).st_mtime_ns}\n".encode())
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    def key(self):
+        """Returns the (boot_id, fingerprint) pair, or None if the host cannot be keyed."""
+        boot_id = self.boot_id()
+        fingerprint = self.fingerprint()
+        if boot_id is None or fingerprint is None:
+            return None
+        return boot_id, fingerprint
+
+    def load(self):
+        """Returns the cached hardware_info for this boot, discarding stale or corrupted entries."""
+        key = self.key()
+        if key is None:
+            return None
+
+        try:
+            entry = json.loads(self.transport.read_file(self.path))
+            if entry.get('version') != CACHE_VERSION:
+                raise ValueError(f"unsupported cache version {entry.get('version')}")
+            if (entry['boot_id'], entry['fingerprint']) != key:
+                logger.info("Hardware snapshot is stale; discarding it.")
+                self.invalidate()
+                return None
+            return entry['hardware_info']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding corrupted hardware snapshot {self.path}: {e}")
+            self.invalidate()
+            return None
+
+    def store(self, hardware_info):
+        """Atomically writes the hardware_info snapshot for this boot."""
+        key = self.key()
+        if key is None:
+            return
+
+        entry = {
+            'version': CACHE_VERSION,
+            'boot_id': key[0],
+            'fingerprint': key[1],
+            'hardware_info': hardware_info,
+        }
+        try:
+            self.transport.makedirs(posixpath.dirname(self.path))
+            self.transport.replace_file(self.path, json.dumps(entry))
+        except OSError as e:
+            logger.warning(f"Failed to write hardware snapshot {self.path}: {e}")
+
+    def invalidate(self):
+        """Removes the cached snapshot, if any."""
+        try:
+            self.transport.remove_file(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove hardware snapshot {self.path}: {e}")
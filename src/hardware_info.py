@@ -1,83 +1,164 @@
+import hashlib
 import subprocess
-from src.logger import logger
+from src.logger import logger, write_artifact
+from src.boot_cache import read_boot_id
 from src.configuration_error import ConfigurationError
+from src.hardware_probe import ShellProbe, create_probe
+from src.pci_topology import PciTopology
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+GPU_VENDORS = {'10de': 'nvidia', '1002': 'amd', '8086': 'intel'}
 
 class HardwareInfo:
-    def __init__(self):
+    def __init__(self, probe=None, cache=None, transport=None):
+        self.transport = transport or LocalTransport()
+        self.probe = probe or create_probe(transport=self.transport)
+        self.cache = cache
+        self.topology = None
         self.hardware_info = {
             'cpu': {'model': None, 'detail': None},
             'motherboard': {'model': None, 'detail': None},
-            'gpu': {'exists': False, 'model': None, 'detail': None, 'type': None, 'codes': []}
+            'gpu': {'exists': False, 'model': None, 'detail': None, 'type': None, 'codes': [], 'overrides': [],
+                    'devices': []}
         }
 
-    def log_hardware_info(self):
-        """Logs and retrieves hardware information."""
-        logger.info("Logging hardware information...")
+    def log_hardware_info(self, refresh=False):
+        """Logs and retrieves hardware information, reusing this boot's snapshot when possible."""
+        if self.cache is not None:
+            if refresh:
+                self.cache.invalidate()
+            else:
+                with tracer.span('load_hardware_snapshot', 'probe') as span:
+                    cached = self.cache.load()
+                    span.set(hit=cached is not None)
+                if cached is not None:
+                    logger.info(f"Using hardware snapshot from {self.cache.path}")
+                    self.hardware_info = cached
+                    return self.hardware_info
+
+        with tracer.span('log_hardware_info', 'probe') as span:
+            logger.info(f"Logging hardware information ({self.probe.name} backend)...")
+
+            try:
+                try:
+                    motherboard, cpu, pci = self._discover(self.probe)
+                except OSError as e:
+                    if isinstance(self.probe, ShellProbe):
+                        raise
+                    logger.warning(f"Native hardware discovery failed ({e}); falling back to the shell backend.")
+                    self.probe = ShellProbe(getattr(self.probe, 'transport', None))
+                    motherboard, cpu, pci = self._discover(self.probe)
 
-        try:
-            motherboard_info = subprocess.check_output("sudo dmidecode -t baseboard", shell=True).decode()
-            cpu_info = subprocess.check_output("lscpu", shell=True).decode()
-            vga_info = subprocess.check_output("lspci -nn | grep -i vga", shell=True).decode()
-            gpu_info = subprocess.check_output("lspci -nn", shell=True).decode()
+                motherboard_model, motherboard_info = motherboard
+                cpu_model, _, cpu_info = cpu
+                devices, gpu_info = pci
 
-            self._parse_motherboard_info(motherboard_info)
-            self._parse_cpu_info(cpu_info)
-            self._parse_gpu_info(vga_info, gpu_info)
+                self._parse_motherboard_info(motherboard_model, motherboard_info)
+                self._parse_cpu_info(cpu_model, cpu_info)
+                vga_info = self._parse_gpu_info(devices, gpu_info)
 
-            logger.info(f"Motherboard Info:\n{motherboard_info}")
-            logger.info(f"CPU Info:\n{cpu_info}")
-            logger.info(f"VGA Info:\n{vga_info}")
-            logger.info(f"GPU Info:\n{gpu_info}")
+                logger.info(f"Motherboard: {motherboard_model}; CPU: {cpu_model}; "
+                            f"GPU: {self.hardware_info['gpu']['model']}")
+                self._write_dumps({
+                    'motherboard': motherboard_info,
+                    'cpu': cpu_info,
+                    'vga': vga_info,
+                    'pci': gpu_info,
+                })
 
-        except subprocess.CalledProcessError as e:
-            stderr_output = e.stderr.decode().strip() if e.stderr else "No stderr output"
-            logger.error(f"Failed to retrieve hardware information: {stderr_output}")
-            raise ConfigurationError("Hardware information retrieval failed.")
+            except subprocess.CalledProcessError as e:
+                stderr_output = e.stderr.decode().strip() if e.stderr else "No stderr output"
+                logger.error(f"Failed to retrieve hardware information: {stderr_output}")
+                raise ConfigurationError("Hardware information retrieval failed.")
+            span.set(backend=self.probe.name, pci_devices=len(self.topology.devices) if self.topology else 0)
 
+        if self.cache is not None:
+            self.cache.store(self.hardware_info)
         return self.hardware_info
 
-    def _parse_motherboard_info(self, info):
-        """Parses motherboard information."""
-        for line in info.split('\n'):
-            if "Product Name:" in line:
-                self.hardware_info['motherboard']['model'] = line.split(":")[1].strip()
-                break
+    def _artifact_key(self, content):
+        """Returns the artifact directory for this host and boot, falling back to a content hash."""
+        boot_id = read_boot_id(self.transport) or 'content-' + hashlib.sha256(content.encode()).hexdigest()[:16]
+        return f"{self.transport.host}/{boot_id}"
+
+    def _write_dumps(self, dumps):
+        """Stores the full discovery dumps once per boot as compressed artifacts and logs their paths."""
+        key = self._artifact_key(''.join(dumps.values()))
+        for name, content in dumps.items():
+            logger.debug("%s dump:\n%s", name, content)
+            path = write_artifact(key, name, content)
+            if path:
+                logger.info(f"{name} dump ({len(content)} bytes) stored in {path}", extra={'artifact': path})
+
+    @staticmethod
+    def _discover(probe):
+        """Runs every discovery step of a probe backend."""
+        return probe.motherboard(), probe.cpu(), probe.pci_devices()
+
+    def _parse_motherboard_info(self, model, info):
+        """Stores motherboard information."""
+        self.hardware_info['motherboard']['model'] = model
         self.hardware_info['motherboard']['detail'] = info
 
-    def _parse_cpu_info(self, info):
-        """Parses CPU information."""
-        for line in info.split('\n'):
-            if "Model name:" in line:
-                self.hardware_info['cpu']['model'] = line.split(":")[1].strip()
-                break
+    def _parse_cpu_info(self, model, info):
+        """Stores CPU information."""
+        self.hardware_info['cpu']['model'] = model
         self.hardware_info['cpu']['detail'] = info
 
-    def _parse_gpu_info(self, vga_info, gpu_info):
-        """Parses GPU information."""
-        if vga_info:
-            self.hardware_info['gpu']['exists'] = True
-            self.hardware_info['gpu']['model'] = vga_info.split(":")[2].strip()
-            self.hardware_info['gpu']['detail'] = vga_info
-            gpu_type_detected = False
-
-            if "intel" in vga_info.lower():
-                self.hardware_info['gpu']['type'] = 'intel'
-                gpu_type_detected = True
-            elif "amd" in vga_info.lower() or "advanced micro devices" in vga_info.lower():
-                self.hardware_info['gpu']['type'] = 'amd'
-                gpu_type_detected = True
-            elif "nvidia" in vga_info.lower():
-                self.hardware_info['gpu']['type'] = 'nvidia'
-                gpu_type_detected = True
-
-            if not gpu_type_detected:
-                raise ConfigurationError("Unknown GPU type detected.")
-            
-            # Extract GPU and associated audio device codes
-            gpu_codes = []
-            vga_bus_id = vga_info.split()[0].rsplit('.', 1)[0]  # Get the bus root (e.g., "0e:00")
-            for line in gpu_info.split('\n'):
-                if line and line.split()[0].rsplit('.', 1)[0] == vga_bus_id:
-                    code = line.split('[')[-1].split(']')[0].strip()
-                    gpu_codes.append(code)
-            self.hardware_info['gpu']['codes'] = gpu_codes
+    def _parse_gpu_info(self, devices, gpu_info):
+        """Parses GPU information and returns the VGA summary lines."""
+        self.topology = PciTopology.from_probe(devices, self.probe.iommu_groups())
+        gpus = self.topology.passthrough_gpus()
+        if not gpus:
+            return ""
+
+        lines = {line.split(' ', 1)[0]: line for line in gpu_info.split('\n') if line}
+        gpu_devices = []
+        for gpu in gpus:
+            gpu_type = self._gpu_type(gpu)
+            if gpu_type is None:
+                raise ConfigurationError(f"Unknown GPU type detected at {gpu.bdf}.")
+            gpu_devices.append({
+                'bdf': gpu.bdf,
+                'model': gpu.description,
+                'type': gpu_type,
+                'iommu_group': gpu.iommu_group,
+                'codes': list(dict.fromkeys(device.pci_id for device in self.topology.isolation_devices([gpu]))),
+            })
+            for device in self.topology.foreign_group_members(gpu):
+                logger.warning(f"IOMMU group {gpu.iommu_group} of GPU {gpu.bdf} also contains {device.bdf} "
+                               f"({device.description}); it is isolated with the GPU and lost to the host.")
+
+        vga_info = '\n'.join(
+            lines.get(gpu.bdf[5:], lines.get(gpu.bdf, f"{gpu.bdf} {gpu.description} [{gpu.pci_id}]"))
+            for gpu in gpus
+        )
+        self.hardware_info['gpu']['exists'] = True
+        self.hardware_info['gpu']['model'] = gpu_devices[0]['model']
+        self.hardware_info['gpu']['detail'] = vga_info
+        self.hardware_info['gpu']['type'] = gpu_devices[0]['type']
+        self.hardware_info['gpu']['devices'] = gpu_devices
+
+        # GPU functions plus every non-bridge member of their IOMMU groups; IDs shared with a host
+        # device are bound per BDF instead, so vfio-pci does not take the host's device too
+        self.hardware_info['gpu']['codes'] = self.topology.isolation_ids(gpus)
+        self.hardware_info['gpu']['overrides'] = self.topology.override_bdfs(gpus)
+        for pci_id, others in self.topology.shared_ids(gpus).items():
+            logger.error(f"PCI ID {pci_id} is also used by host device(s) {', '.join(d.bdf for d in others)}; "
+                         f"binding the passthrough functions by BDF with driver_override instead of by ID.")
+        return vga_info
+
+    @staticmethod
+    def _gpu_type(gpu):
+        """Maps a GPU device to 'nvidia', 'amd' or 'intel'."""
+        if gpu.vendor in GPU_VENDORS:
+            return GPU_VENDORS[gpu.vendor]
+        description = gpu.description.lower()
+        if "intel" in description:
+            return 'intel'
+        if "amd" in description or "advanced micro devices" in description:
+            return 'amd'
+        if "nvidia" in description:
+            return 'nvidia'
+        return None
@@ -0,0 +1,207 @@
+import os
+import re
+import subprocess
+from src.logger import logger
+from src.pci_ids import load_pci_ids
+from src.pci_topology import read_iommu_groups
+from src.transport import LocalTransport
+
+LSPCI_LINE = re.compile(
+    r'^(?P<slot>\S+)\s+(?P<class_name>.*?)\s+\[(?P<class>[0-9a-f]{4})\]:\s+'
+    r'(?P<description>.*?)\s+\[(?P<vendor>[0-9a-f]{4}):(?P<device>[0-9a-f]{4})\]',
+    re.IGNORECASE
+)
+
+PCI_VENDOR_NAMES = {
+    '10de': 'NVIDIA Corporation',
+    '1002': 'Advanced Micro Devices, Inc. [AMD/ATI]',
+    '1022': 'Advanced Micro Devices, Inc. [AMD]',
+    '8086': 'Intel Corporation',
+}
+
+PCI_CLASS_NAMES = {
+    '0300': 'VGA compatible controller',
+    '0302': '3D controller',
+    '0403': 'Audio device',
+}
+
+
+class ShellProbe:
+    """Discovers hardware by forking dmidecode, lscpu and lspci."""
+    name = 'shell'
+
+    def __init__(self, transport=None):
+        self.transport = transport or LocalTransport()
+
+    def _output(self, command):
+        return self.transport.run(command).stdout.decode()
+
+    def motherboard(self):
+        """Returns the motherboard model and the raw dmidecode output."""
+        info = self._output("sudo dmidecode -t baseboard")
+        model = None
+        for line in info.split('\n'):
+            if "Product Name:" in line:
+                model = line.split(":")[1].strip()
+                break
+        return model, info
+
+    def cpu(self):
+        """Returns the CPU model, vendor and the raw lscpu output."""
+        info = self._output("lscpu")
+        model = None
+        for line in info.split('\n'):
+            if "Model name:" in line:
+                model = line.split(":")[1].strip()
+                break
+        return model, _cpu_vendor(info), info
+
+    def cpu_vendor(self):
+        """Returns 'amd', 'intel' or None."""
+        return self.cpu()[1]
+
+    def pci_devices(self):
+        """Returns the PCI devices and the raw lspci output."""
+        info = self._output("lspci -nn")
+        devices = []
+        for line in info.split('\n'):
+            match = LSPCI_LINE.match(line)
+            if match:
+                devices.append({
+                    'slot': match.group('slot'),
+                    'class': match.group('class').lower(),
+                    'vendor': match.group('vendor').lower(),
+                    'device': match.group('device').lower(),
+                    'description': match.group('description'),
+                })
+        return devices, info
+
+    def iommu_groups(self):
+        """Maps each BDF to its IOMMU group number."""
+        try:
+            output = self._output("find /sys/kernel/iommu_groups -mindepth 3 -maxdepth 3")
+        except subprocess.CalledProcessError:
+            return {}
+        groups = {}
+        for line in output.split('\n'):
+            parts = line.strip('/').split('/')
+            if len(parts) == 6 and parts[4] == 'devices':
+                groups[parts[5]] = int(parts[3]) if parts[3].isdigit() else parts[3]
+        return groups
+
+
+class SysfsProbe:
+    """Discovers hardware by reading sysfs and procfs in-process."""
+    name = 'sysfs'
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def available(self):
+        """Returns True if the PCI device tree exists under the root."""
+        return os.path.isdir(self._path('sys', 'bus', 'pci', 'devices'))
+
+    def motherboard(self):
+        """Returns the motherboard model and a dmidecode-like summary."""
+        fields = [('Manufacturer', 'board_vendor'), ('Product Name', 'board_name'), ('Version', 'board_version')]
+        values = {label: _read_text(self._path('sys', 'class', 'dmi', 'id', name)) for label, name in fields}
+        info = ''.join(f"\t{label}: {value}\n" for label, value in values.items() if value is not None)
+        return values['Product Name'], info
+
+    def cpu(self):
+        """Returns the CPU model, vendor and the first /proc/cpuinfo block."""
+        with open(self._path('proc', 'cpuinfo'), 'r') as f:
+            info = f.read().split('\n\n', 1)[0] + '\n'
+        model = None
+        vendor_id = ''
+        for line in info.split('\n'):
+            key, _, value = line.partition(':')
+            key = key.strip()
+            if key == 'model name':
+                model = value.strip()
+            elif key == 'vendor_id':
+                vendor_id = value.strip()
+        return model, _cpu_vendor(vendor_id), info
+
+    def cpu_vendor(self):
+        """Returns 'amd', 'intel' or None."""
+        return self.cpu()[1]
+
+    def pci_devices(self):
+        """Returns the PCI devices and an lspci-like summary."""
+        base = self._path('sys', 'bus', 'pci', 'devices')
+        pci_ids = load_pci_ids(self.root)
+        devices = []
+        for address in sorted(os.listdir(base)):
+            device_dir = os.path.join(base, address)
+            vendor = _read_hex(os.path.join(device_dir, 'vendor'))
+            device = _read_hex(os.path.join(device_dir, 'device'))
+            pci_class = _read_hex(os.path.join(device_dir, 'class'))
+            if vendor is None or device is None or pci_class is None:
+                continue
+            vendor, device = vendor.zfill(4), device.zfill(4)
+            description = pci_ids.describe(vendor, device) if pci_ids else None
+            devices.append({
+                'slot': address[5:] if address.startswith('0000:') else address,
+                'class': pci_class,
+                'vendor': vendor,
+                'device': device,
+                'description': description or PCI_VENDOR_NAMES.get(vendor, 'Unknown vendor'),
+                'boot_vga': _read_text(os.path.join(device_dir, 'boot_vga')) == '1',
+            })
+        info = ''.join(
+            f"{d['slot']} {PCI_CLASS_NAMES.get(d['class'], 'Class')} [{d['class']}]: "
+            f"{d['description']} [{d['vendor']}:{d['device']}]\n"
+            for d in devices
+        )
+        return devices, info
+
+    def iommu_groups(self):
+        """Maps each BDF to its IOMMU group number."""
+        return read_iommu_groups(self.root)
+
+
+def _cpu_vendor(text):
+    text = text.lower()
+    if "amd" in text:
+        return 'amd'
+    if "intel" in text:
+        return 'intel'
+    return None
+
+
+def _read_text(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_hex(path):
+    value = _read_text(path)
+    if not value:
+        return None
+    value = value.lower()
+    if value.startswith('0x'):
+        value = value[2:]
+    # sysfs class is 24 bits (class, subclass, prog-if); keep class and subclass.
+    if os.path.basename(path) == 'class':
+        value = value.zfill(6)[:4]
+    return value
+
+
+def create_probe(backend='auto', root='/', transport=None):
+    """Returns a hardware probe backend, preferring the native sysfs backend on the local host."""
+    if backend == 'shell' or (transport is not None and not transport.is_local):
+        return ShellProbe(transport)
+    if transport is not None:
+        root = transport.root
+    probe = SysfsProbe(root)
+    if backend == 'sysfs' or probe.available():
+        return probe
+    logger.info(f"No PCI device tree under {root}; falling back to the shell probe backend.")
+    return ShellProbe(transport)
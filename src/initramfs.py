@@ -0,0 +1,120 @@
+import os
+import posixpath
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import logger
+from src.configuration_error import ConfigurationError
+from src.tracing import tracer
+
+MODULES_DIR = '/lib/modules'
+BOOT_DIR = '/boot'
+
+
+def _version_key(version):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
+
+
+def installed_kernels(transport):
+    """Returns the kernel versions with both a /lib/modules directory and a /boot/vmlinuz image, oldest first."""
+    try:
+        versions = transport.listdir(MODULES_DIR)
+    except OSError:
+        return []
+    return sorted((version for version in versions
+                   if transport.exists(posixpath.join(BOOT_DIR, f'vmlinuz-{version}'))), key=_version_key)
+
+
+def initrd_path(version):
+    return posixpath.join(BOOT_DIR, f'initrd.img-{version}')
+
+
+def available_cores(transport):
+    """Returns the number of CPUs this process may use on the target host."""
+    if transport.is_local:
+        try:
+            return len(os.sched_getaffinity(0))
+        except (AttributeError, OSError):
+            return os.cpu_count() or 1
+    try:
+        return max(1, int(transport.run('nproc', timeout=30, shell=False).stdout.decode().strip()))
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return 1
+
+
+class KernelBuild:
+    """Outcome of one kernel's initramfs rebuild: 'rebuilt', 'failed' or 'timed-out'."""
+
+    def __init__(self, version, outcome, duration=0.0, error=None):
+        self.version = version
+        self.outcome = outcome
+        self.duration = duration
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.outcome == 'rebuilt'
+
+    def to_dict(self):
+        return {'kernel': self.version, 'outcome': self.outcome, 'duration': round(self.duration, 3),
+                'error': self.error}
+
+
+class InitramfsBuilder:
+    """Rebuilds the initramfs of every installed kernel whose image is stale, several kernels at a time.
+
+    A kernel is stale when its image is missing or it was last built from different config inputs
+    (tracked per kernel by `is_current` / `mark_current`).
+    """
+
+    def __init__(self, transport, command, max_workers=None):
+        self.transport = transport
+        self.command = command
+        self.max_workers = max_workers
+
+    def stale(self, is_current):
+        """Returns the installed kernels that need a rebuild."""
+        return [version for version in installed_kernels(self.transport)
+                if not is_current(version) or not self.transport.exists(initrd_path(version))]
+
+    def run(self, executor, versions, mark_current):
+        """Rebuilds the given kernels on a pool sized to the host's cores; raises if any rebuild failed.
+
+        mark_current(version) is called from the worker threads after each successful build.
+        """
+        if not versions:
+            return []
+        workers = max(1, min(self.max_workers or available_cores(self.transport), len(versions)))
+        logger.info(f"Rebuilding the initramfs of {len(versions)} kernels ({', '.join(versions)}) "
+                    f"with {workers} parallel builds...")
+
+        def build(version):
+            command = self.command.format(kernel=version)
+            start = time.monotonic()
+            with tracer.span(version, 'regeneration', command=command) as span:
+                try:
+                    executor.execute(command)
+                except subprocess.TimeoutExpired as e:
+                    outcome, error = 'timed-out', f"timed out after {e.timeout:.0f}s"
+                except subprocess.CalledProcessError as e:
+                    outcome, error = 'failed', f"exit code {e.returncode}"
+                except OSError as e:
+                    outcome, error = 'failed', str(e)
+                else:
+                    outcome, error = 'rebuilt', None
+                    mark_current(version)
+                span.set(outcome=outcome)
+            return KernelBuild(version, outcome, time.monotonic() - start, error)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='initramfs') as pool:
+            builds = list(pool.map(build, versions))
+
+        for result in builds:
+            detail = f" ({result.error})" if result.error else ""
+            log = logger.info if result.ok else logger.error
+            log(f"  initramfs {result.version}: {result.outcome} in {result.duration:.1f}s{detail}")
+        failed = [result.version for result in builds if not result.ok]
+        if failed:
+            raise ConfigurationError(f"Initramfs rebuild failed for kernel {', '.join(failed)}.")
+        return builds
@@ -0,0 +1,179 @@
+import os
+import subprocess
+from src.logger import logger
+from src.boot_cache import BootStatusCache
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+STATUS_VERSION = 1
+DEFAULT_STATUS_PATH = '/var/cache/gpu-passthrough/iommu.json'
+KMSG_PATH = '/dev/kmsg'
+
+DRIVER_MARKERS = [
+    ('DMAR: IOMMU enabled', 'dmar'),
+    ('DMAR: Intel(R) Virtualization Technology for Directed I/O', 'dmar'),
+    ('AMD-Vi: Found IOMMU', 'amd-vi'),
+    ('AMD-Vi: Interrupt remapping enabled', 'amd-vi'),
+    ('AMD-Vi: IOMMU performance counters supported', 'amd-vi'),
+    ('Detected AMD IOMMU', 'amd-vi'),
+]
+INTERRUPT_REMAPPING_MARKERS = [
+    ('Enabled IRQ remapping', True),
+    ('AMD-Vi: Interrupt remapping enabled', True),
+    ('IRQ remapping was disabled', False),
+    ('Not enabling interrupt remapping', False),
+    ('Failed to enable irq remapping', False),
+]
+PASSTHROUGH_MARKERS = [
+    ('Default domain type: Passthrough', True),
+    ('Default domain type: Translated', False),
+]
+# /sys/class/iommu entry name prefixes
+UNIT_DRIVERS = [('dmar', 'dmar'), ('ivhd', 'amd-vi')]
+
+
+class IommuStatus:
+    """Structured IOMMU state of one boot."""
+
+    def __init__(self, driver=None, interrupt_remapping=None, passthrough=None, group_count=0, units=None,
+                 source=None, lines_scanned=0):
+        self.driver = driver
+        self.interrupt_remapping = interrupt_remapping
+        self.passthrough = passthrough
+        self.group_count = group_count
+        self.units = list(units or [])
+        self.source = source
+        self.lines_scanned = lines_scanned
+
+    @property
+    def enabled(self):
+        """IOMMU groups only exist when the kernel actually uses the IOMMU for DMA remapping."""
+        return self.group_count > 0
+
+    def to_dict(self):
+        return {
+            'enabled': self.enabled,
+            'driver': self.driver,
+            'interrupt_remapping': self.interrupt_remapping,
+            'passthrough': self.passthrough,
+            'group_count': self.group_count,
+            'units': self.units,
+            'source': self.source,
+            'lines_scanned': self.lines_scanned,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data.pop('enabled', None)
+        return cls(**data)
+
+    def summary(self):
+        def flag(value):
+            return 'unknown' if value is None else ('yes' if value else 'no')
+        return (f"driver {self.driver or 'none'}, {self.group_count} groups, {len(self.units)} units, "
+                f"interrupt remapping {flag(self.interrupt_remapping)}, passthrough {flag(self.passthrough)}")
+
+
+def scan_kernel_log(lines):
+    """Scans kernel log lines for IOMMU markers, stopping as soon as every field has a verdict.
+
+    Returns (driver, interrupt_remapping, passthrough, lines_scanned); undecided fields are None.
+    """
+    driver = interrupt_remapping = passthrough = None
+    scanned = 0
+    for line in lines:
+        scanned += 1
+        if driver is None:
+            driver = next((name for marker, name in DRIVER_MARKERS if marker in line), None)
+        if interrupt_remapping is None:
+            interrupt_remapping = next((value for marker, value in INTERRUPT_REMAPPING_MARKERS if marker in line),
+                                       None)
+        if passthrough is None:
+            passthrough = next((value for marker, value in PASSTHROUGH_MARKERS if marker in line), None)
+        if driver is not None and interrupt_remapping is not None and passthrough is not None:
+            break
+    return driver, interrupt_remapping, passthrough, scanned
+
+
+def read_kmsg(path):
+    """Returns an iterator over /dev/kmsg messages that stops once the buffer is drained.
+
+    The device is opened right away, so a missing permission raises here rather than on first use.
+    """
+    return _kmsg_records(os.open(path, os.O_RDONLY | os.O_NONBLOCK))
+
+
+def _kmsg_records(fd):
+    try:
+        while True:
+            try:
+                record = os.read(fd, 8192)
+            except BlockingIOError:
+                return
+            except BrokenPipeError:
+                # The record was overwritten in the ring buffer; the next read continues after it.
+                continue
+            if not record:
+                return
+            yield record.decode(errors='replace').split(';', 1)[-1].split('\n', 1)[0]
+    finally:
+        os.close(fd)
+
+
+def read_log_file(path):
+    """Yields the lines of a saved kernel log (dmesg output or a kmsg dump)."""
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+class IommuDetector:
+    """Determines the IOMMU status from the kernel log and sysfs, once per boot."""
+
+    def __init__(self, transport=None, log_path=None, status_path=DEFAULT_STATUS_PATH, timeout=30):
+        self.transport = transport or LocalTransport()
+        self.log_path = log_path
+        self.timeout = timeout
+        self.cache = BootStatusCache(self.transport, status_path, 'IOMMU', STATUS_VERSION)
+
+    def _scan_kernel_log(self):
+        """Returns (source, scan_kernel_log() result), preferring a supplied file, then /dev/kmsg, then dmesg."""
+        if self.log_path:
+            return self.log_path, scan_kernel_log(read_log_file(self.log_path))
+        if self.transport.is_local:
+            kmsg = self.transport.path(KMSG_PATH)
+            if os.path.exists(kmsg):
+                try:
+                    return KMSG_PATH, scan_kernel_log(read_kmsg(kmsg))
+                except OSError as e:
+                    logger.warning(f"Cannot read {KMSG_PATH} ({e}); falling back to dmesg.")
+        output = self.transport.run('dmesg', timeout=self.timeout, shell=False).stdout.decode(errors='replace')
+        return 'dmesg', scan_kernel_log(output.split('\n'))
+
+    def _count(self, path):
+        try:
+            return sorted(self.transport.listdir(path))
+        except OSError:
+            return []
+
+    def probe(self):
+        """Scans the kernel log and sysfs without using the per-boot cache."""
+        with tracer.span('iommu_status', 'probe') as span:
+            try:
+                source, (driver, interrupt_remapping, passthrough, scanned) = self._scan_kernel_log()
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.warning(f"Kernel log unavailable for IOMMU detection: {e}")
+                source, driver, interrupt_remapping, passthrough, scanned = None, None, None, None, 0
+
+            units = self._count('/sys/class/iommu')
+            groups = self._count('/sys/kernel/iommu_groups')
+            if driver is None:
+                driver = next((name for unit in units for prefix, name in UNIT_DRIVERS if unit.startswith(prefix)),
+                              None)
+            span.set(source=source, lines_scanned=scanned)
+        return IommuStatus(driver, interrupt_remapping, passthrough, len(groups), units, source, scanned)
+
+    def detect(self, refresh=False):
+        """Returns this boot's IOMMU status, reusing the cached result unless refresh is set."""
+        return self.cache.get(self.probe, refresh, decode=IommuStatus.from_dict, encode=IommuStatus.to_dict)
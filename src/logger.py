@@ -1,25 +1,133 @@
+import atexit
+import datetime
+import gzip
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import threading
 
-def setup_logger():
-    """Sets up the logger."""
-    logger = logging.getLogger('gpu_passthrough')
-    logger.setLevel(logging.INFO)
-    
-    # Console handler
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    
-    # File handler
-    fh = logging.FileHandler('logs/gpu_passthrough.log')
-    fh.setLevel(logging.INFO)
-    
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    ch.setFormatter(formatter)
-    fh.setFormatter(formatter)
-    
-    logger.addHandler(ch)
-    logger.addHandler(fh)
-    
+LOGGER_NAME = 'gpu_passthrough'
+DEFAULT_LOG_FILE = 'logs/gpu_passthrough.log'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_lock = threading.RLock()
+_state = {'listener': None, 'handler': None, 'log_dir': os.path.dirname(DEFAULT_LOG_FILE)}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'artifact', None):
+            entry['artifact'] = record.artifact
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _LazySetupHandler(logging.Handler):
+    """Installs the logging pipeline on the first record, so importing src touches no files."""
+
+    def emit(self, record):
+        with _lock:
+            if _state['handler'] is None:
+                setup_logger()
+            handler = _state['handler']
+        handler.handle(record)
+
+
+def setup_logger(log_file=DEFAULT_LOG_FILE, json_lines=False, max_bytes=DEFAULT_MAX_BYTES,
+                 backup_count=DEFAULT_BACKUP_COUNT, console=True):
+    """Sets up the logger.
+
+    Records are put on a queue and written by a background thread to the console and to a
+    size-rotated log file, in text or JSON-lines format. Calling it again replaces the pipeline.
+    """
+    with _lock:
+        shutdown_logger()
+        log_dir = os.path.dirname(log_file) or '.'
+        os.makedirs(log_dir, exist_ok=True)
+
+        handlers = []
+        if console:
+            ch = logging.StreamHandler()
+            ch.setLevel(logging.INFO)
+            ch.setFormatter(logging.Formatter(TEXT_FORMAT))
+            handlers.append(ch)
+
+        fh = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                  delay=True)
+        fh.setLevel(logging.INFO)
+        fh.setFormatter(JsonFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+        handlers.append(fh)
+
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        handler = logging.handlers.QueueHandler(records)
+
+        for existing in list(logger.handlers):
+            logger.removeHandler(existing)
+        logger.addHandler(handler)
+        _state.update(listener=listener, handler=handler, log_dir=log_dir)
     return logger
 
-logger = setup_logger()
+
+def shutdown_logger():
+    """Flushes queued records and stops the background writer."""
+    with _lock:
+        listener = _state['listener']
+        if listener is None:
+            return
+        if _state['handler'] in logger.handlers:
+            logger.removeHandler(_state['handler'])
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        _state.update(listener=None, handler=None)
+        logger.addHandler(_LazySetupHandler())
+
+
+def write_artifact(key, name, content):
+    """Writes content as a gzip-compressed artifact once per key and returns its path.
+
+    An artifact that already exists for the key is reused, so large dumps are stored once per
+    boot instead of once per run. Returns None if the artifact cannot be written.
+    """
+    directory = os.path.join(_state['log_dir'], 'artifacts', key)
+    path = os.path.join(directory, f'{name}.txt.gz')
+    if os.path.exists(path):
+        return path
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.')
+        try:
+            with os.fdopen(fd, 'wb') as f, gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                gz.write(content.encode())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning(f"Failed to write log artifact {path}: {e}")
+        return None
+    return path
+
+
+logger = logging.getLogger(LOGGER_NAME)
+logger.setLevel(logging.INFO)
+logger.addHandler(_LazySetupHandler())
+atexit.register(shutdown_logger)
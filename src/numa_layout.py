@@ -0,0 +1,257 @@
+import posixpath
+import re
+from src.logger import logger
+from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+NODE_DIR = '/sys/devices/system/node'
+CPU_DIR = '/sys/devices/system/cpu'
+PCI_DEVICES_DIR = '/sys/bus/pci/devices'
+GIGANTIC_PAGES_DIR = '/sys/kernel/mm/hugepages/hugepages-1048576kB'
+
+DEFAULT_RESERVED_CORES = 1
+# Memory left to the host on each node, in MiB
+HOST_MEMORY_MIB = 2048
+# Hugepage size name -> (size in MiB, Proxmox 'hugepages' value)
+HUGEPAGE_SIZES = {'2M': (2, '2'), '1G': (1024, '1024')}
+MEMTOTAL_LINE = re.compile(r'MemTotal:\s+(\d+)\s*kB')
+
+
+def parse_cpulist(text):
+    """Parses a kernel cpulist such as '0-3,8-11' into a sorted list of CPU numbers."""
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def format_cpulist(cpus):
+    """Formats CPU numbers as a compact cpulist such as '0-3,8-11'."""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f"{first}-{last}" if last != first else f"{first}" for first, last in ranges)
+
+
+class NumaTopology:
+    """NUMA nodes with their CPUs and memory, and the SMT sibling groups (physical cores) of the CPUs."""
+
+    def __init__(self, nodes, cores, gigantic_pages=False):
+        # nodes: {node: {'cpus': [cpu, ...], 'memory_mib': int}}; cores: sorted tuples of sibling CPUs
+        self.nodes = nodes
+        self.cores = cores
+        self.gigantic_pages = gigantic_pages
+        self.node_by_cpu = {cpu: node for node, info in nodes.items() for cpu in info['cpus']}
+
+    @classmethod
+    def read(cls, transport=None):
+        """Reads the topology from sysfs (and /proc/meminfo when the host has no node directory)."""
+        transport = transport or LocalTransport()
+        with tracer.span('numa_topology', 'probe') as span:
+            online = parse_cpulist(_read(transport, posixpath.join(CPU_DIR, 'online')) or '0')
+            nodes = {}
+            try:
+                names = transport.listdir(NODE_DIR)
+            except OSError:
+                names = []
+            for name in names:
+                if not re.fullmatch(r'node\d+', name):
+                    continue
+                cpulist = _read(transport, posixpath.join(NODE_DIR, name, 'cpulist'))
+                meminfo = _read(transport, posixpath.join(NODE_DIR, name, 'meminfo'))
+                nodes[int(name[4:])] = {
+                    'cpus': [cpu for cpu in parse_cpulist(cpulist or '') if cpu in online],
+                    'memory_mib': _memtotal_mib(meminfo),
+                }
+            if not nodes:
+                nodes[0] = {'cpus': online, 'memory_mib': _memtotal_mib(_read(transport, '/proc/meminfo'))}
+
+            cores = set()
+            for cpu in online:
+                siblings = _read(transport, posixpath.join(CPU_DIR, f'cpu{cpu}', 'topology', 'thread_siblings_list'))
+                threads = [sibling for sibling in parse_cpulist(siblings or str(cpu)) if sibling in online]
+                cores.add(tuple(threads or [cpu]))
+
+            cpuinfo = _read(transport, '/proc/cpuinfo') or ''
+            gigantic = transport.exists(GIGANTIC_PAGES_DIR) or bool(re.search(r'\bpdpe1gb\b', cpuinfo))
+            span.set(nodes=len(nodes), cpus=len(online), cores=len(cores))
+        return cls(dict(sorted(nodes.items())), sorted(cores), gigantic)
+
+    def node_cores(self, node):
+        """Returns the physical cores whose first thread is on the node, in CPU order."""
+        return [core for core in self.cores if self.node_by_cpu.get(core[0]) == node]
+
+    def to_dict(self):
+        return {
+            'nodes': {str(node): {'cpus': format_cpulist(info['cpus']), 'memory_mib': info['memory_mib']}
+                      for node, info in self.nodes.items()},
+            'cores': len(self.cores),
+            'threads_per_core': max((len(core) for core in self.cores), default=1),
+            'gigantic_pages': self.gigantic_pages,
+        }
+
+
+def device_locality(transport, bdf, topology):
+    """Returns the NUMA node of a PCI device, falling back to the node of its local CPUs, then the first node."""
+    node = _read(transport, posixpath.join(PCI_DEVICES_DIR, bdf, 'numa_node'))
+    if node is not None and node.lstrip('-').isdigit() and int(node) in topology.nodes:
+        return int(node)
+    local_cpus = parse_cpulist(_read(transport, posixpath.join(PCI_DEVICES_DIR, bdf, 'local_cpulist')) or '')
+    nodes = sorted({topology.node_by_cpu[cpu] for cpu in local_cpus if cpu in topology.node_by_cpu})
+    return nodes[0] if nodes else min(topology.nodes)
+
+
+class VmLayout:
+    """CPU pinning and hugepage-backed memory of one passthrough VM, local to its GPU's NUMA node."""
+
+    def __init__(self, gpu, node, cpus, memory_mib, hugepage_size):
+        self.gpu = gpu
+        self.node = node
+        self.cpus = cpus
+        self.memory_mib = memory_mib
+        self.hugepage_size = hugepage_size
+
+    @property
+    def pages(self):
+        return self.memory_mib // HUGEPAGE_SIZES[self.hugepage_size][0]
+
+    def proxmox_config(self):
+        """Returns the qm config lines for the VM, sorted by key like `qm config` prints them."""
+        lines = {
+            'affinity': format_cpulist(self.cpus),
+            'cores': str(len(self.cpus)),
+            'cpu': 'host',
+            'hostpci0': f"{self.gpu.rsplit('.', 1)[0]},pcie=1",
+            'hugepages': HUGEPAGE_SIZES[self.hugepage_size][1],
+            'machine': 'q35',
+            'memory': str(self.memory_mib),
+            'numa': '1',
+            'numa0': f"cpus=0-{len(self.cpus) - 1},hostnodes={self.node},memory={self.memory_mib},policy=bind",
+            'sockets': '1',
+        }
+        return [f"{key}: {value}" for key, value in sorted(lines.items())]
+
+    def to_dict(self):
+        return {
+            'gpu': self.gpu,
+            'node': self.node,
+            'cpus': format_cpulist(self.cpus),
+            'memory_mib': self.memory_mib,
+            'hugepage_size': self.hugepage_size,
+            'hugepages': self.pages,
+            'proxmox_config': self.proxmox_config(),
+        }
+
+
+class NumaPlan:
+    """One VmLayout per passthrough GPU plus the hugepage kernel parameters they need."""
+
+    def __init__(self, topology, vms, hugepage_size):
+        self.topology = topology
+        self.vms = vms
+        self.hugepage_size = hugepage_size
+
+    def pages_per_node(self):
+        pages = {}
+        for vm in self.vms:
+            pages[vm.node] = pages.get(vm.node, 0) + vm.pages
+        return dict(sorted(pages.items()))
+
+    def kernel_parameters(self):
+        """Returns the hugepage boot parameters, reserving the pages on the GPUs' nodes on NUMA hosts."""
+        pages = self.pages_per_node()
+        if not pages:
+            return []
+        if len(self.topology.nodes) == 1:
+            count = str(sum(pages.values()))
+        else:
+            count = ','.join(f"{node}:{number}" for node, number in pages.items())
+        return [f"default_hugepagesz={self.hugepage_size}", f"hugepagesz={self.hugepage_size}", f"hugepages={count}"]
+
+    def proxmox_snippets(self):
+        """Returns the VM config snippets as text, one commented block per GPU."""
+        blocks = []
+        for vm in self.vms:
+            blocks.append('\n'.join([f"# GPU {vm.gpu} on NUMA node {vm.node}"] + vm.proxmox_config()))
+        return '\n\n'.join(blocks) + '\n' if blocks else ''
+
+    def to_dict(self):
+        return {
+            'topology': self.topology.to_dict(),
+            'hugepage_size': self.hugepage_size,
+            'kernel_parameters': self.kernel_parameters(),
+            'vms': [vm.to_dict() for vm in self.vms],
+        }
+
+
+def plan_vms(topology, gpus, nodes, memory_mib, cores=None, reserved_cores=DEFAULT_RESERVED_CORES,
+             hugepage_size='auto'):
+    """Plans one VM per GPU BDF. `nodes` maps each BDF to its NUMA node.
+
+    On every node the first `reserved_cores` physical cores stay with the host; the remaining cores
+    are split evenly, whole cores with all their SMT siblings, between the node's GPUs in BDF order.
+    `cores` caps the physical cores per VM. Memory is rounded up to whole hugepages.
+    """
+    if hugepage_size == 'auto':
+        hugepage_size = '1G' if topology.gigantic_pages and memory_mib >= 1024 else '2M'
+    if hugepage_size not in HUGEPAGE_SIZES:
+        raise ConfigurationError(f"Unsupported hugepage size '{hugepage_size}' (use {', '.join(HUGEPAGE_SIZES)}).")
+    page_mib = HUGEPAGE_SIZES[hugepage_size][0]
+    memory_mib = -(-memory_mib // page_mib) * page_mib
+
+    by_node = {}
+    for gpu in sorted(gpus):
+        by_node.setdefault(nodes[gpu], []).append(gpu)
+
+    vms = []
+    for node, node_gpus in sorted(by_node.items()):
+        available = topology.node_cores(node)[reserved_cores:]
+        share = len(available) // len(node_gpus)
+        if cores:
+            share = min(share, cores)
+        if share < 1:
+            raise ConfigurationError(
+                f"NUMA node {node} has {len(available)} free cores for {len(node_gpus)} passthrough VMs."
+            )
+        free_mib = topology.nodes[node]['memory_mib'] - HOST_MEMORY_MIB
+        if memory_mib * len(node_gpus) > free_mib:
+            raise ConfigurationError(
+                f"NUMA node {node} has {max(free_mib, 0)} MiB for guests; "
+                f"{len(node_gpus)} VMs of {memory_mib} MiB do not fit."
+            )
+        for index, gpu in enumerate(node_gpus):
+            assigned = available[index * share:(index + 1) * share]
+            vms.append(VmLayout(gpu, node, sorted(cpu for core in assigned for cpu in core), memory_mib,
+                                hugepage_size))
+    return NumaPlan(topology, vms, hugepage_size)
+
+
+def plan_for_gpus(transport, gpus, memory_mib, cores=None, reserved_cores=DEFAULT_RESERVED_CORES,
+                  hugepage_size='auto'):
+    """Reads the topology and the GPUs' locality from the host and plans their VMs."""
+    topology = NumaTopology.read(transport)
+    nodes = {gpu: device_locality(transport, gpu, topology) for gpu in gpus}
+    plan = plan_vms(topology, gpus, nodes, memory_mib, cores, reserved_cores, hugepage_size)
+    for vm in plan.vms:
+        logger.info(f"GPU {vm.gpu}: NUMA node {vm.node}, CPUs {format_cpulist(vm.cpus)}, "
+                    f"{vm.memory_mib} MiB in {vm.pages} x {vm.hugepage_size} hugepages")
+    return plan
+
+
+def _read(transport, path):
+    try:
+        return transport.read_file(path).strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _memtotal_mib(meminfo):
+    match = MEMTOTAL_LINE.search(meminfo or '')
+    return int(match.group(1)) // 1024 if match else 0
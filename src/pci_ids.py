@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from src.logger import logger
+
+PCI_IDS_PATHS = ['/usr/share/misc/pci.ids', '/usr/share/hwdata/pci.ids', '/usr/share/pci.ids']
+DEFAULT_INDEX_PATH = '/var/cache/gpu-passthrough/pci.ids.idx'
+
+INDEX_MAGIC = b'PCIIDX\0\0'
+INDEX_VERSION = 1
+# magic, version, source mtime_ns, source size, vendor count, device count, string pool size
+HEADER = struct.Struct('<8sIQQIII')
+# vendor ID, name offset, index of its first device, device count
+VENDOR = struct.Struct('<HxxIII')
+# device ID, name offset
+DEVICE = struct.Struct('<HxxI')
+
+
+def parse_pci_ids(lines):
+    """Returns {vendor: (name, {device: name})} from pci.ids lines; subsystems and classes are skipped."""
+    vendors = {}
+    devices = None
+    for line in lines:
+        if not line or line.startswith('#') or line.startswith('\t\t'):
+            continue
+        if line.startswith('C '):
+            break
+        if line.startswith('\t'):
+            if devices is not None:
+                device_id, _, name = line[1:].partition('  ')
+                try:
+                    devices[int(device_id, 16)] = name.strip()
+                except ValueError:
+                    continue
+            continue
+        vendor_id, _, name = line.partition('  ')
+        try:
+            vendor = int(vendor_id, 16)
+        except ValueError:
+            devices = None
+            continue
+        devices = {}
+        vendors[vendor] = (name.strip(), devices)
+    return vendors
+
+
+def build_index(vendors, mtime_ns=0, size=0):
+    """Serializes parse_pci_ids() output: header, sorted vendor and device tables, then the string pool."""
+    pool = bytearray()
+    offsets = {}
+
+    def intern(name):
+        if name not in offsets:
+            offsets[name] = len(pool)
+            pool.extend(name.encode('utf-8') + b'\0')
+        return offsets[name]
+
+    vendor_table = bytearray()
+    device_table = bytearray()
+    device_count = 0
+    for vendor in sorted(vendors):
+        name, devices = vendors[vendor]
+        vendor_table += VENDOR.pack(vendor, intern(name), device_count, len(devices))
+        for device in sorted(devices):
+            device_table += DEVICE.pack(device, intern(devices[device]))
+        device_count += len(devices)
+
+    header = HEADER.pack(INDEX_MAGIC, INDEX_VERSION, mtime_ns, size, len(vendors), device_count, len(pool))
+    return header + vendor_table + device_table + bytes(pool)
+
+
+def _search(buffer, table_offset, entry, low, high, key):
+    """Binary-searches entries [low, high) of a table sorted by its leading 16-bit ID."""
+    while low < high:
+        middle = (low + high) // 2
+        value = entry.unpack_from(buffer, table_offset + middle * entry.size)
+        if value[0] < key:
+            low = middle + 1
+        elif value[0] > key:
+            high = middle
+        else:
+            return value
+    return None
+
+
+class PciIds:
+    """Vendor and device names from a compiled, memory-mapped pci.ids index."""
+
+    def __init__(self, buffer, source=None, index_path=None):
+        self.buffer = buffer
+        self.source = source
+        self.index_path = index_path
+        magic, version, self.mtime_ns, self.size, self.vendor_count, self.device_count, _ = \
+            HEADER.unpack_from(buffer)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("not a pci.ids index")
+        self.vendors_offset = HEADER.size
+        self.devices_offset = self.vendors_offset + self.vendor_count * VENDOR.size
+        self.pool_offset = self.devices_offset + self.device_count * DEVICE.size
+
+    def _string(self, offset):
+        start = self.pool_offset + offset
+        return bytes(self.buffer[start:self.buffer.find(b'\0', start)]).decode('utf-8', errors='replace')
+
+    def _vendor(self, vendor):
+        return _search(self.buffer, self.vendors_offset, VENDOR, 0, self.vendor_count, int(vendor, 16))
+
+    def vendor(self, vendor):
+        """Returns the vendor name for a hex vendor ID, or None."""
+        entry = self._vendor(vendor)
+        return self._string(entry[1]) if entry else None
+
+    def device(self, vendor, device):
+        """Returns the device name for hex vendor and device IDs, or None."""
+        entry = self._vendor(vendor)
+        if entry is None:
+            return None
+        _, _, first, count = entry
+        found = _search(self.buffer, self.devices_offset, DEVICE, first, first + count, int(device, 16))
+        return self._string(found[1]) if found else None
+
+    def describe(self, vendor, device):
+        """Returns an lspci-style description ('<vendor> <device>'), or None for an unknown vendor."""
+        vendor_name = self.vendor(vendor)
+        if vendor_name is None:
+            return None
+        return f"{vendor_name} {self.device(vendor, device) or f'Device {device}'}"
+
+    def current(self):
+        """True if the source file is unchanged since the index was built."""
+        try:
+            stat = os.stat(self.source)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == (self.mtime_ns, self.size)
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    @classmethod
+    def open(cls, source, index_path):
+        """Maps the index of a pci.ids file, (re)building it first if it is missing or stale."""
+        stat = os.stat(source)
+        try:
+            index = cls._map(index_path, source)
+            if (index.mtime_ns, index.size) == (stat.st_mtime_ns, stat.st_size):
+                return index
+            index.close()
+        except (OSError, ValueError, struct.error):
+            pass
+
+        with open(source, 'r', encoding='utf-8', errors='replace') as f:
+            data = build_index(parse_pci_ids(line.rstrip('\n') for line in f), stat.st_mtime_ns, stat.st_size)
+        try:
+            _write_atomic(index_path, data)
+        except OSError as e:
+            logger.warning(f"Cannot write pci.ids index {index_path} ({e}); using it from memory.")
+            return cls(data, source)
+        logger.info(f"Compiled {source} into {index_path} ({len(data)} bytes).")
+        return cls._map(index_path, source)
+
+    @classmethod
+    def _map(cls, index_path, source):
+        with open(index_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buffer, source, index_path)
+        except (ValueError, struct.error):
+            buffer.close()
+            raise
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.pci.ids.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def load_pci_ids(root='/', index_path=DEFAULT_INDEX_PATH):
+    """Returns the PciIds for the pci.ids under root, or None if there is none.
+
+    The mapped index is shared within the process and rebuilt when the source file changes.
+    """
+    source = next((path for path in (os.path.join(root, candidate.lstrip('/')) for candidate in PCI_IDS_PATHS)
+                   if os.path.isfile(path)), None)
+    if source is None:
+        return None
+    with _lock:
+        index = _indexes.get(source)
+        if index is not None and index.current():
+            return index
+        try:
+            index = PciIds.open(source, os.path.join(root, index_path.lstrip('/')))
+        except OSError as e:
+            logger.warning(f"Cannot read {source}: {e}")
+            return None
+        _indexes[source] = index
+        return index
@@ -0,0 +1,158 @@
+import os
+
+GPU_CLASSES = ('0300', '0302')
+BRIDGE_CLASS_PREFIX = '06'
+
+
+def full_bdf(slot):
+    """Returns a domain-qualified BDF (e.g. '0000:0e:00.0') for an lspci slot."""
+    return slot if slot.count(':') == 2 else f"0000:{slot}"
+
+
+def read_iommu_groups(root='/'):
+    """Maps each BDF to its IOMMU group number from /sys/kernel/iommu_groups."""
+    base = os.path.join(root, 'sys', 'kernel', 'iommu_groups')
+    groups = {}
+    try:
+        group_names = os.listdir(base)
+    except OSError:
+        return groups
+    for group in group_names:
+        try:
+            members = os.listdir(os.path.join(base, group, 'devices'))
+        except OSError:
+            continue
+        for bdf in members:
+            groups[bdf] = int(group) if group.isdigit() else group
+    return groups
+
+
+class PciDevice:
+    def __init__(self, bdf, pci_class, vendor, device, description, iommu_group=None, boot_vga=False):
+        self.bdf = bdf
+        self.pci_class = pci_class
+        self.vendor = vendor
+        self.device = device
+        self.description = description
+        self.iommu_group = iommu_group
+        self.boot_vga = boot_vga
+
+    @property
+    def pci_id(self):
+        return f"{self.vendor}:{self.device}"
+
+    @property
+    def slot(self):
+        """Returns the domain-qualified bus:device part of the BDF."""
+        return self.bdf.rsplit('.', 1)[0]
+
+    @property
+    def is_gpu(self):
+        return self.pci_class in GPU_CLASSES
+
+    @property
+    def is_bridge(self):
+        return self.pci_class.startswith(BRIDGE_CLASS_PREFIX)
+
+
+class PciTopology:
+    """PCI devices indexed by BDF, vendor:device ID, class, slot and IOMMU group."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.by_bdf = {}
+        self.by_id = {}
+        self.by_class = {}
+        self.by_slot = {}
+        self.by_group = {}
+        for device in devices:
+            self.by_bdf[device.bdf] = device
+            self.by_id.setdefault(device.pci_id, []).append(device)
+            self.by_class.setdefault(device.pci_class, []).append(device)
+            self.by_slot.setdefault(device.slot, []).append(device)
+            if device.iommu_group is not None:
+                self.by_group.setdefault(device.iommu_group, []).append(device)
+
+    @classmethod
+    def from_probe(cls, devices, groups):
+        """Builds the topology from probe device dicts and a BDF to IOMMU group map."""
+        return cls([
+            PciDevice(
+                full_bdf(d['slot']), d['class'], d['vendor'], d['device'], d['description'],
+                iommu_group=groups.get(full_bdf(d['slot'])), boot_vga=d.get('boot_vga', False)
+            )
+            for d in devices
+        ])
+
+    def get(self, bdf):
+        return self.by_bdf.get(full_bdf(bdf))
+
+    def with_id(self, pci_id):
+        return self.by_id.get(pci_id, [])
+
+    def with_class(self, pci_class):
+        return self.by_class.get(pci_class, [])
+
+    def gpus(self):
+        """Returns every display controller, in BDF order."""
+        return sorted(
+            (device for pci_class in GPU_CLASSES for device in self.with_class(pci_class)),
+            key=lambda device: device.bdf
+        )
+
+    def passthrough_gpus(self):
+        """Returns the GPUs to isolate, leaving the boot VGA device to the host when there are others."""
+        gpus = self.gpus()
+        candidates = [gpu for gpu in gpus if not gpu.boot_vga]
+        return candidates or gpus
+
+    def companions(self, device):
+        """Returns the other functions of the device's slot (e.g. its HDMI audio)."""
+        return [other for other in self.by_slot.get(device.slot, []) if other is not device]
+
+    def group_members(self, device):
+        """Returns every device in the same IOMMU group, or the slot functions if groups are unknown."""
+        if device.iommu_group is None:
+            return self.by_slot.get(device.slot, [device])
+        return self.by_group[device.iommu_group]
+
+    def isolation_devices(self, gpus):
+        """Returns the non-bridge devices to hand to vfio-pci: the GPUs, their slot functions and IOMMU groups."""
+        devices = {}
+        for gpu in gpus:
+            for device in [gpu] + self.companions(gpu) + self.group_members(gpu):
+                if not device.is_bridge:
+                    devices.setdefault(device.bdf, device)
+        return list(devices.values())
+
+    def shared_ids(self, gpus):
+        """Returns {vendor:device ID: [host devices]} for isolated IDs that devices left to the host also have.
+
+        Binding such an ID with `vfio-pci ids=` would take those host devices (e.g. the boot GPU) too.
+        """
+        isolated = {device.bdf for device in self.isolation_devices(gpus)}
+        shared = {}
+        for device in self.isolation_devices(gpus):
+            others = [other for other in self.with_id(device.pci_id) if other.bdf not in isolated]
+            if others:
+                shared[device.pci_id] = others
+        return shared
+
+    def isolation_ids(self, gpus):
+        """Returns the vendor:device IDs that can be bound to vfio-pci by ID without taking host devices."""
+        shared = self.shared_ids(gpus)
+        ids = []
+        for device in self.isolation_devices(gpus):
+            if device.pci_id not in shared and device.pci_id not in ids:
+                ids.append(device.pci_id)
+        return ids
+
+    def override_bdfs(self, gpus):
+        """Returns the BDFs whose ID is shared with a host device; they are bound one by one via driver_override."""
+        shared = self.shared_ids(gpus)
+        return [device.bdf for device in self.isolation_devices(gpus) if device.pci_id in shared]
+
+    def foreign_group_members(self, gpu):
+        """Returns the non-bridge members of the GPU's IOMMU group outside its slot; they are isolated with it."""
+        return [device for device in self.group_members(gpu)
+                if device.slot != gpu.slot and not device.is_bridge]
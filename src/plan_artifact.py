@@ -0,0 +1,111 @@
+import datetime
+import hashlib
+import json
+from src.logger import logger
+from src.bootloader import Bootloader
+from src.configuration_error import ConfigurationError
+from src.hardware_probe import create_probe
+from src.pci_topology import PciTopology
+from src.tracing import tracer
+
+PLAN_VERSION = 1
+
+
+def hardware_class(transport, probe=None):
+    """Returns the facts a plan depends on: CPU vendor, vfio-pci IDs of the GPUs and the bootloader.
+
+    This reads the CPU vendor, the PCI device list and the IOMMU groups, and skips the full
+    hardware discovery and state checks.
+    """
+    with tracer.span('hardware_class', 'probe'):
+        probe = probe or create_probe(transport=transport)
+        devices, _ = probe.pci_devices()
+        topology = PciTopology.from_probe(devices, probe.iommu_groups())
+        try:
+            bootloader = Bootloader.determine_bootloader(transport)
+        except ConfigurationError:
+            bootloader = 'unknown'
+        gpus = topology.passthrough_gpus()
+        hardware = {
+            'cpu_vendor': probe.cpu_vendor(),
+            'gpu_ids': topology.isolation_ids(gpus),
+            'bootloader': bootloader,
+        }
+        # Functions bound by BDF tie the plan to the slot layout, not just the IDs
+        overrides = topology.override_bdfs(gpus)
+        if overrides:
+            hardware['gpu_overrides'] = overrides
+        return hardware
+
+
+def fingerprint(hardware):
+    """Hashes a hardware_class() mapping."""
+    return hashlib.sha256(json.dumps(hardware, sort_keys=True).encode()).hexdigest()
+
+
+class PlanArtifact:
+    """A versioned, serialized remediation plan that can be applied to any host of the same hardware class."""
+
+    def __init__(self, hardware, discrepancies, edits, steps, regeneration, host=None, created=None):
+        self.hardware = hardware
+        self.discrepancies = list(discrepancies)
+        self.edits = edits
+        self.steps = list(steps)
+        self.regeneration = list(regeneration)
+        self.host = host
+        self.created = created or datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self.hardware)
+
+    def to_dict(self):
+        return {
+            'version': PLAN_VERSION,
+            'created': self.created,
+            'host': self.host,
+            'hardware': self.hardware,
+            'fingerprint': self.fingerprint,
+            'discrepancies': self.discrepancies,
+            'edits': self.edits,
+            'steps': self.steps,
+            'regeneration': self.regeneration,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != PLAN_VERSION:
+            raise ConfigurationError(f"Unsupported plan version {data.get('version')} (expected {PLAN_VERSION}).")
+        try:
+            plan = cls(data['hardware'], data['discrepancies'], data['edits'], data['steps'], data['regeneration'],
+                       data.get('host'), data.get('created'))
+        except KeyError as e:
+            raise ConfigurationError(f"Plan is missing field {e}.")
+        if data.get('fingerprint') != plan.fingerprint:
+            raise ConfigurationError("Plan fingerprint does not match its hardware class; the file was modified.")
+        return plan
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+        logger.info(f"Wrote plan for hardware class {self.fingerprint[:12]} to {path}")
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r') as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError) as e:
+            raise ConfigurationError(f"Cannot read plan {path}: {e}")
+
+    def verify(self, transport, probe=None):
+        """Raises ConfigurationError unless the host has the plan's hardware class."""
+        actual = hardware_class(transport, probe)
+        if fingerprint(actual) != self.fingerprint:
+            differences = ', '.join(
+                f"{key} {self.hardware.get(key)!r} != {actual.get(key)!r}"
+                for key in sorted(set(self.hardware) | set(actual)) if self.hardware.get(key) != actual.get(key)
+            )
+            raise ConfigurationError(f"Host does not match the plan's hardware class: {differences}")
+        return actual
@@ -1,14 +1,24 @@
 import json
-import subprocess
-import os
 from src.logger import logger
+from src.check_runner import CheckRunner, DEFAULT_MAX_WORKERS
+from src.check_plan import CheckPlan, DEFAULT_CHECK_TIMEOUT
 from src.hardware_info import HardwareInfo
+from src.hardware_cache import HardwareCache
 from src.configuration_error import ConfigurationError
 
 class SystemPreconditions:
-    def __init__(self, settings_file='config/settings.json'):
+    def __init__(self, settings_file='config/settings.json', max_workers=DEFAULT_MAX_WORKERS,
+                 check_timeout=DEFAULT_CHECK_TIMEOUT, refresh_hardware=False, transport=None):
         self.settings = self.load_settings(settings_file)
         self.actual_state = {}
+        self.refresh_hardware = refresh_hardware
+        self.transport = transport
+        self.check_timeout = check_timeout
+        self.check_runner = CheckRunner(max_workers=max_workers, transport=transport)
+        self.plans = {
+            section: CheckPlan.compile(self.settings[section]['commands'], check_timeout)
+            for section in ('preconditions', 'desired_state')
+        }
 
     @staticmethod
     def load_settings(settings_file):
@@ -19,9 +29,16 @@ class SystemPreconditions:
     def check(self):
         """Checks system preconditions."""
         logger.info("Checking preconditions...")
-        unmet_preconditions = self.check_command_preconditions(self.settings['preconditions']['commands'])
+        unmet_preconditions = self.check_command_preconditions(self.plans['preconditions'])
         
-        hardware_info = HardwareInfo().log_hardware_info()
+        remote = self.transport is not None and not self.transport.is_local
+        if remote:
+            cache = None
+        else:
+            cache = HardwareCache(self.transport)
+        hardware_info = HardwareInfo(cache=cache, transport=self.transport).log_hardware_info(
+            refresh=self.refresh_hardware
+        )
         self.actual_state['cpu_model'] = hardware_info['cpu']['model']
         self.actual_state['gpu_type'] = hardware_info['gpu']['type']
         self.actual_state['gpu_exists'] = hardware_info['gpu']['exists']
@@ -34,45 +51,23 @@ class SystemPreconditions:
         return hardware_info, unmet_preconditions
 
     def check_command_preconditions(self, commands):
-        """Checks command-based preconditions."""
+        """Checks a compiled check plan (or raw settings.json conditions)."""
+        plan = commands if isinstance(commands, CheckPlan) else CheckPlan.compile(commands, self.check_timeout)
+        for check in plan:
+            logger.info(f"Running precondition check: {check.description}")
+
         unmet_preconditions = []
-        for condition in commands:
-            description = condition['description']
-            command = condition['command']
-            expected_output = condition.get('expected_output')
-            expected_output_contains = condition.get('expected_output_contains')
-            optional_expected_output_contains = condition.get('optional_expected_output_contains', [])
-            failure_message = condition['failure_message']
-            
-            logger.info(f"Running precondition check: {description}")
-            
-            if "grep" in command and "modprobe.d" in command:
-                file_path = command.split()[-1]
-                if not os.path.isfile(file_path):
-                    logger.error(f"Precondition check failed: {failure_message}")
-                    unmet_preconditions.append(description)
-                    continue
+        for result in self.check_runner.run(plan):
+            if not result.met:
+                logger.error(f"Precondition check failed: {result.message}")
+                unmet_preconditions.append(result.description)
 
-            try:
-                result = subprocess.check_output(command, shell=True, stderr=subprocess.PIPE).decode().strip()
-                if expected_output and result != expected_output:
-                    logger.error(f"Precondition check failed: {failure_message}")
-                    unmet_preconditions.append(description)
-                if expected_output_contains and expected_output_contains not in result:
-                    if not any(opt in result for opt in optional_expected_output_contains):
-                        logger.error(f"Precondition check failed: {failure_message}")
-                        unmet_preconditions.append(description)
-            except subprocess.CalledProcessError as e:
-                stderr_output = e.stderr.decode().strip() if e.stderr else "No stderr output"
-                logger.error(f"Precondition check failed: {stderr_output}")
-                unmet_preconditions.append(description)
-        
         return unmet_preconditions
 
     def compare_states(self):
         """Compares actual state with desired state."""
         logger.info("Comparing actual state with desired state...")
-        discrepancies = self.check_command_preconditions(self.settings['desired_state']['commands'])
+        discrepancies = self.check_command_preconditions(self.plans['desired_state'])
         
         if discrepancies:
             logger.info("Discrepancies found between actual and desired states:")
@@ -86,4 +81,4 @@ class SystemPreconditions:
     def check_desired_state(self):
         """Checks if the system is in the desired state."""
         logger.info("Checking desired state...")
-        return self.check_command_preconditions(self.settings['desired_state']['commands'])
+        return self.check_command_preconditions(self.plans['desired_state'])
@@ -0,0 +1,126 @@
+import os
+import selectors
+import signal
+import subprocess
+import time
+from collections import deque
+
+DEFAULT_TAIL_LINES = 200
+READ_SIZE = 65536
+MAX_LINE_BYTES = 65536
+KILL_GRACE_SECONDS = 5
+
+
+class CommandResult:
+    """Outcome of a streamed command; only the last lines of each stream are kept."""
+
+    def __init__(self, command, returncode, duration, stdout_tail, stderr_tail, output_bytes, timed_out=False):
+        self.command = command
+        self.returncode = returncode
+        self.duration = duration
+        self.stdout_tail = stdout_tail
+        self.stderr_tail = stderr_tail
+        self.output_bytes = output_bytes
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def stdout(self):
+        return '\n'.join(self.stdout_tail)
+
+    @property
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+
+def _kill_group(process):
+    """Terminates the whole process group, escalating to SIGKILL after a grace period."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(KILL_GRACE_SECONDS)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def stream_process(args, command=None, shell=False, env=None, input=None, timeout=None, on_line=None,
+                   tail_lines=DEFAULT_TAIL_LINES):
+    """Runs a process in its own group, passing each output line to on_line(stream, line) as it arrives.
+
+    Lines longer than MAX_LINE_BYTES are split, so memory stays bounded whatever the output looks like.
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(
+        args, shell=shell, env=env, start_new_session=True,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if input is not None:
+        try:
+            process.stdin.write(input)
+        except BrokenPipeError:
+            pass
+        process.stdin.close()
+
+    tails = {'stdout': deque(maxlen=tail_lines), 'stderr': deque(maxlen=tail_lines)}
+    partial = {'stdout': b'', 'stderr': b''}
+    output_bytes = 0
+    timed_out = False
+
+    def emit(name, raw):
+        line = raw.decode(errors='replace').rstrip('\r')
+        tails[name].append(line)
+        if on_line:
+            on_line(name, line)
+
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+    selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+    try:
+        while selector.get_map():
+            remaining = None if timeout is None else timeout - (time.monotonic() - start)
+            if remaining is not None and remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                name = key.data
+                chunk = os.read(key.fileobj.fileno(), READ_SIZE)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                output_bytes += len(chunk)
+                *lines, partial[name] = (partial[name] + chunk).split(b'\n')
+                for raw in lines:
+                    emit(name, raw)
+                while len(partial[name]) >= MAX_LINE_BYTES:
+                    emit(name, partial[name][:MAX_LINE_BYTES])
+                    partial[name] = partial[name][MAX_LINE_BYTES:]
+    finally:
+        selector.close()
+
+    for name, raw in partial.items():
+        if raw:
+            emit(name, raw)
+
+    if not timed_out:
+        remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+        try:
+            process.wait(remaining)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+    if timed_out:
+        _kill_group(process)
+    process.stdout.close()
+    process.stderr.close()
+
+    return CommandResult(
+        command if command is not None else args, process.wait(), time.monotonic() - start,
+        list(tails['stdout']), list(tails['stderr']), output_bytes, timed_out
+    )
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import posixpath
+import threading
+from src.logger import logger
+from src.initramfs import InitramfsBuilder
+from src.transport import LocalTransport
+from src.tracing import tracer
+
+DEFAULT_STATE_PATH = '/var/lib/gpu-passthrough/regeneration.json'
+INITRD_PATTERN = '/boot/initrd.img-*'
+
+
+class RegenerationStep:
+    """A rebuild command and its inputs. Per-kernel steps run `command` once per installed kernel ({kernel}).
+
+    `inputs` are hashed to decide whether the step must run. `reads` and `outputs` only order the
+    steps in the remediation graph: a step runs after every step whose outputs it reads.
+    """
+
+    def __init__(self, name, command, inputs, estimate=1.0, per_kernel=False, reads=(), outputs=()):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.estimate = estimate
+        self.per_kernel = per_kernel
+        self.reads = list(reads)
+        self.outputs = list(outputs)
+
+
+REGENERATION_STEPS = {
+    'bootloader': RegenerationStep('bootloader', 'update-grub', ['/etc/default/grub'], estimate=5.0),
+    'initramfs': RegenerationStep('initramfs', 'update-initramfs -u -k {kernel}',
+                                  ['/etc/modules', '/etc/modprobe.d/*'], estimate=30.0, per_kernel=True,
+                                  outputs=[INITRD_PATTERN]),
+    # Copies the kernels and initrds to the ESPs, so it must wait for the initramfs rebuild
+    'boot-refresh': RegenerationStep('boot-refresh', 'proxmox-boot-tool refresh', ['/etc/kernel/cmdline'],
+                                     estimate=10.0, reads=[INITRD_PATTERN]),
+}
+
+
+class RegenerationTracker:
+    """Schedules bootloader/initramfs regeneration once per run, only when their inputs changed."""
+
+    def __init__(self, transport=None, state_path=DEFAULT_STATE_PATH, steps=None, max_workers=None):
+        self.transport = transport or LocalTransport()
+        self.state_path = state_path
+        self.steps = dict(steps or REGENERATION_STEPS)
+        self.max_workers = max_workers
+        self.scheduled = []
+        self._lock = threading.Lock()
+
+    def schedule(self, name):
+        """Requests a regeneration step at the end of the run."""
+        if name not in self.steps:
+            raise KeyError(f"Unknown regeneration step '{name}'")
+        if name not in self.scheduled:
+            self.scheduled.append(name)
+
+    def _expand(self, pattern):
+        if not pattern.endswith('/*'):
+            return [pattern]
+        directory = pattern[:-2]
+        try:
+            return [posixpath.join(directory, entry) for entry in sorted(self.transport.listdir(directory))]
+        except OSError:
+            return []
+
+    def input_hash(self, step, editor=None):
+        """Hashes the contents of a step's inputs, as they will be after the editor's pending edits."""
+        paths = sorted(set(path for pattern in step.inputs for path in self._expand(pattern)))
+        if editor is not None:
+            paths = sorted(set(paths) | {
+                path for path in editor.paths()
+                if any(path == pattern or (pattern.endswith('/*') and posixpath.dirname(path) == pattern[:-2])
+                       for pattern in step.inputs)
+            })
+
+        digest = hashlib.sha256()
+        for path in paths:
+            if editor is not None and path in editor.paths():
+                content = '\n'.join(editor.render(path)[1]) + '\n'
+            else:
+                try:
+                    content = self.transport.read_file(path)
+                except (FileNotFoundError, IsADirectoryError):
+                    continue
+                except (OSError, UnicodeDecodeError):
+                    content = '<unreadable>'
+            digest.update(f"{path}\0{content}\0".encode())
+        return digest.hexdigest()
+
+    def load_state(self):
+        try:
+            return json.loads(self.transport.read_file(self.state_path))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable regeneration state {self.state_path}: {e}")
+            return {}
+
+    def save_state(self, state):
+        try:
+            self.transport.makedirs(os.path.dirname(self.state_path))
+            self.transport.replace_file(self.state_path, json.dumps(state, indent=2, sort_keys=True) + '\n')
+        except OSError as e:
+            logger.warning(f"Failed to record regeneration state {self.state_path}: {e}")
+
+    def _builder(self, step):
+        return InitramfsBuilder(self.transport, step.command, self.max_workers)
+
+    def _is_current(self, state, step, digest):
+        return lambda version: state.get(f"{step.name}:{version}") == digest
+
+    def _mark_current(self, name, key, digest):
+        with self._lock:
+            state = self.load_state()
+            state[key] = digest
+            self.save_state(state)
+
+    def commands(self, step, editor=None):
+        """Returns the commands a step would run now: one per stale kernel for per-kernel steps."""
+        if not step.per_kernel:
+            return [step.command]
+        digest = self.input_hash(step, editor)
+        stale = self._builder(step).stale(self._is_current(self.load_state(), step, digest))
+        return [step.command.format(kernel=version) for version in stale]
+
+    def pending(self, editor=None):
+        """Returns the scheduled steps whose inputs changed since their last successful build.
+
+        Per-kernel steps are pending while any installed kernel's image is missing or built from other inputs.
+        """
+        state = self.load_state()
+        pending = []
+        for name in self.scheduled:
+            step = self.steps[name]
+            if step.per_kernel:
+                changed = bool(self.commands(step, editor))
+            else:
+                changed = state.get(name) != self.input_hash(step, editor)
+            if changed:
+                pending.append(step)
+            elif step.per_kernel:
+                logger.info(f"Skipping {step.name}: every kernel's image is up to date.")
+            else:
+                logger.info(f"Skipping {step.command}: inputs unchanged since the last build.")
+        return pending
+
+    def run_step(self, name, executor):
+        """Runs one step if its inputs changed since its last build; returns True if it ran."""
+        step = self.steps[name]
+        digest = self.input_hash(step)
+        if step.per_kernel:
+            return self._run_per_kernel(step, digest, executor)
+        if self.load_state().get(name) == digest:
+            logger.info(f"Skipping {step.command}: inputs unchanged since the last build.")
+            return False
+        with tracer.span(step.name, 'regeneration', command=step.command):
+            executor.execute(step.command)
+        self._mark_current(name, name, digest)
+        return True
+
+    def _run_per_kernel(self, step, digest, executor):
+        """Rebuilds every stale kernel in parallel; raises ConfigurationError if any of them fails."""
+        builder = self._builder(step)
+        stale = builder.stale(self._is_current(self.load_state(), step, digest))
+        if not stale:
+            logger.info(f"Skipping {step.name}: every kernel's image is up to date.")
+            return False
+        with tracer.span(step.name, 'regeneration', command=step.command, kernels=len(stale)):
+            builder.run(executor, stale,
+                        lambda version: self._mark_current(step.name, f"{step.name}:{version}", digest))
+        return True
@@ -0,0 +1,168 @@
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.logger import logger
+from src.configuration_error import ConfigurationError
+from src.tracing import tracer
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class RemediationStep:
+    """A unit of remediation work with the host paths it reads and writes.
+
+    `estimate` is the expected duration in seconds, used only to report the critical path.
+    Sinks (bootloader, initramfs) run after every step producing one of their inputs.
+    """
+
+    def __init__(self, name, action, inputs=(), outputs=(), depends_on=(), description=None,
+                 estimate=0.1, sink=False):
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.depends_on = list(depends_on)
+        self.description = description or name
+        self.estimate = estimate
+        self.sink = sink
+
+
+def covers(pattern, path):
+    """True if a path or 'dir/*' pattern covers the given path."""
+    if pattern.endswith('/*'):
+        return posixpath.dirname(path) == pattern[:-2]
+    return pattern == path
+
+
+class RemediationGraph:
+    """Orders remediation steps by their declared dependencies and runs independent steps in parallel."""
+
+    def __init__(self):
+        self.steps = {}
+
+    def add(self, step):
+        if step.name in self.steps:
+            raise ConfigurationError(f"Duplicate remediation step '{step.name}'")
+        self.steps[step.name] = step
+        return step
+
+    def __len__(self):
+        return len(self.steps)
+
+    def dependencies(self):
+        """Returns {step: set of steps it must wait for}.
+
+        A step waits for its explicit dependencies, for every step producing one of its inputs,
+        and for earlier steps writing the same file.
+        """
+        deps = {name: set() for name in self.steps}
+        ordered = list(self.steps.values())
+        for index, step in enumerate(ordered):
+            for dependency in step.depends_on:
+                if dependency not in self.steps:
+                    raise ConfigurationError(f"Step '{step.name}' depends on unknown step '{dependency}'")
+                deps[step.name].add(dependency)
+            for other in ordered:
+                if other is step:
+                    continue
+                if any(covers(pattern, output) for pattern in step.inputs for output in other.outputs):
+                    deps[step.name].add(other.name)
+            for earlier in ordered[:index]:
+                if set(earlier.outputs) & set(step.outputs):
+                    deps[step.name].add(earlier.name)
+        return deps
+
+    def order(self):
+        """Returns the step names in a dependency-respecting order, stable by insertion order."""
+        deps = self.dependencies()
+        done = set()
+        order = []
+        while len(order) < len(deps):
+            ready = [name for name in deps if name not in done and deps[name] <= done]
+            if not ready:
+                cycle = ', '.join(name for name in deps if name not in done)
+                raise ConfigurationError(f"Remediation steps have a dependency cycle: {cycle}")
+            order.extend(ready)
+            done.update(ready)
+        return order
+
+    def critical_path(self):
+        """Returns (step names, estimated seconds) of the longest dependency chain."""
+        deps = self.dependencies()
+        finish = {}
+        previous = {}
+        for name in self.order():
+            start = max((finish[dependency] for dependency in deps[name]), default=0.0)
+            previous[name] = max(deps[name], key=lambda dependency: finish[dependency], default=None)
+            finish[name] = start + self.steps[name].estimate
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=finish.get)
+        total = finish[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return list(reversed(path)), total
+
+    def describe(self):
+        """Returns human-readable lines for the resolved graph and its critical path."""
+        deps = self.dependencies()
+        lines = []
+        for name in self.order():
+            step = self.steps[name]
+            after = f" after {', '.join(sorted(deps[name]))}" if deps[name] else ""
+            writes = f" -> {', '.join(step.outputs)}" if step.outputs else ""
+            lines.append(f"Step {name}{' (sink)' if step.sink else ''}: {step.description}{writes}{after}")
+        path, total = self.critical_path()
+        if path:
+            lines.append(f"Critical path: {' -> '.join(path)} (~{total:.1f}s estimated)")
+        return lines
+
+    def run(self, max_workers=DEFAULT_MAX_WORKERS):
+        """Runs every step once its dependencies succeeded; re-raises the first failure.
+
+        After a failure no new steps are started, but running steps are allowed to finish.
+        """
+        if not self.steps:
+            return []
+        deps = self.dependencies()
+        self.order()
+        remaining = {name: set(names) for name, names in deps.items()}
+        completed = []
+        failure = None
+        lock = threading.Lock()
+
+        def execute(name):
+            step = self.steps[name]
+            with tracer.span(name, 'step', sink=step.sink):
+                step.action()
+            with lock:
+                completed.append(name)
+            return name
+
+        workers = max(1, min(max_workers, len(self.steps)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='remediation') as pool:
+            running = {}
+            while True:
+                if failure is None:
+                    for name in [name for name, waiting in remaining.items() if not waiting]:
+                        del remaining[name]
+                        running[pool.submit(execute, name)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Remediation step {name} failed: {e}")
+                        failure = failure or e
+                        continue
+                    for waiting in remaining.values():
+                        waiting.discard(name)
+
+        if failure is not None:
+            raise failure
+        return completed
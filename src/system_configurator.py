@@ -1,19 +1,46 @@
-import subprocess
 import json
-import os
-from src.command_executor import CommandExecutor
+from src.command_executor import CommandExecutor, DEFAULT_COMMAND_TIMEOUT
 from src.logger import logger
 from src.grub_config import GrubConfig
+from src.bootloader import Bootloader, KERNEL_CMDLINE_PATH
 from src.vfio import VFIO
 from src.preconditions import SystemPreconditions
 from src.configuration_error import ConfigurationError
+from src.transport import LocalTransport
+from src.file_edit import FileEditor
+from src.regeneration import RegenerationTracker
+from src.iommu_status import IommuDetector
+from src.remediation_graph import RemediationGraph, RemediationStep, covers
+from src.change_journal import ChangeJournal
+from src.plan_artifact import PlanArtifact, hardware_class
+from src.numa_layout import DEFAULT_RESERVED_CORES, plan_for_gpus
+from src.gpu_audit import GpuAudit
+from src.tracing import tracer
+
+BLACKLIST_PATH = '/etc/modprobe.d/blacklist.conf'
+VFIO_CONF_PATH = '/etc/modprobe.d/vfio.conf'
+BLACKLISTED_DRIVERS = {
+    'amd': ['radeon', 'amdgpu'],
+    'nvidia': ['nouveau', 'nvidia', 'nvidiafb', 'nvidia_drm'],
+    'intel': ['snd_hda_intel', 'snd_hda_codec_hdmi', 'i915'],
+}
 
 class SystemConfigurator:
-    def __init__(self, dry_run=False, settings_file='config/settings.json'):
-        self.commands = []
-        self.rollback_commands = []
-        self.preconditions = SystemPreconditions(settings_file)
+    def __init__(self, dry_run=False, settings_file='config/settings.json', refresh_hardware=False,
+                 transport=None, command_timeout=DEFAULT_COMMAND_TIMEOUT, total_timeout=None, vm=None):
+        self.graph = RemediationGraph()
+        self.step_specs = []
+        self.transport = transport or LocalTransport()
+        self.executor = CommandExecutor(self.transport, command_timeout=command_timeout,
+                                        total_timeout=total_timeout)
+        self.journal = ChangeJournal(self.transport)
+        self.editor = FileEditor(self.transport, journal=self.journal)
+        self.regeneration = RegenerationTracker(self.transport)
+        self.preconditions = SystemPreconditions(settings_file, refresh_hardware=refresh_hardware,
+                                                 transport=self.transport)
         self.dry_run = dry_run
+        self.vm = vm
+        self.numa_plan = None
         self.settings = self.load_settings(settings_file)
 
     @staticmethod
@@ -22,173 +49,322 @@ class SystemConfigurator:
         with open(settings_file, 'r') as f:
             return json.load(f)
 
-    def configure_system(self):
-        """Configures the system for GPU passthrough."""
+    def configure_system(self, plan_output=None):
+        """Configures the system for GPU passthrough. Returns False if preconditions were not met.
+
+        With plan_output, the planned discrepancies, edits and steps are also saved as a plan file.
+        """
+        self.recover()
         try:
-            hardware_info, unmet_preconditions = self.preconditions.check()
+            with tracer.span('preconditions', 'phase', host=self.transport.host):
+                hardware_info, unmet_preconditions = self.preconditions.check()
             gpu_type = hardware_info['gpu']['type']
 
             if not unmet_preconditions:
-                discrepancies = self.preconditions.compare_states()            
-                self.prepare_commands(discrepancies, hardware_info)
-                self.update_ramfs()  # Add this line to update ramfs    
-                                
-                if self.dry_run:
-                    self.dry_run_commands()
-                else:
-                    for command in self.commands:
-                        CommandExecutor.execute(command)
-                
+                with tracer.span('compare_states', 'phase', host=self.transport.host):
+                    discrepancies = self.preconditions.compare_states()
+                if self.vm:
+                    with tracer.span('numa_plan', 'phase', host=self.transport.host):
+                        self.plan_numa(hardware_info)
+                with tracer.span('prepare_commands', 'phase', host=self.transport.host):
+                    self.prepare_commands(discrepancies, hardware_info)
+                    self.update_ramfs()
+                    self.add_regeneration_steps()
+                if plan_output:
+                    self.build_plan(discrepancies).save(plan_output)
+
+                self.apply()
+
                 logger.info("System configured successfully.")
-                self.check_iommu_enabled()
-                discrepancies = self.preconditions.compare_states()
+                with tracer.span('verify', 'phase', host=self.transport.host):
+                    self.check_iommu_enabled()
+                    discrepancies = self.preconditions.compare_states()
                 if discrepancies:
                     logger.warning("There are discrepancies between the actual and desired states. Please review.")
- 
+                return True
+
             else:
                 logger.warning("Some preconditions were not met. Please resolve the issues and try again.")
+                return False
         except Exception as e:
-            logger.error(f"An error occurred: {e}. Rolling back changes...")
-            for command in self.rollback_commands:
-                CommandExecutor.rollback(command)
+            self.rollback_after(e)
+            raise
+
+    def plan_numa(self, hardware_info):
+        """Plans NUMA-local CPU pinning and hugepages for one VM per passthrough GPU.
+
+        The hugepage kernel parameters join the bootloader step; the Proxmox VM snippets are
+        written to vm['output'] or logged.
+        """
+        gpus = [gpu['bdf'] for gpu in hardware_info['gpu'].get('devices', [])]
+        if not gpus:
+            logger.warning("No passthrough GPUs found; skipping the NUMA plan.")
+            return None
+        self.numa_plan = plan_for_gpus(
+            self.transport, gpus, self.vm['memory_mib'], cores=self.vm.get('cores'),
+            reserved_cores=self.vm.get('reserved_cores', DEFAULT_RESERVED_CORES),
+            hugepage_size=self.vm.get('hugepage_size', 'auto'),
+        )
+        snippets = self.numa_plan.proxmox_snippets()
+        if self.vm.get('output'):
+            with open(self.vm['output'], 'w') as f:
+                f.write(snippets)
+            logger.info(f"Wrote Proxmox VM settings for {len(self.numa_plan.vms)} GPUs to {self.vm['output']}")
+        else:
+            logger.info("Proxmox VM settings:\n" + snippets.rstrip('\n'))
+        return self.numa_plan
+
+    def audit(self, output=None, fix_irq_affinity=False):
+        """Audits the passthrough GPUs (driver, PCIe link, MSI/MSI-X, IRQ affinity) after the reboot.
+
+        The JSON report is written to output, or printed when output is '-'. Returns the AuditReport.
+        """
+        with tracer.span('preconditions', 'phase', host=self.transport.host):
+            hardware_info, _ = self.preconditions.check()
+        gpus = [gpu['bdf'] for gpu in hardware_info['gpu'].get('devices', [])]
+        if not gpus:
+            raise ConfigurationError("No passthrough GPUs found to audit.")
+        with tracer.span('audit', 'phase', host=self.transport.host, fix_irq_affinity=fix_irq_affinity):
+            report = GpuAudit(self.transport, fix_irq_affinity).audit(gpus)
+        report.log()
+        if output == '-':
+            print(report.to_json(), end='', flush=True)
+        elif output:
+            with open(output, 'w') as f:
+                f.write(report.to_json())
+            logger.info(f"Wrote the GPU audit report to {output}")
+        return report
+
+    def rollback_after(self, error):
+        """Restores the files changed by the current run after an error."""
+        logger.error(f"An error occurred: {error}. Rolling back changes...")
+        try:
+            self.restore()
             logger.error("Rollback complete. Please check the system state.")
+        except Exception as rollback_error:
+            logger.error(f"Rollback failed: {rollback_error}")
+
+    def apply(self):
+        """Runs the remediation graph under the change journal, or logs it in dry-run mode."""
+        with tracer.span('apply', 'phase', host=self.transport.host, dry_run=self.dry_run):
+            if self.dry_run:
+                self.dry_run_commands()
+            else:
+                self.journal.begin()
+                self.graph.run()
+                self.journal.commit()
+
+    def build_plan(self, discrepancies):
+        """Returns the current plan as a PlanArtifact stamped with this host's hardware class."""
+        return PlanArtifact(
+            hardware_class(self.transport), discrepancies, self.editor.to_dict(), self.step_specs,
+            [spec['name'] for spec in self.step_specs if spec['kind'] == 'regeneration'],
+            host=self.transport.host
+        )
+
+    def apply_plan(self, plan):
+        """Applies a saved plan without hardware discovery or state checks.
+
+        The host's hardware class is verified against the plan first. The edits are idempotent, so
+        steps whose discrepancy is already fixed on this host leave its files unchanged.
+        """
+        self.recover()
+        with tracer.span('verify_plan', 'phase', host=self.transport.host):
+            plan.verify(self.transport)
+        logger.info(f"Applying plan {plan.fingerprint[:12]} ({len(plan.discrepancies)} discrepancies "
+                    f"from {plan.host or 'unknown host'}).")
+        try:
+            self.editor.load(plan.edits)
+            for spec in plan.steps:
+                self.add_step(spec)
+            self.apply()
+        except Exception as e:
+            self.rollback_after(e)
             raise
+        return True
+
+    def restore(self, record=None):
+        """Restores the files of a journaled run (the current one by default) and rebuilds what depends on them."""
+        restored = self.journal.rollback(record)
+        for name, step in self.regeneration.steps.items():
+            if any(covers(pattern, path) for pattern in step.inputs for path in restored):
+                try:
+                    self.regeneration.run_step(name, self.executor)
+                except Exception as e:
+                    logger.error(f"Files were restored but '{step.command}' failed: {e}. Run it manually.")
+        return restored
+
+    def recover(self):
+        """Rolls back runs that were left open by a crash before making new changes."""
+        if self.dry_run:
+            for record in self.journal.open_runs():
+                logger.warning(f"Run {record['run_id']} was interrupted; it will be rolled back on the next real run.")
+            return
+        for record in self.journal.open_runs():
+            logger.warning(f"Recovering interrupted run {record['run_id']}...")
+            self.restore(record)
+
+    def rollback_last(self):
+        """Undoes the most recent journaled run. Returns False if there is nothing to undo."""
+        record = self.journal.last_run()
+        if record is None:
+            logger.info("No journaled run to roll back.")
+            return False
+        logger.info(f"Rolling back run {record['run_id']} from {record['started']}...")
+        restored = self.restore(record)
+        logger.info(f"Rolled back {len(restored)} files.")
+        return True
 
     def prepare_commands(self, discrepancies, hardware_info):
-        """Prepares the necessary commands based on discrepancies."""
+        """Plans the remediation steps for the discrepancies; nothing is changed until the graph runs."""
         gpu_type = hardware_info['gpu']['type']
+        parameters = []
         for condition in self.settings['desired_state']['commands']:
             description = condition['description']
 
             if description in discrepancies:
                 if "GRUB has IOMMU settings" in description:
-                    grub_config = GrubConfig()
-                    grub_config.backup_grub_config()
-                    self.commands.append(grub_config.modify_grub_config())
-                    self.rollback_commands.append(grub_config.restore_grub_config())
+                    parameters += GrubConfig(transport=self.transport).iommu_parameters()
                 elif "VFIO modules are loaded" in description:
-                    VFIO.ensure_vfio_modules()
+                    VFIO.ensure_vfio_modules(self.editor)
+                    self.add_edit_step('vfio-modules', '/etc/modules', "load the VFIO modules at boot")
                 elif "kvm.conf has Nvidia Card settings" in description and gpu_type == 'nvidia':
-                    vfio_conf_command = self.create_vfio_conf(hardware_info['gpu']['codes'])
-                    self.commands.append(vfio_conf_command)
-                    self.rollback_commands.append("rm /etc/modprobe.d/vfio.conf")
+                    self.create_vfio_conf(hardware_info['gpu']['codes'], hardware_info['gpu'].get('overrides', []))
+                    self.add_edit_step('vfio-conf', VFIO_CONF_PATH, "bind the GPU functions to vfio-pci")
                 elif "AMD drivers are blacklisted" in description and gpu_type == 'amd':
-                    blacklist_command = self.blacklist_drivers('amd')
-                    self.commands.append(blacklist_command)
-                    self.rollback_commands.append(self.unblacklist_drivers('amd'))
+                    self.blacklist_drivers('amd')
                 elif "NVIDIA drivers are blacklisted" in description and gpu_type == 'nvidia':
-                    blacklist_command = self.blacklist_drivers('nvidia')
-                    self.commands.append(blacklist_command)
-                    self.rollback_commands.append(self.unblacklist_drivers('nvidia'))
+                    self.blacklist_drivers('nvidia')
                 elif "Intel drivers are blacklisted" in description and gpu_type == 'intel':
-                    blacklist_command = self.blacklist_drivers('intel')
-                    self.commands.append(blacklist_command)
-                    self.rollback_commands.append(self.unblacklist_drivers('intel'))
+                    self.blacklist_drivers('intel')
+
+        if self.numa_plan is not None:
+            parameters += self.numa_plan.kernel_parameters()
+        if parameters:
+            bootloader = Bootloader.determine_bootloader(self.transport)
+            for spec in self.get_bootloader_specific_commands(bootloader, parameters):
+                self.add_step(spec)
 
-    def get_bootloader_specific_commands(self, bootloader):
-        """Returns bootloader specific commands."""
+    def add_step(self, spec):
+        """Adds a remediation step from its serializable spec; the specs make up a saved plan's steps."""
+        kind = spec.get('kind')
+        name = spec.get('name')
+        if kind == 'edit':
+            path = spec['path']
+            step = RemediationStep(name, lambda: self.editor.apply([path]), outputs=[path],
+                                   description=spec.get('description'))
+        elif kind == 'grub':
+            grub_config = GrubConfig(transport=self.transport)
+            step = RemediationStep(name, lambda: self.apply_grub_config(grub_config),
+                                   outputs=[grub_config.grub_path, grub_config.backup_path],
+                                   description="back up /etc/default/grub and add the kernel parameters")
+        elif kind == 'regeneration' and name in self.regeneration.steps:
+            regeneration = self.regeneration.steps[name]
+            self.regeneration.schedule(name)
+            step = RemediationStep(name, lambda: self.regeneration.run_step(name, self.executor),
+                                   inputs=regeneration.inputs + regeneration.reads,
+                                   outputs=regeneration.outputs, description=regeneration.command,
+                                   estimate=regeneration.estimate, sink=True)
+        else:
+            raise ConfigurationError(f"Unknown remediation step {spec!r}")
+        self.graph.add(step)
+        self.step_specs.append(dict(spec))
+
+    def add_edit_step(self, name, path, description):
+        """Adds a step that writes the queued edits of one file."""
+        self.add_step({'kind': 'edit', 'name': name, 'path': path, 'description': description})
+
+    def apply_grub_config(self, grub_config):
+        """Backs up /etc/default/grub, then writes its queued edits."""
+        self.journal.snapshot(grub_config.backup_path)
+        grub_config.backup_grub_config()
+        self.editor.apply([grub_config.grub_path])
+
+    def add_regeneration_steps(self):
+        """Adds the scheduled bootloader/initramfs rebuilds as sinks after every step writing their inputs."""
+        for name in list(self.regeneration.scheduled):
+            self.add_step({'kind': 'regeneration', 'name': name})
+
+    def get_bootloader_specific_commands(self, bootloader, parameters):
+        """Queues kernel parameters for the bootloader and returns the step specs that write them."""
         if bootloader == "grub-bios":
-            return self.get_grub_bios_commands()
+            return self.get_grub_bios_commands(parameters)
         elif bootloader == "grub-uefi":
-            return self.get_grub_uefi_commands()
+            return self.get_grub_uefi_commands(parameters)
         elif bootloader == "systemd-boot":
-            return self.get_systemd_boot_commands()
+            return self.get_systemd_boot_commands(parameters)
         elif bootloader == "grub-uefi-secure":
-            return self.get_grub_uefi_secure_commands()
+            return self.get_grub_uefi_secure_commands(parameters)
         return []
 
-    def get_grub_bios_commands(self):
-        return [
-            # Add specific commands for GRUB in BIOS/Legacy mode
-        ]
+    def get_grub_bios_commands(self, parameters):
+        """GRUB takes the parameters from /etc/default/grub; update-grub regenerates grub.cfg."""
+        GrubConfig(transport=self.transport).modify_grub_config(self.editor, parameters)
+        self.regeneration.schedule('bootloader')
+        return [{'kind': 'grub', 'name': 'grub-cmdline'}]
 
-    def get_grub_uefi_commands(self):
-        return [
-            # Add specific commands for GRUB in UEFI mode
-        ]
+    def get_grub_uefi_commands(self, parameters):
+        return self.get_grub_bios_commands(parameters)
 
-    def get_grub_uefi_secure_commands(self):
-        return [
-            # Add specific commands for GRUB with Secure Boot in UEFI mode
-        ]
+    def get_grub_uefi_secure_commands(self, parameters):
+        return self.get_grub_bios_commands(parameters)
 
-    def get_systemd_boot_commands(self):
-        return [
-            # Add specific commands for systemd-boot
-        ]
+    def get_systemd_boot_commands(self, parameters):
+        """systemd-boot takes the parameters from /etc/kernel/cmdline; proxmox-boot-tool copies them to the ESPs."""
+        self.editor.add_words(KERNEL_CMDLINE_PATH, parameters, replace_keys=True)
+        self.regeneration.schedule('boot-refresh')
+        return [{'kind': 'edit', 'name': 'kernel-cmdline', 'path': KERNEL_CMDLINE_PATH,
+                 'description': "add the kernel parameters to /etc/kernel/cmdline"}]
 
-    def create_vfio_conf(self, pci_ids):
-        """Creates a configuration file for VFIO to specify PCI IDs to be isolated."""
-        vfio_conf = f"options vfio-pci ids={','.join(pci_ids)}"
-        return f"echo \"{vfio_conf}\" > /etc/modprobe.d/vfio.conf"
+    def create_vfio_conf(self, pci_ids, overrides=()):
+        """Queues the VFIO configuration file that specifies the PCI IDs to be isolated.
+
+        Functions whose ID a host device shares are bound by BDF: writing driver_override before
+        vfio-pci loads makes it claim exactly those functions.
+        """
+        if pci_ids:
+            self.editor.set_line(VFIO_CONF_PATH, "options vfio-pci ", f"options vfio-pci ids={','.join(pci_ids)}")
+        if overrides:
+            writes = '; '.join(f"echo vfio-pci > /sys/bus/pci/devices/{bdf}/driver_override" for bdf in overrides)
+            self.editor.set_line(VFIO_CONF_PATH, "install vfio-pci ",
+                                 f"install vfio-pci {writes}; /sbin/modprobe --ignore-install vfio-pci")
 
     def blacklist_drivers(self, gpu_type):
-        """Blacklists drivers to avoid conflicts with the Proxmox host."""
-        blacklist_commands = []
-        if gpu_type == 'amd':
-            blacklist_commands.extend([
-                "echo \"blacklist radeon\" >> /etc/modprobe.d/blacklist.conf",
-                "echo \"blacklist amdgpu\" >> /etc/modprobe.d/blacklist.conf"
-            ])
-        elif gpu_type == 'nvidia':
-            blacklist_commands.extend([
-                "echo \"blacklist nouveau\" >> /etc/modprobe.d/blacklist.conf",
-                "echo \"blacklist nvidia\" >> /etc/modprobe.d/blacklist.conf",
-                "echo \"blacklist nvidiafb\" >> /etc/modprobe.d/blacklist.conf",
-                "echo \"blacklist nvidia_drm\" >> /etc/modprobe.d/blacklist.conf"
-            ])
-        elif gpu_type == 'intel':
-            blacklist_commands.extend([
-                "echo \"blacklist snd_hda_intel\" >> /etc/modprobe.d/blacklist.conf",
-                "echo \"blacklist snd_hda_codec_hdmi\" >> /etc/modprobe.d/blacklist.conf",
-                "echo \"blacklist i915\" >> /etc/modprobe.d/blacklist.conf"
-            ])
-        return " && ".join(blacklist_commands)
-
-    def unblacklist_drivers(self, gpu_type):
-        """Removes driver blacklists."""
-        unblacklist_commands = []
-        if gpu_type == 'amd':
-            unblacklist_commands.extend([
-                "sed -i '/blacklist radeon/d' /etc/modprobe.d/blacklist.conf",
-                "sed -i '/blacklist amdgpu/d' /etc/modprobe.d/blacklist.conf"
-            ])
-        elif gpu_type == 'nvidia':
-            unblacklist_commands.extend([
-                "sed -i '/blacklist nouveau/d' /etc/modprobe.d/blacklist.conf",
-                "sed -i '/blacklist nvidia/d' /etc/modprobe.d/blacklist.conf",
-                "sed -i '/blacklist nvidiafb/d' /etc/modprobe.d/blacklist.conf",
-                "sed -i '/blacklist nvidia_drm/d' /etc/modprobe.d/blacklist.conf"
-            ])
-        elif gpu_type == 'intel':
-            unblacklist_commands.extend([
-                "sed -i '/blacklist snd_hda_intel/d' /etc/modprobe.d/blacklist.conf",
-                "sed -i '/blacklist snd_hda_codec_hdmi/d' /etc/modprobe.d/blacklist.conf",
-                "sed -i '/blacklist i915/d' /etc/modprobe.d/blacklist.conf"
-            ])
-        return " && ".join(unblacklist_commands)
+        """Queues driver blacklists to avoid conflicts with the Proxmox host."""
+        for driver in BLACKLISTED_DRIVERS.get(gpu_type, []):
+            self.editor.ensure_line(BLACKLIST_PATH, f"blacklist {driver}")
+        self.add_edit_step(f'blacklist-{gpu_type}', BLACKLIST_PATH, f"blacklist the {gpu_type} host drivers")
 
     def check_iommu_enabled(self):
         """Checks if IOMMU is enabled."""
         logger.info("Checking if IOMMU is enabled...")
-        try:
-            iommu_output = subprocess.check_output("dmesg | grep -e IOMMU", shell=True).decode()
-            if "IOMMU" in iommu_output:
-                logger.info("IOMMU is enabled.")
-            else:
-                logger.error("IOMMU is not enabled.")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to check IOMMU: {e.stderr.decode()}")
-            raise ConfigurationError("Failed to check IOMMU.")
+        status = IommuDetector(self.transport).detect()
+        if status.enabled:
+            logger.info(f"IOMMU is enabled: {status.summary()}.")
+        else:
+            logger.error(f"IOMMU is not enabled: {status.summary()}.")
+        return status
 
     def update_ramfs(self):
+        """Schedules an initramfs rebuild; it only runs if its inputs changed since the last build."""
         logger.info("will update ramfs...")
-        update_ramfs_command = "update-initramfs -u"
-        self.commands.append(update_ramfs_command)
+        self.regeneration.schedule('initramfs')
 
     def dry_run_commands(self):
         """Logs the commands that would be executed during a dry run."""
-        logger.info("Dry run: the following commands would be executed:")
-        for command in self.commands:
-            logger.info(f"Command: {command}")
+        logger.info("Dry run: the following file edits would be applied:")
+        for edit in self.editor.describe():
+            logger.info(edit)
+        diff = self.editor.diff()
+        if diff:
+            logger.info("Dry run: resulting file changes:\n" + '\n'.join(diff))
+        logger.info("Dry run: the following steps would be executed:")
+        for line in self.graph.describe():
+            logger.info(line)
+        logger.info("Dry run: the following commands would be executed, in step order:")
+        pending = {step.name: step for step in self.regeneration.pending(self.editor)}
+        for name in self.graph.order():
+            if name in pending:
+                for command in self.regeneration.commands(pending[name], self.editor):
+                    logger.info(f"Command [{name}]: {command}")
         logger.info("Dry run complete: no changes have been made.")
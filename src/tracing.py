@@ -0,0 +1,108 @@
+import json
+import os
+from collections import deque
+import threading
+import time
+from contextlib import contextmanager
+from src.logger import logger
+
+# Oldest spans are dropped beyond this, so long-lived processes do not grow without bound
+DEFAULT_MAX_SPANS = 100000
+
+
+class Span:
+    def __init__(self, name, category, start, args):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = 0.0
+        self.thread_id = threading.get_ident()
+        self.args = dict(args)
+
+    def set(self, **args):
+        """Attaches extra fields (exit code, output bytes, ...) to the span."""
+        self.args.update(args)
+
+
+class Tracer:
+    """Records timed spans around probes, checks and commands, keeping at most max_spans of them."""
+
+    def __init__(self, max_spans=DEFAULT_MAX_SPANS):
+        self.max_spans = max_spans
+        self.enabled = True
+        self.spans = deque(maxlen=max_spans)
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """Times the enclosed block as a span; exceptions are recorded and re-raised."""
+        span = Span(name, category, time.perf_counter() - self.origin, args)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=str(e) or type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - self.origin - span.start
+            if self.enabled:
+                with self._lock:
+                    self.spans.append(span)
+
+    def reset(self):
+        with self._lock:
+            self.spans = deque(maxlen=self.max_spans)
+        self.origin = time.perf_counter()
+
+    def disable(self):
+        """Stops recording spans (they are still timed for their callers) and drops the recorded ones."""
+        self.enabled = False
+        self.reset()
+
+    def export_chrome(self, path):
+        """Writes the spans in Chrome/Perfetto trace-event format."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = [
+            {
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round(span.start * 1e6, 3),
+                'dur': round(span.duration * 1e6, 3),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': span.args,
+            }
+            for span in sorted(spans, key=lambda span: span.start)
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        logger.info(f"Wrote {len(events)} trace events to {path}")
+
+    def summary(self):
+        """Returns {category: (count, total seconds, max seconds)}."""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            count, total, longest = totals.get(span.category, (0, 0.0, 0.0))
+            totals[span.category] = (count + 1, total + span.duration, max(longest, span.duration))
+        return totals
+
+    def log_summary(self):
+        """Logs the run's phases and per-category latency totals."""
+        with self._lock:
+            phases = [span for span in self.spans if span.category == 'phase']
+        if not phases and not self.spans:
+            return
+        logger.info("Latency summary:")
+        for span in sorted(phases, key=lambda span: span.start):
+            logger.info(f"  phase {span.name}: {span.duration:.3f}s")
+        for category, (count, total, longest) in sorted(self.summary().items()):
+            if category != 'phase':
+                logger.info(f"  {category}: {count} spans, {total:.3f}s total, {longest:.3f}s max")
+
+
+tracer = Tracer()
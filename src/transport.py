@@ -0,0 +1,305 @@
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+from src.logger import logger
+from src.process_stream import CommandResult, DEFAULT_TAIL_LINES, stream_process
+
+
+class LocalTransport:
+    """Runs commands and file operations on the local host, optionally inside a root prefix."""
+    is_local = True
+
+    def __init__(self, root='/', bin_dirs=None):
+        self.host = 'localhost'
+        self.root = root
+        self.env = None
+        if bin_dirs:
+            self.env = dict(os.environ, PATH=os.pathsep.join(list(bin_dirs) + [os.environ.get('PATH', '')]))
+
+    def path(self, path):
+        """Maps an absolute host path into the root prefix."""
+        if self.root == '/':
+            return path
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, command, timeout=None, input=None, shell=True):
+        """Runs a command and returns a CompletedProcess, raising CalledProcessError on failure."""
+        args = command if shell else shlex.split(command)
+        return subprocess.run(args, shell=shell, check=True, input=input, timeout=timeout, env=self.env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def stream(self, command, timeout=None, on_line=None, tail_lines=DEFAULT_TAIL_LINES):
+        """Runs a shell command in its own process group, streaming output lines; returns a CommandResult."""
+        return stream_process(command, shell=True, env=self.env, timeout=timeout, on_line=on_line,
+                              tail_lines=tail_lines)
+
+    def read_file(self, path):
+        with open(self.path(path), 'r') as f:
+            return f.read()
+
+    def read_bytes(self, path):
+        with open(self.path(path), 'rb') as f:
+            return f.read()
+
+    def write_file(self, path, content):
+        with open(self.path(path), 'w') as f:
+            f.write(content)
+
+    def replace_file(self, path, content):
+        """Atomically replaces a file: write a temp file, fsync it, then rename it over the target."""
+        path = self.path(path)
+        directory = os.path.dirname(path) or '.'
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o644
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fchmod(f.fileno(), mode)
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def copy_file(self, source, destination):
+        shutil.copy(self.path(source), self.path(destination))
+
+    def remove_file(self, path):
+        os.unlink(self.path(path))
+
+    def exists(self, path):
+        return os.path.exists(self.path(path))
+
+    def makedirs(self, path):
+        os.makedirs(self.path(path), exist_ok=True)
+
+    def listdir(self, path):
+        return os.listdir(self.path(path))
+
+
+class SSHTransport:
+    """Runs commands on a remote host over one multiplexed OpenSSH connection."""
+    is_local = False
+
+    def __init__(self, host, user=None, port=None, ssh_options=None, connect_timeout=10):
+        self.host = host
+        self.destination = f"{user}@{host}" if user else host
+        self.port = port
+        self.ssh_options = list(ssh_options or [])
+        self.connect_timeout = connect_timeout
+        self._control_dir = None
+        self._lock = threading.Lock()
+
+    def _base_args(self):
+        args = ['ssh', '-o', 'BatchMode=yes', '-o', f'ConnectTimeout={self.connect_timeout}']
+        if self._control_dir:
+            args += ['-o', f'ControlPath={os.path.join(self._control_dir, "%C")}']
+        if self.port:
+            args += ['-p', str(self.port)]
+        return args + self.ssh_options
+
+    def open(self):
+        """Starts the control master shared by every command of the run."""
+        with self._lock:
+            if self._control_dir:
+                return
+            self._control_dir = tempfile.mkdtemp(prefix='gpu-passthrough-ssh-')
+            logger.info(f"Opening SSH connection to {self.destination}")
+            subprocess.run(
+                self._base_args() + ['-o', 'ControlMaster=yes', '-o', 'ControlPersist=yes', '-f', '-N',
+                                     self.destination],
+                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+
+    def close(self):
+        """Stops the control master."""
+        with self._lock:
+            if not self._control_dir:
+                return
+            subprocess.run(self._base_args() + ['-O', 'exit', self.destination],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+            self._control_dir = None
+
+    def run(self, command, timeout=None, input=None, shell=True):
+        """Runs a command through the remote shell, raising CalledProcessError on failure."""
+        if not self._control_dir:
+            self.open()
+        return subprocess.run(self._base_args() + [self.destination, '--', command], check=True,
+                              input=input, timeout=timeout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def stream(self, command, timeout=None, on_line=None, tail_lines=DEFAULT_TAIL_LINES):
+        """Runs a remote command, streaming output lines; a timeout kills the local ssh client's group."""
+        if not self._control_dir:
+            self.open()
+        return stream_process(self._base_args() + [self.destination, '--', command], command=command,
+                              timeout=timeout, on_line=on_line, tail_lines=tail_lines)
+
+    def read_file(self, path):
+        try:
+            return self.run(f"cat -- {shlex.quote(path)}").stdout.decode()
+        except subprocess.CalledProcessError as e:
+            if b'No such file' in (e.stderr or b''):
+                raise FileNotFoundError(path)
+            raise OSError(f"Failed to read {self.host}:{path}: {e.stderr.decode().strip()}")
+
+    def read_bytes(self, path):
+        try:
+            return self.run(f"cat -- {shlex.quote(path)}").stdout
+        except subprocess.CalledProcessError as e:
+            if b'No such file' in (e.stderr or b''):
+                raise FileNotFoundError(path)
+            raise OSError(f"Failed to read {self.host}:{path}: {e.stderr.decode().strip()}")
+
+    def write_file(self, path, content):
+        try:
+            self.run(f"cat > {shlex.quote(path)}", input=content.encode())
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"Failed to write {self.host}:{path}: {e.stderr.decode().strip()}")
+
+    def replace_file(self, path, content):
+        """Atomically replaces a remote file through a synced temp file and mv."""
+        quoted = shlex.quote(path)
+        tmp = shlex.quote(f"{path}.gpu-passthrough.tmp")
+        try:
+            self.run(f"cat > {tmp} && (chmod --reference={quoted} {tmp} 2>/dev/null || true) && sync {tmp} "
+                     f"&& mv -f {tmp} {quoted}", input=content.encode())
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"Failed to write {self.host}:{path}: {e.stderr.decode().strip()}")
+
+    def copy_file(self, source, destination):
+        try:
+            self.run(f"cp -- {shlex.quote(source)} {shlex.quote(destination)}")
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"Failed to copy {self.host}:{source}: {e.stderr.decode().strip()}")
+
+    def remove_file(self, path):
+        try:
+            self.run(f"rm -- {shlex.quote(path)}")
+        except subprocess.CalledProcessError as e:
+            if b'No such file' in (e.stderr or b''):
+                raise FileNotFoundError(path)
+            raise OSError(f"Failed to remove {self.host}:{path}: {e.stderr.decode().strip()}")
+
+    def exists(self, path):
+        try:
+            self.run(f"test -e {shlex.quote(path)}")
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def makedirs(self, path):
+        try:
+            self.run(f"mkdir -p -- {shlex.quote(path)}")
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"Failed to create {self.host}:{path}: {e.stderr.decode().strip()}")
+
+    def listdir(self, path):
+        try:
+            output = self.run(f"ls -1A -- {shlex.quote(path)}").stdout.decode()
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"Failed to list {self.host}:{path}: {e.stderr.decode().strip()}")
+        return [entry for entry in output.split('\n') if entry]
+
+
+class FakeTransport:
+    """In-process transport backed by a dict of files and canned command output."""
+    is_local = False
+
+    def __init__(self, host='fake', files=None, commands=None):
+        self.host = host
+        self.files = dict(files or {})
+        self.commands = dict(commands or {})
+        self.executed = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, command, timeout=None, input=None, shell=True):
+        """Returns the canned (returncode, stdout, stderr) for a command; unknown commands succeed silently."""
+        with self._lock:
+            self.executed.append(command)
+        returncode, stdout, stderr = self.commands.get(command, (0, '', ''))
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command, stdout.encode(), stderr.encode())
+        return subprocess.CompletedProcess(command, returncode, stdout.encode(), stderr.encode())
+
+    def stream(self, command, timeout=None, on_line=None, tail_lines=DEFAULT_TAIL_LINES):
+        """Replays the canned output for a command line by line."""
+        with self._lock:
+            self.executed.append(command)
+        returncode, stdout, stderr = self.commands.get(command, (0, '', ''))
+        tails = {}
+        for name, output in (('stdout', stdout), ('stderr', stderr)):
+            lines = output.splitlines()
+            if on_line:
+                for line in lines:
+                    on_line(name, line)
+            tails[name] = lines[-tail_lines:]
+        return CommandResult(command, returncode, 0.0, tails['stdout'], tails['stderr'],
+                             len(stdout.encode()) + len(stderr.encode()))
+
+    def read_file(self, path):
+        with self._lock:
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            return self.files[path]
+
+    def read_bytes(self, path):
+        content = self.read_file(path)
+        return content if isinstance(content, bytes) else content.encode()
+
+    def write_file(self, path, content):
+        with self._lock:
+            self.files[path] = content
+
+    def replace_file(self, path, content):
+        self.write_file(path, content)
+
+    def copy_file(self, source, destination):
+        self.write_file(destination, self.read_file(source))
+
+    def remove_file(self, path):
+        with self._lock:
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            del self.files[path]
+
+    def exists(self, path):
+        with self._lock:
+            prefix = path.rstrip('/') + '/'
+            return path in self.files or any(name.startswith(prefix) for name in self.files)
+
+    def makedirs(self, path):
+        pass
+
+    def listdir(self, path):
+        with self._lock:
+            prefix = path.rstrip('/') + '/'
+            entries = {name[len(prefix):].split('/', 1)[0] for name in self.files if name.startswith(prefix)}
+        if not entries:
+            raise FileNotFoundError(path)
+        return sorted(entries)
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from src.boot_cache import BOOT_ID_PATH, BootStatusCache
+from src.bootloader import DEFAULT_STATUS_PATH, BootloaderDetector
+from src.iommu_status import IommuDetector
+from src.transport import FakeTransport
+
+
+class BootStatusCacheTest(unittest.TestCase):
+    def test_result_is_reused_until_reboot(self):
+        transport = FakeTransport(files={BOOT_ID_PATH: 'boot-1\n'})
+        cache = BootStatusCache(transport, '/var/cache/test.json', 'test')
+        calls = []
+
+        def probe():
+            calls.append(1)
+            return {'value': len(calls)}
+
+        self.assertEqual(cache.get(probe), {'value': 1})
+        self.assertEqual(cache.get(probe), {'value': 1})
+        transport.write_file(BOOT_ID_PATH, 'boot-2\n')
+        self.assertEqual(cache.get(probe), {'value': 2})
+        self.assertEqual(cache.get(probe, refresh=True), {'value': 3})
+
+    def test_unreadable_entry_is_a_miss(self):
+        transport = FakeTransport(files={BOOT_ID_PATH: 'boot-1\n', '/var/cache/test.json': '{not json'})
+        cache = BootStatusCache(transport, '/var/cache/test.json', 'test')
+        self.assertEqual(cache.get(lambda: 'probed'), 'probed')
+        self.assertEqual(json.loads(transport.files['/var/cache/test.json'])['status'], 'probed')
+
+    def test_detectors_share_the_cache_format(self):
+        transport = FakeTransport(files={BOOT_ID_PATH: 'boot-1\n'},
+                                  commands={'dmesg': (0, 'AMD-Vi: Found IOMMU\n', '')})
+        self.assertEqual(BootloaderDetector(transport).detect(), 'grub-bios')
+        entry = json.loads(transport.files[DEFAULT_STATUS_PATH])
+        self.assertEqual((entry['boot_id'], entry['status']['bootloader']), ('boot-1', 'grub-bios'))
+
+        status = IommuDetector(transport).detect()
+        transport.commands['dmesg'] = (0, '', '')
+        self.assertEqual(IommuDetector(transport).detect().driver, status.driver)
+        self.assertEqual(status.driver, 'amd-vi')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import unittest
+
+from src.change_journal import ChangeJournal
+from src.configuration_error import ConfigurationError
+from src.file_edit import FileEditor
+from src.transport import FakeTransport
+
+JOURNAL_DIR = '/var/lib/gpu-passthrough/journal'
+
+
+class ChangeJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport(files={'/etc/default/grub': 'GRUB_CMDLINE_LINUX_DEFAULT="quiet"\n'})
+        self.journal = ChangeJournal(self.transport, directory=JOURNAL_DIR)
+
+    def modify(self):
+        self.journal.begin()
+        editor = FileEditor(self.transport, journal=self.journal)
+        editor.add_key_words('/etc/default/grub', 'GRUB_CMDLINE_LINUX_DEFAULT', ['intel_iommu=on'])
+        editor.ensure_line('/etc/modprobe.d/vfio.conf', 'options vfio-pci ids=10de:1b80')
+        editor.apply()
+
+    def test_snapshot_requires_a_run(self):
+        with self.assertRaises(ConfigurationError):
+            self.journal.snapshot('/etc/default/grub')
+
+    def test_snapshot_is_written_ahead_of_the_change(self):
+        self.modify()
+        record = self.journal.open_runs()[0]
+        self.assertEqual([entry['path'] for entry in record['entries']],
+                         ['/etc/default/grub', '/etc/modprobe.d/vfio.conf'])
+        existing, created = record['entries']
+        self.assertTrue(existing['existed'])
+        self.assertFalse(created['existed'])
+        self.assertEqual(self.transport.files[self.journal._object_path(existing['object'])],
+                         'GRUB_CMDLINE_LINUX_DEFAULT="quiet"\n')
+
+    def test_rollback_restores_and_removes_files(self):
+        self.modify()
+        self.assertEqual(self.journal.rollback(), ['/etc/modprobe.d/vfio.conf', '/etc/default/grub'])
+        self.assertEqual(self.transport.files['/etc/default/grub'], 'GRUB_CMDLINE_LINUX_DEFAULT="quiet"\n')
+        self.assertNotIn('/etc/modprobe.d/vfio.conf', self.transport.files)
+        self.assertEqual([record['state'] for record in self.journal.runs()], ['rolled_back'])
+        self.assertIsNone(self.journal.last_run())
+
+    def test_interrupted_run_is_recovered(self):
+        self.modify()
+        # A new process finds the run still open
+        journal = ChangeJournal(self.transport, directory=JOURNAL_DIR)
+        open_runs = journal.open_runs()
+        self.assertEqual(len(open_runs), 1)
+        journal.rollback(open_runs[0])
+        self.assertEqual(journal.open_runs(), [])
+        self.assertEqual(self.transport.files['/etc/default/grub'], 'GRUB_CMDLINE_LINUX_DEFAULT="quiet"\n')
+        self.assertNotIn('/etc/modprobe.d/vfio.conf', self.transport.files)
+
+    def test_committed_run_is_not_recovered(self):
+        self.modify()
+        self.journal.commit()
+        self.assertEqual(self.journal.open_runs(), [])
+        record = self.journal.last_run()
+        self.assertEqual(record['state'], 'committed')
+        run_path = f"{JOURNAL_DIR}/runs/{record['run_id']}.json"
+        self.assertEqual(json.loads(self.transport.files[run_path])['state'], 'committed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+from src.check_plan import CheckContext, CheckPlan, GRUB_DEFAULT_PATH
+from src.check_runner import CheckRunner
+from src.configuration_error import ConfigurationError
+from src.logger import LOGGER_NAME
+from src.transport import FakeTransport, LocalTransport
+
+
+def condition(kind, **check):
+    return {'description': f"Check {kind}", 'failure_message': f"{kind} failed.", 'check': dict(check, kind=kind)}
+
+
+def evaluate(entry, transport):
+    check, = CheckPlan.compile([entry])
+    return check.evaluate(CheckContext(transport=transport))
+
+
+class CompileTest(unittest.TestCase):
+    def test_unknown_kind(self):
+        with self.assertRaisesRegex(ConfigurationError, "Unknown check kind 'grep'"):
+            CheckPlan.compile([condition('grep', path='/etc/hosts')])
+
+    def test_missing_field(self):
+        with self.assertRaisesRegex(ConfigurationError, "missing field 'lines'"):
+            CheckPlan.compile([condition('file_contains_line', path='/etc/modules')])
+
+    def test_entries_without_a_check_are_shell_checks(self):
+        plan = CheckPlan.compile([
+            {'description': 'root', 'command': 'id -u', 'expected_output': '0', 'failure_message': 'not root'},
+            condition('file_contains', path='/etc/modules', patterns=['vfio']),
+            condition('kernel_cmdline', parameters=['iommu=pt']),
+        ])
+        self.assertEqual([check.kind for check in plan], ['shell', 'file_contains', 'kernel_cmdline'])
+        self.assertEqual(plan.paths(), ['/etc/default/grub', '/etc/kernel/cmdline', '/etc/modules'])
+
+
+class EvaluateTest(unittest.TestCase):
+    def test_file_contains_line(self):
+        entry = condition('file_contains_line', path='/etc/modules', lines=['vfio', 'vfio_pci'])
+        self.assertEqual(evaluate(entry, FakeTransport(files={'/etc/modules': ' vfio\nvfio_pci \n'})), (True, None))
+        self.assertEqual(evaluate(entry, FakeTransport(files={'/etc/modules': 'vfio\n'})),
+                         (False, 'file_contains_line failed.'))
+        self.assertEqual(evaluate(entry, FakeTransport()), (False, 'file_contains_line failed.'))
+
+    def test_file_contains(self):
+        entry = condition('file_contains', path='/etc/modprobe.d/vfio.conf', patterns=['ids='])
+        files = {'/etc/modprobe.d/vfio.conf': 'options vfio-pci ids=10de:1b80\n'}
+        self.assertTrue(evaluate(entry, FakeTransport(files=files))[0])
+        self.assertFalse(evaluate(entry, FakeTransport(files={'/etc/modprobe.d/vfio.conf': ''}))[0])
+
+    def test_path_exists(self):
+        entry = condition('path_exists', path='/etc/pve')
+        self.assertTrue(evaluate(entry, FakeTransport(files={'/etc/pve/storage.cfg': ''}))[0])
+        self.assertFalse(evaluate(entry, FakeTransport())[0])
+
+    def test_module_loaded(self):
+        entry = condition('module_loaded', modules=['vfio', 'kvm'])
+        modules = {'/proc/modules': 'vfio 45056 0 - Live 0x0\n'}
+        self.assertFalse(evaluate(entry, FakeTransport(files=modules))[0])
+        self.assertTrue(evaluate(entry, FakeTransport(files=dict(modules, **{'/sys/module/kvm/refcnt': '0'})))[0])
+
+    def test_command_output_contains(self):
+        entry = condition('command_output_contains', command='lspci', filter=['vga'], contains='NVIDIA',
+                          optional_contains=['AMD'])
+        output = '00:02.0 Host bridge: NVIDIA\n01:00.0 VGA compatible controller: AMD Navi\n'
+        self.assertTrue(evaluate(entry, FakeTransport(commands={'lspci': (0, output, '')}))[0])
+        self.assertFalse(evaluate(entry, FakeTransport(commands={'lspci': (0, '00:02.0 Host bridge: NVIDIA', '')}))[0])
+        self.assertEqual(evaluate(entry, FakeTransport(commands={'lspci': (1, '', 'lspci: not found')})),
+                         (False, 'lspci: not found'))
+
+    def test_iommu_enabled(self):
+        entry = condition('iommu_enabled', interrupt_remapping=True)
+        transport = FakeTransport(files={'/sys/kernel/iommu_groups/0/type': 'DMA'},
+                                  commands={'dmesg': (0, 'AMD-Vi: Interrupt remapping enabled\n', '')})
+        self.assertEqual(evaluate(entry, transport), (True, None))
+        self.assertFalse(evaluate(entry, FakeTransport(commands={'dmesg': (0, '', '')}))[0])
+
+    def test_kernel_cmdline(self):
+        entry = condition('kernel_cmdline', parameters=['iommu=pt'])
+        grub = {GRUB_DEFAULT_PATH: 'GRUB_CMDLINE_LINUX_DEFAULT="quiet iommu=pt"\n'}
+        self.assertEqual(evaluate(entry, FakeTransport(files=grub)), (True, None))
+        self.assertEqual(evaluate(entry, FakeTransport()),
+                         (False, 'kernel_cmdline failed. (/etc/default/grub not found)'))
+
+
+class UnreadableFileTest(unittest.TestCase):
+    def test_unreadable_file_fails_only_its_check(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, 'etc', 'modules'))
+            os.makedirs(os.path.join(root, 'etc', 'pve'))
+            plan = CheckPlan.compile([
+                condition('file_contains_line', path='/etc/modules', lines=['vfio']),
+                condition('path_exists', path='/etc/pve'),
+            ])
+            with self.assertLogs(LOGGER_NAME, 'WARNING'):
+                results = CheckRunner(transport=LocalTransport(root=root)).run(plan)
+        self.assertEqual([result.met for result in results], [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
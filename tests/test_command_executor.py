@@ -0,0 +1,30 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from src.command_executor import CommandExecutor
+from src.transport import FakeTransport
+
+
+class CommandExecutorTest(unittest.TestCase):
+    def test_deadline_starts_with_the_first_command(self):
+        clock = mock.Mock(return_value=100.0)
+        with mock.patch('src.command_executor.time.monotonic', clock):
+            executor = CommandExecutor(FakeTransport(), command_timeout=60, total_timeout=30)
+            clock.return_value = 500.0
+            self.assertEqual(executor._timeout(None), 30)
+            clock.return_value = 520.0
+            self.assertEqual(executor._timeout(None), 10)
+            clock.return_value = 531.0
+            with self.assertRaises(subprocess.TimeoutExpired):
+                executor.execute('update-grub')
+
+    def test_no_budget_uses_the_command_timeout(self):
+        executor = CommandExecutor(FakeTransport(), command_timeout=60)
+        self.assertEqual(executor._timeout(None), 60)
+        self.assertEqual(executor._timeout(5), 5)
+        self.assertIsNone(executor.deadline)
+
+
+if __name__ == '__main__':
+    unittest.main()
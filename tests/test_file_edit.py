@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.configuration_error import ConfigurationError
+from src.file_edit import FileEditor, edit_from_dict
+from src.transport import FakeTransport, LocalTransport
+
+GRUB = '/etc/default/grub'
+VFIO = '/etc/modprobe.d/vfio.conf'
+
+
+class FileEditorTest(unittest.TestCase):
+    def test_reapplying_changes_nothing(self):
+        transport = FakeTransport(files={GRUB: 'GRUB_DEFAULT=0\nGRUB_CMDLINE_LINUX_DEFAULT="quiet"\n'})
+        for expected in ([GRUB, VFIO, '/etc/kernel/cmdline'], []):
+            editor = FileEditor(transport)
+            editor.add_key_words(GRUB, 'GRUB_CMDLINE_LINUX_DEFAULT', ['quiet', 'iommu=pt'], replace_keys=True)
+            editor.ensure_line(VFIO, 'options kvm ignore_msrs=1')
+            editor.set_line(VFIO, 'options vfio-pci ', 'options vfio-pci ids=10de:1b80')
+            editor.add_words('/etc/kernel/cmdline', ['iommu=pt'])
+            self.assertEqual(editor.apply(), expected)
+        self.assertEqual(transport.files[VFIO], 'options kvm ignore_msrs=1\noptions vfio-pci ids=10de:1b80\n')
+
+    def test_set_line_replaces_an_existing_line(self):
+        transport = FakeTransport(files={VFIO: 'options vfio-pci ids=1002:67df\n# keep\noptions vfio-pci ids=dupe\n'})
+        editor = FileEditor(transport)
+        editor.set_line(VFIO, 'options vfio-pci ', 'options vfio-pci ids=10de:1b80,10de:10f0')
+        editor.apply()
+        self.assertEqual(transport.files[VFIO], 'options vfio-pci ids=10de:1b80,10de:10f0\n# keep\n')
+
+    def test_add_key_words_merges_into_the_existing_value(self):
+        transport = FakeTransport(files={GRUB: 'GRUB_CMDLINE_LINUX_DEFAULT="quiet iommu=soft splash"\n'})
+        editor = FileEditor(transport)
+        editor.add_key_words(GRUB, 'GRUB_CMDLINE_LINUX_DEFAULT', ['quiet', 'amd_iommu=on', 'iommu=pt'],
+                             replace_keys=True)
+        editor.apply()
+        self.assertEqual(transport.files[GRUB], 'GRUB_CMDLINE_LINUX_DEFAULT="quiet splash amd_iommu=on iommu=pt"\n')
+
+    def test_edits_round_trip_through_their_dicts(self):
+        editor = FileEditor(FakeTransport())
+        editor.add_key_words(GRUB, 'GRUB_CMDLINE_LINUX_DEFAULT', ['iommu=pt'])
+        editor.set_line(VFIO, 'options vfio-pci ', 'options vfio-pci ids=10de:1b80')
+        loaded = FileEditor(FakeTransport())
+        loaded.load(editor.to_dict())
+        self.assertEqual(loaded.to_dict(), editor.to_dict())
+        with self.assertRaises(ConfigurationError):
+            edit_from_dict({'kind': 'remove_line', 'line': 'x'})
+
+    def test_failed_write_keeps_the_original_file(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, 'etc', 'default'))
+            path = os.path.join(root, 'etc', 'default', 'grub')
+            with open(path, 'w') as f:
+                f.write('GRUB_CMDLINE_LINUX_DEFAULT="quiet"\n')
+            editor = FileEditor(LocalTransport(root=root))
+            editor.add_key_words(GRUB, 'GRUB_CMDLINE_LINUX_DEFAULT', ['iommu=pt'])
+            with mock.patch('src.transport.os.fsync', side_effect=OSError(28, 'No space left on device')):
+                with self.assertRaises(ConfigurationError):
+                    editor.apply()
+            with open(path) as f:
+                self.assertEqual(f.read(), 'GRUB_CMDLINE_LINUX_DEFAULT="quiet"\n')
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['grub'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from src.gpu_audit import GpuAudit, format_affinity_mask, interrupt_capabilities
+from src.transport import FakeTransport
+
+DEVICE = '/sys/bus/pci/devices/0000:41:00.0'
+
+
+def host(**extra):
+    files = {
+        '/sys/devices/system/cpu/online': '0-7\n',
+        '/sys/devices/system/node/node0/cpulist': '0-3\n',
+        '/sys/devices/system/node/node1/cpulist': '4-7\n',
+        f'{DEVICE}/numa_node': '1\n',
+        f'{DEVICE}/uevent': 'DRIVER=vfio-pci\nPCI_SLOT_NAME=0000:41:00.0\n',
+        f'{DEVICE}/current_link_speed': '2.5 GT/s PCIe\n',
+        f'{DEVICE}/max_link_speed': '16.0 GT/s PCIe\n',
+        f'{DEVICE}/current_link_width': '16\n',
+        f'{DEVICE}/max_link_width': '16\n',
+        f'{DEVICE}/irq': '40\n',
+        '/proc/irq/40/smp_affinity_list': '0-7\n',
+    }
+    files.update(extra)
+    return FakeTransport(files=files)
+
+
+class GpuAuditTest(unittest.TestCase):
+    def test_idle_function_is_not_failed(self):
+        transport = host()
+        report = GpuAudit(transport, fix_irq_affinity=True).audit(['0000:41:00.0'])
+        function = report.functions[0]
+        self.assertTrue(report.ok)
+        self.assertEqual((function.irqs, function.interrupt_mode), ([], None))
+        self.assertEqual((function.issues, function.warnings), ([], ['link-speed']))
+        self.assertNotIn('/proc/irq/40/smp_affinity', transport.files)
+
+    def test_active_function_is_audited_and_fixed(self):
+        transport = host(**{f'{DEVICE}/msi_irqs/120': 'msix\n', '/proc/irq/120/smp_affinity_list': '0-7\n'})
+        report = GpuAudit(transport).audit(['0000:41:00.0'])
+        self.assertEqual(report.functions[0].issues, ['link-speed', 'cross-node-irq'])
+        self.assertFalse(report.ok)
+
+        report = GpuAudit(transport, fix_irq_affinity=True).audit(['0000:41:00.0'])
+        self.assertEqual(transport.files['/proc/irq/120/smp_affinity'], '000000f0\n')
+        self.assertEqual(report.functions[0].issues, ['link-speed'])
+
+    def test_helpers(self):
+        self.assertEqual(format_affinity_mask(range(40)), '000000ff,ffffffff')
+        self.assertIsNone(interrupt_capabilities(bytes(64)))
+        self.assertEqual(interrupt_capabilities(bytes(256)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_host import build_host
+from src.hardware_cache import CACHE_VERSION, DEFAULT_CACHE_PATH, HardwareCache
+from src.transport import LocalTransport
+
+
+class HardwareCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        build_host(self.root, gpus=1, pci_functions=10)
+        self.cache = HardwareCache(LocalTransport(root=self.root))
+        self.path = os.path.join(self.root, DEFAULT_CACHE_PATH.lstrip('/'))
+
+    def test_snapshot_is_written_through_the_transport(self):
+        self.cache.store({'gpu': {'type': 'nvidia'}})
+        with open(self.path) as f:
+            entry = json.load(f)
+        self.assertEqual(entry['version'], CACHE_VERSION)
+        self.assertEqual(entry['boot_id'], self.cache.boot_id())
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['hardware.json'])
+        self.assertEqual(self.cache.load(), {'gpu': {'type': 'nvidia'}})
+
+    def test_missing_and_corrupted_snapshots_are_misses(self):
+        self.assertIsNone(self.cache.load())
+        self.cache.store({})
+        with open(self.path, 'w') as f:
+            f.write('{not json')
+        self.assertIsNone(self.cache.load())
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
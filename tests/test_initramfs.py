@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_host import KERNELS, build_host, stub_bin_dir
+from src.command_executor import CommandExecutor
+from src.configuration_error import ConfigurationError
+from src.initramfs import InitramfsBuilder, installed_kernels
+from src.regeneration import RegenerationTracker
+from src.transport import LocalTransport
+
+STATE_PATH = '/var/lib/gpu-passthrough/regeneration.json'
+
+
+class InitramfsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = build_host(directory.name)
+        self.calls = os.path.join(self.root, 'calls')
+        self.stub()
+        self.transport = LocalTransport(root=self.root, bin_dirs=[stub_bin_dir(self.root)])
+        self.tracker = RegenerationTracker(self.transport, state_path=STATE_PATH, max_workers=3)
+
+    def stub(self, failing=None):
+        """Installs an update-initramfs that records its kernel and fails for `failing`."""
+        path = os.path.join(stub_bin_dir(self.root), 'update-initramfs')
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\necho "$3" >> "{self.calls}"\n[ "$3" != "{failing}" ]\n')
+        os.chmod(path, 0o755)
+
+    def built(self):
+        """Returns and forgets the kernels rebuilt so far."""
+        if not os.path.exists(self.calls):
+            return []
+        with open(self.calls) as f:
+            versions = sorted(f.read().split())
+        os.unlink(self.calls)
+        return versions
+
+    def run_initramfs(self):
+        self.tracker.schedule('initramfs')
+        return self.tracker.run_step('initramfs', CommandExecutor(self.transport))
+
+    def test_installed_kernels_need_an_image(self):
+        os.unlink(os.path.join(self.root, f'boot/vmlinuz-{KERNELS[0]}'))
+        os.makedirs(os.path.join(self.root, 'lib/modules/6.10.1-1-pve'))
+        os.makedirs(os.path.join(self.root, 'lib/modules/6.9.0-1-pve'))
+        for version in ('6.10.1-1-pve', '6.9.0-1-pve'):
+            open(os.path.join(self.root, f'boot/vmlinuz-{version}'), 'w').close()
+        self.assertEqual(installed_kernels(self.transport), KERNELS[1:] + ['6.9.0-1-pve', '6.10.1-1-pve'])
+
+    def test_missing_image_is_stale(self):
+        os.unlink(os.path.join(self.root, f'boot/initrd.img-{KERNELS[1]}'))
+        builder = InitramfsBuilder(self.transport, 'update-initramfs -u -k {kernel}')
+        self.assertEqual(builder.stale(lambda version: True), [KERNELS[1]])
+
+    def test_failed_kernel_raises_and_is_retried_alone(self):
+        self.stub(failing=KERNELS[1])
+        with self.assertRaisesRegex(ConfigurationError, f'failed for kernel {KERNELS[1]}'):
+            self.run_initramfs()
+        self.assertEqual(self.built(), sorted(KERNELS))
+        with open(os.path.join(self.root, STATE_PATH.lstrip('/'))) as f:
+            self.assertEqual(sorted(json.load(f)), sorted(f'initramfs:{version}' for version in KERNELS
+                                                          if version != KERNELS[1]))
+
+        self.stub()
+        self.assertTrue(self.run_initramfs())
+        self.assertEqual(self.built(), [KERNELS[1]])
+        self.assertFalse(self.run_initramfs())
+        self.assertEqual(self.built(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.synthetic_host import build_host, stub_bin_dir
+from src.iommu_status import IommuDetector
+from src.transport import LocalTransport
+
+
+class KernelLogFallbackTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        build_host(self.root)
+        os.makedirs(os.path.join(self.root, 'dev'), exist_ok=True)
+        self.transport = LocalTransport(root=self.root, bin_dirs=[stub_bin_dir(self.root)])
+
+    def test_unopenable_kmsg_falls_back_to_dmesg(self):
+        with open(os.path.join(self.root, 'dev', 'kmsg'), 'w') as f:
+            f.write('6,1,0,-;AMD-Vi: Found IOMMU\n')
+        with mock.patch('src.iommu_status.os.open', side_effect=PermissionError(1, 'Operation not permitted')):
+            status = IommuDetector(self.transport).probe()
+        self.assertEqual((status.source, status.driver), ('dmesg', 'amd-vi'))
+
+    def test_unreadable_kmsg_falls_back_to_dmesg(self):
+        os.makedirs(os.path.join(self.root, 'dev', 'kmsg'))
+        status = IommuDetector(self.transport).probe()
+        self.assertEqual((status.source, status.driver), ('dmesg', 'amd-vi'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_host import build_host
+from src.configuration_error import ConfigurationError
+from src.numa_layout import NumaTopology, device_locality, format_cpulist, parse_cpulist, plan_for_gpus, plan_vms
+from src.transport import LocalTransport
+
+GPUS = ['0000:01:00.0', '0000:02:00.0', '0000:03:00.0']
+
+
+class CpulistTest(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(parse_cpulist('0-3,8,10-11\n'), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpulist(''), [])
+        self.assertEqual(format_cpulist([11, 0, 1, 2, 3, 8, 10, 3]), '0-3,8,10-11')
+
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Two nodes of 8 cores x 2 threads: node 0 has CPUs 0-7,16-23 and node 1 has CPUs 8-15,24-31
+        self.root = build_host(directory.name, gpus=3)
+        self.transport = LocalTransport(root=self.root)
+        self.topology = NumaTopology.read(self.transport)
+
+    def test_topology(self):
+        self.assertEqual(self.topology.to_dict()['nodes'], {
+            '0': {'cpus': '0-7,16-23', 'memory_mib': 65536},
+            '1': {'cpus': '8-15,24-31', 'memory_mib': 65536},
+        })
+        self.assertEqual(self.topology.node_cores(1)[0], (8, 24))
+        self.assertTrue(self.topology.gigantic_pages)
+
+    def test_vms_get_whole_local_cores(self):
+        plan = plan_for_gpus(self.transport, GPUS, 16384)
+        self.assertEqual({vm.gpu: (vm.node, format_cpulist(vm.cpus)) for vm in plan.vms}, {
+            '0000:01:00.0': (0, '1-3,17-19'),
+            '0000:02:00.0': (1, '9-15,25-31'),
+            '0000:03:00.0': (0, '4-6,20-22'),
+        })
+        self.assertEqual(plan.hugepage_size, '1G')
+        self.assertEqual(plan.kernel_parameters(),
+                         ['default_hugepagesz=1G', 'hugepagesz=1G', 'hugepages=0:32,1:16'])
+        vm = next(vm for vm in plan.vms if vm.node == 1)
+        self.assertIn('numa0: cpus=0-13,hostnodes=1,memory=16384,policy=bind', vm.proxmox_config())
+
+    def test_core_cap_and_small_pages(self):
+        nodes = {gpu: device_locality(self.transport, gpu, self.topology) for gpu in GPUS[:2]}
+        plan = plan_vms(self.topology, GPUS[:2], nodes, 1000, cores=2)
+        self.assertEqual([format_cpulist(vm.cpus) for vm in plan.vms], ['1-2,17-18', '9-10,25-26'])
+        self.assertEqual((plan.hugepage_size, plan.vms[0].memory_mib, plan.vms[0].pages), ('2M', 1000, 500))
+
+    def test_locality_falls_back_to_local_cpus(self):
+        os.unlink(os.path.join(self.root, 'sys/bus/pci/devices/0000:02:00.0/numa_node'))
+        self.assertEqual(device_locality(self.transport, '0000:02:00.0', self.topology), 1)
+
+    def test_node_too_small(self):
+        with self.assertRaisesRegex(ConfigurationError, 'NUMA node 0 has 63488 MiB'):
+            plan_for_gpus(self.transport, GPUS, 40960)
+        with self.assertRaisesRegex(ConfigurationError, 'NUMA node 0 has 2 free cores for 3 passthrough VMs'):
+            plan_vms(self.topology, GPUS, {gpu: 0 for gpu in GPUS}, 1024, reserved_cores=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_host import build_host
+from src.pci_ids import DEFAULT_INDEX_PATH, PciIds, build_index, load_pci_ids, parse_pci_ids
+
+PCI_IDS = """\
+# comment
+10de  NVIDIA Corporation
+\t1aef  GA102 High Definition Audio Controller
+\t2204  GA102 [GeForce RTX 3090]
+\t\t10de 147d  GeForce RTX 3090 Founders Edition
+1002  Advanced Micro Devices, Inc. [AMD/ATI]
+\t73bf  Navi 21 [Radeon RX 6800/6800 XT / 6900 XT]
+ffff  Illegal Vendor ID
+
+C 03  Display controller
+\t00  VGA compatible controller
+"""
+
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.vendors = parse_pci_ids(PCI_IDS.splitlines())
+        self.index = PciIds(build_index(self.vendors))
+
+    def test_parse_skips_subsystems_and_classes(self):
+        self.assertEqual(sorted(self.vendors), [0x1002, 0x10de, 0xffff])
+        self.assertEqual(self.vendors[0x10de][1], {0x1aef: 'GA102 High Definition Audio Controller',
+                                                   0x2204: 'GA102 [GeForce RTX 3090]'})
+        self.assertEqual(self.vendors[0xffff], ('Illegal Vendor ID', {}))
+
+    def test_lookup(self):
+        self.assertEqual(self.index.vendor('10de'), 'NVIDIA Corporation')
+        self.assertEqual(self.index.device('10de', '2204'), 'GA102 [GeForce RTX 3090]')
+        self.assertEqual(self.index.describe('1002', '73bf'),
+                         'Advanced Micro Devices, Inc. [AMD/ATI] Navi 21 [Radeon RX 6800/6800 XT / 6900 XT]')
+        self.assertEqual(self.index.describe('10de', '0001'), 'NVIDIA Corporation Device 0001')
+        self.assertIsNone(self.index.device('ffff', '0000'))
+        self.assertIsNone(self.index.describe('1234', '0000'))
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            PciIds(b'\0' * 64)
+
+
+class LoadTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = build_host(directory.name)
+        self.source = os.path.join(self.root, 'usr/share/misc/pci.ids')
+
+    def test_index_is_built_once_and_rebuilt_when_the_source_changes(self):
+        index = load_pci_ids(self.root)
+        self.addCleanup(index.close)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, DEFAULT_INDEX_PATH.lstrip('/'))))
+        self.assertEqual(index.describe('10de', '2204'), 'NVIDIA Corporation GA102 [GeForce RTX 3090]')
+        self.assertIs(load_pci_ids(self.root), index)
+
+        with open(self.source) as f:
+            content = f.read()
+        with open(self.source, 'w') as f:
+            f.write(content.replace('10de  NVIDIA Corporation', '10de  NVIDIA Corp.'))
+        stat = os.stat(self.source)
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        rebuilt = load_pci_ids(self.root)
+        self.addCleanup(rebuilt.close)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.vendor('10de'), 'NVIDIA Corp.')
+
+    def test_missing_database(self):
+        os.unlink(self.source)
+        self.assertIsNone(load_pci_ids(self.root))
+
+
+if __name__ == '__main__':
+    unittest.main()
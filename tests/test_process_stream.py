@@ -0,0 +1,25 @@
+import sys
+import unittest
+
+from src.process_stream import MAX_LINE_BYTES, stream_process
+
+
+class StreamProcessTest(unittest.TestCase):
+    def test_output_without_newlines_is_split(self):
+        size = 5 * MAX_LINE_BYTES + 10
+        script = f"import sys; sys.stdout.write('x' * {size}); sys.stdout.write('\\nend\\n')"
+        lines = []
+        result = stream_process([sys.executable, '-c', script], on_line=lambda name, line: lines.append(line))
+        self.assertTrue(result.ok)
+        self.assertEqual(result.output_bytes, size + 5)
+        self.assertTrue(all(len(line) <= MAX_LINE_BYTES for line in lines))
+        self.assertEqual(''.join(lines[:-1]), 'x' * size)
+        self.assertEqual(lines[-1], 'end')
+
+    def test_tail_keeps_the_last_lines(self):
+        result = stream_process([sys.executable, '-c', "print('\\n'.join(map(str, range(10))))"], tail_lines=3)
+        self.assertEqual(result.stdout_tail, ['7', '8', '9'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+
+from benchmarks.synthetic_host import build_host, stub_bin_dir
+from src.logger import LOGGER_NAME
+from src.system_configurator import SystemConfigurator
+from src.transport import LocalTransport
+
+
+class RemediationGraphTest(unittest.TestCase):
+    def configure(self, bootloader):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = directory.name
+        build_host(root, gpus=1, pci_functions=20, bootloader=bootloader)
+        transport = LocalTransport(root=root, bin_dirs=[stub_bin_dir(root)])
+        configurator = SystemConfigurator(dry_run=True, transport=transport)
+        configurator.configure_system()
+        return configurator
+
+    def test_boot_refresh_waits_for_initramfs(self):
+        configurator = self.configure('systemd-boot')
+        dependencies = configurator.graph.dependencies()
+        self.assertIn('initramfs', dependencies['boot-refresh'])
+        self.assertIn('kernel-cmdline', dependencies['boot-refresh'])
+        order = configurator.graph.order()
+        self.assertLess(order.index('initramfs'), order.index('boot-refresh'))
+        self.assertTrue(any(line.startswith('Step boot-refresh (sink)') and 'initramfs' in line
+                            for line in configurator.graph.describe()))
+
+    def test_dry_run_lists_commands_in_step_order(self):
+        with self.assertLogs(LOGGER_NAME, 'INFO') as logs:
+            configurator = self.configure('systemd-boot')
+        commands = [record.getMessage() for record in logs.records if record.getMessage().startswith('Command [')]
+        steps = [command.split(']', 1)[0][len('Command ['):] for command in commands]
+        self.assertEqual(steps, sorted(steps, key=configurator.graph.order().index))
+        self.assertIn('Command [boot-refresh]: proxmox-boot-tool refresh', commands)
+        self.assertLess(steps.index('initramfs'), steps.index('boot-refresh'))
+
+    def test_grub_host_has_no_boot_refresh(self):
+        configurator = self.configure('grub-bios')
+        self.assertNotIn('boot-refresh', configurator.graph.steps)
+        self.assertIn('grub-cmdline', configurator.graph.dependencies()['bootloader'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from src.tracing import Tracer
+
+
+class TracerTest(unittest.TestCase):
+    def test_buffer_is_bounded(self):
+        tracer = Tracer(max_spans=3)
+        for index in range(10):
+            with tracer.span(f'check-{index}', 'check'):
+                pass
+        self.assertEqual([span.name for span in tracer.spans], ['check-7', 'check-8', 'check-9'])
+        self.assertEqual(tracer.summary()['check'][0], 3)
+
+    def test_disabled_tracer_records_nothing(self):
+        tracer = Tracer()
+        with tracer.span('before', 'check'):
+            pass
+        tracer.disable()
+        with tracer.span('after', 'check') as span:
+            span.set(exit_code=0)
+        self.assertEqual(len(tracer.spans), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()